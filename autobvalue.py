@@ -1,10 +1,11 @@
-from library.curve_fitting_method import *
-from library.visualization import *
-from library.mag_of_completeness import *
+from library.curve_fitting_method import generate_autobvalue
+from library.visualization import plot_eq_distribution, plot_noncum_fmd, plot_bvalue
+from library.mag_of_completeness import fmd_details
+from library.catalog import load_catalog
 
 # reading catalog file
 file_name = 'catalogs/earthquakes.csv'
-catalog = pd.read_csv(file_name)
+catalog = load_catalog(file_name)
 
 # b-value parameters
 mc_method    = 'mbs'
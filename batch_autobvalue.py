@@ -0,0 +1,155 @@
+"""
+headless batch run of the autobvalue pipeline (fmd_details -> generate_autobvalue) over many regions.
+
+regions are either polygons read from a file (JSON or CSV, see library.selection.read_regions) or the nodes of
+a regular grid. results are written to CSV or Parquet as regions finish. nothing from matplotlib is imported,
+so it runs on nodes without a display.
+
+example:
+    python batch_autobvalue.py catalogs/earthquakes.csv --regions regions.json -o bvalues.csv
+    python batch_autobvalue.py catalogs/earthquakes.csv --grid 127 129 -4 -2 0.1 --nevents 300 -o bmap.parquet
+    python batch_autobvalue.py catalogs/earthquakes.csv --regions regions.json --time-col T --decluster gk -o b.csv
+"""
+
+import argparse
+import csv
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from library.catalog import load_catalog
+from library.selection import read_regions, select_region
+from library.decluster import decluster
+from library.mapping import build_index, grid_nodes, node_neighbours, bvalue_nodes_shared
+from library.parallel import share_array, release
+
+
+COLUMNS = ['region', 'x', 'y', 'nbev', 'mc', 'bvalue', 'unc']
+
+
+class ResultWriter:
+    """
+    writes result rows to a CSV or Parquet file as they arrive. Parquet needs pyarrow.
+    """
+
+    def __init__(self, file_name, flush_every=1000):
+        self.parquet = os.path.splitext(file_name)[1].lower() == '.parquet'
+        self.rows = []
+        self.flush_every = flush_every
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            self.pa = pa
+            self.schema = pa.schema([('region', pa.string()), ('x', pa.float64()), ('y', pa.float64()),
+                                     ('nbev', pa.int64())] + [(col, pa.float64()) for col in COLUMNS[4:]])
+            self.writer = pq.ParquetWriter(file_name, self.schema)
+        else:
+            self.fp = open(file_name, 'w', newline='')
+            self.writer = csv.writer(self.fp)
+            self.writer.writerow(COLUMNS)
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.flush_every or not self.parquet:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        if self.parquet:
+            cols = list(zip(*self.rows))
+            self.writer.write_table(self.pa.table([list(col) for col in cols], schema=self.schema))
+        else:
+            self.writer.writerows(self.rows)
+            self.fp.flush()
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        if self.parquet:
+            self.writer.close()
+        else:
+            self.fp.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="calculate Mc and b-value for many regions of a catalog")
+    parser.add_argument('catalog', help="catalog CSV file with X, Y, Z and M columns")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--regions', help="region polygons, JSON {name: [[x, y], ...]} or CSV with region,X,Y")
+    target.add_argument('--grid', nargs=5, type=float, metavar=('XMIN', 'XMAX', 'YMIN', 'YMAX', 'DX'),
+                        help="regular grid of nodes")
+    parser.add_argument('--nevents', type=int, help="number of nearest events of each grid node")
+    parser.add_argument('--radius', type=float, help="sampling radius of each grid node")
+    parser.add_argument('--time-col', help="column with event times, needed by --decluster")
+    parser.add_argument('--decluster', choices=['gk', 'nn'], help="keep only mainshocks, with Gardner-Knopoff "
+                                                                  "windows or nearest-neighbour distances")
+    parser.add_argument('--coor', default='lon/lat', choices=['lon/lat', 'utm'],
+                        help="coordinate system of X and Y for --decluster, utm in km")
+    parser.add_argument('--mag-dtype', default='float64', choices=['float64', 'float32', 'int16'],
+                        help="dtype the magnitudes are stored in, int16 holds tenths of magnitude units")
+    parser.add_argument('--mc-method', default='maxc', choices=['maxc', 'mbs', 'gft'])
+    parser.add_argument('--cv-method', default='b-value pois', choices=['b-value pois', 'b-value glin', 'b-value glog',
+                                                                             'b-value mle'])
+    parser.add_argument('--backend', default='numpy', choices=['batch', 'numpy', 'statsmodels'])
+    parser.add_argument('--mbin', type=float, default=0.1)
+    parser.add_argument('--nbsample', type=int, default=200)
+    parser.add_argument('--min-events', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--n-jobs', type=int, default=None, help="number of worker processes, all cores by default")
+    parser.add_argument('--chunk', type=int, default=64, help="number of grid nodes per task")
+    parser.add_argument('-o', '--output', required=True, help="output .csv or .parquet file")
+    args = parser.parse_args(argv)
+    if args.grid is not None and args.nevents is None and args.radius is None:
+        parser.error("--grid needs --nevents and/or --radius")
+    if args.decluster is not None and args.time_col is None:
+        parser.error("--decluster needs --time-col")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    catalog = load_catalog(args.catalog, time_col=args.time_col, dtypes={'M': np.dtype(args.mag_dtype)})
+    seed = np.random.SeedSequence(args.seed)
+    mask = None
+    if args.decluster is not None:
+        mask = decluster(catalog, args.decluster, args.time_col, args.coor)['mask']
+
+    # events of every task, selected once in this process
+    if args.regions is not None:
+        regions = read_regions(args.regions)
+        names = list(regions)
+        centers = [poly.mean(axis=0) for poly in regions.values()]
+        tasks = [[select_region(catalog, poly, mask)] for poly in regions.values()]
+    else:
+        xmin, xmax, ymin, ymax, dx = args.grid
+        nodes = grid_nodes((xmin, xmax), (ymin, ymax), dx)[0]
+        keep = np.arange(len(catalog['M'])) if mask is None else np.flatnonzero(mask)
+        tree = build_index({col: np.asarray(catalog[col])[keep] for col in ('X', 'Y')})
+        names = ['node%d' % i for i in range(len(nodes))]
+        centers = list(nodes)
+        tasks = [[keep[elem] for elem in node_neighbours(tree, nodes[i:i+args.chunk], args.nevents, args.radius)]
+                 for i in range(0, len(nodes), args.chunk)]
+    seeds = seed.spawn(len(names))
+
+    shm, spec = share_array(np.asarray(catalog['M']))
+    writer = ResultWriter(args.output)
+    try:
+        with ProcessPoolExecutor(args.n_jobs) as pool:
+            futures = {}
+            first = 0
+            for neighbours in tasks:
+                future = pool.submit(bvalue_nodes_shared, spec, neighbours, seeds[first:first+len(neighbours)],
+                                     args.mc_method, args.cv_method, args.mbin, args.nbsample, args.min_events,
+                                     True, args.backend)
+                futures[future] = first
+                first += len(neighbours)
+            for future in as_completed(futures):
+                for i, (bvalue, unc, mc, nbev) in enumerate(future.result(), futures[future]):
+                    writer.write([names[i], centers[i][0], centers[i][1], int(nbev), mc, bvalue, unc])
+    finally:
+        writer.close()
+        release(shm, unlink=True)
+
+
+if __name__ == '__main__':
+    main()
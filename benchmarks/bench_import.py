@@ -0,0 +1,67 @@
+"""
+benchmark of the import time of the library modules. every import runs in a fresh interpreter, and the heavy
+dependencies that each import loads are listed. the 'eager' line imports the dependencies that the computational
+core used to load at import time, for comparison.
+
+example:
+    python -m benchmarks.bench_import --repeat 5
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+
+MODULES = ['library.mag_of_completeness', 'library.curve_fitting_method', 'library.temporal', 'library.cache',
+           'library.catalog', 'library.mapping', 'library.visualization']
+HEAVY = ['pandas', 'scipy.stats', 'scipy.spatial', 'statsmodels.api', 'statsmodels.formula.api', 'matplotlib.pyplot']
+EAGER = 'import numpy, pandas, scipy.stats, statsmodels.api, statsmodels.formula.api'
+
+SCRIPT = """
+import sys, time, json
+import numpy
+t = time.perf_counter()
+%s
+dt = time.perf_counter() - t
+print(json.dumps([dt, [m for m in %r if m in sys.modules]]))
+"""
+
+
+def import_time(statement, repeat):
+    """
+    a function to time an import statement in fresh interpreters.
+
+    :param statement (str): import statement
+    :param repeat (int): number of interpreters
+    :return:
+    seconds (float): median import time. numpy is imported before the clock starts
+    loaded (list): heavy dependencies that were loaded by the statement
+    """
+
+    times = []
+    for i in range(repeat):
+        out = subprocess.run([sys.executable, '-c', SCRIPT % (statement, HEAVY)], capture_output=True, text=True,
+                             check=True)
+        dt, loaded = json.loads(out.stdout)
+        times.append(dt)
+    return sorted(times)[len(times)//2], loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark the import time of the library modules")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    cases = [('eager', EAGER)] + [(name, 'import ' + name) for name in MODULES]
+    cases.append(('first numpy fit', 'import library.mag_of_completeness as m, library.curve_fitting_method as c\n'
+                                     'c.generate_autobvalue("b-value pois", m.fmd_details(numpy.random.default_rng(0)'
+                                     '.exponential(0.43, 1000).round(1), "maxc", nbsample=10, rng=0), "numpy")'))
+    print('%-32s %10s  %s' % ('import', 'seconds', 'loaded'))
+    for name, statement in cases:
+        seconds, loaded = import_time(statement, args.repeat)
+        print('%-32s %10.3f  %s' % (name, seconds, ', '.join(loaded)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+check that the NumPy backend of generate_autobvalue gives the same fits as the statsmodels backend. both backends
+fit the same FMDs of synthetic Gutenberg-Richter catalogs (see benchmarks/synthetic.py), and the fitted
+parameters, fitted counts and the rounded b-value, uncertainty and confidence interval are compared within a
+tolerance. the script exits with an error when any fit is outside it.
+
+example:
+    python -m benchmarks.check_backends
+    python -m benchmarks.check_backends --sizes 1e3 1e5 --seeds 20 --rtol 1e-6
+"""
+
+import argparse
+import sys
+import warnings
+import numpy as np
+from library.mag_of_completeness import fmd_details
+from library.curve_fitting_method import generate_autobvalue
+from benchmarks.synthetic import gr_catalog
+
+
+# rounding step of the rounded outputs. they may differ by one step when the unrounded values sit on a rounding
+# edge, plus rtol of their value
+ROUNDED = {'bvalue': 0.01, 'unc': 0.01, 'ci2': 0.00001, 'ci4': 0.00001}
+
+
+def compare_backends(fmd_data, cv_method, rtol):
+    """
+    a function to fit one FMD with both backends and measure how far apart the fits are.
+
+    :param fmd_data (dict): output of fmd_details()
+    :param cv_method (str): curve fitting method, 'b-value pois', 'b-value glin' or 'b-value glog'
+    :param rtol (float): relative tolerance on the parameters, the fitted counts and the confidence interval
+    :return:
+    diff (dict): largest difference of every compared output, relative for params and fitted
+    ok (bool): True if every output is within its tolerance
+    """
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        ref = generate_autobvalue(cv_method, fmd_data, 'statsmodels')
+        fit = generate_autobvalue(cv_method, fmd_data, 'numpy')
+    diff, ok = {}, True
+    for key in ('params', 'fitted'):
+        a, b = np.asarray(getattr(ref, key), dtype=float), np.asarray(getattr(fit, key), dtype=float)
+        diff[key] = float(np.max(np.abs(a - b)/np.maximum(np.abs(a), 1e-12))) if len(a) else 0.
+        ok &= diff[key] <= rtol
+    for key, step in ROUNDED.items():
+        value = float(getattr(ref, key))
+        diff[key] = abs(value - float(getattr(fit, key)))
+        ok &= diff[key] <= step + rtol*abs(value) + 1e-12
+    return diff, bool(ok)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="check the NumPy fitting backend against statsmodels")
+    parser.add_argument('--sizes', nargs='+', type=float, default=[1e2, 1e3, 1e4, 1e5])
+    parser.add_argument('--seeds', type=int, default=10, help="number of catalogs of every size")
+    parser.add_argument('--bvalue', type=float, default=1.0)
+    parser.add_argument('--mc', type=float, default=1.5, help="magnitude where half of the events are detected")
+    parser.add_argument('--sigma', type=float, default=0.1, help="width of the detection roll-off")
+    parser.add_argument('--mbin', type=float, default=0.1)
+    # statsmodels stops its IRLS on the change of the deviance, which leaves the Gaussian GLM of small FMDs up to
+    # about 1e-4 away from the converged fit the NumPy backend reaches
+    parser.add_argument('--rtol', type=float, default=1e-3, help="relative tolerance on params and fitted")
+    args = parser.parse_args(argv)
+
+    failed = 0
+    print('%-14s %8s %6s %12s %12s %8s %8s  %s' % ('method', 'events', 'fits', 'params', 'fitted', 'bvalue', 'unc',
+                                                   'check'))
+    for cv_method in ('b-value pois', 'b-value glin', 'b-value glog'):
+        for size in args.sizes:
+            worst, nfit, nbad = {}, 0, 0
+            for seed in range(args.seeds):
+                mag = gr_catalog(int(size), args.bvalue, args.mc, args.sigma, rng=seed)['M']
+                for mc_method in ('maxc', 'mbs'):
+                    fmd_data = fmd_details(mag, mc_method, args.mbin, 20, rng=seed, batched=True)
+                    if len(fmd_data['xo']) < 3:
+                        continue
+                    diff, ok = compare_backends(fmd_data, cv_method, args.rtol)
+                    worst = {key: max(value, worst.get(key, 0.)) for key, value in diff.items()}
+                    nfit += 1
+                    nbad += not ok
+            failed += nbad
+            print('%-14s %8d %6d %12.2e %12.2e %8.3f %8.3f  %s'
+                  % (cv_method, size, nfit, worst.get('params', 0.), worst.get('fitted', 0.), worst.get('bvalue', 0.),
+                     worst.get('unc', 0.), 'ok' if not nbad else 'FAIL %d' % nbad))
+    if failed:
+        sys.exit("%d fits of the NumPy backend are outside the tolerance" % failed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+checks of edge cases of the pipeline on small synthetic catalogs (see benchmarks/synthetic.py). every check
+raises an AssertionError when it fails, and the script exits with an error when any check fails.
+
+example:
+    python -m benchmarks.check_edge_cases
+"""
+
+import sys
+import traceback
+import numpy as np
+from library.mag_of_completeness import maxc, gft, mbs, fmd, fmd_details, mc_bootstrap, mc_ensemble
+from library.mapping import grid_nodes
+from library.volume import grid_nodes_3d, profile_nodes
+from benchmarks.synthetic import gr_catalog
+
+
+def check_nan_magnitudes():
+    """
+    a function to check that every Mc method leaves NaN magnitudes out in the same way, i.e. gives the same
+    results on a catalog with NaN magnitudes as on the catalog without them.
+    """
+
+    mag = gr_catalog(5000, rng=0)['M']
+    nan = mag.copy()
+    nan[np.random.default_rng(1).choice(len(mag), 200, replace=False)] = np.nan
+    clean = mag[~np.isnan(nan)]
+
+    for a, b in zip(fmd(nan, 0.1), fmd(clean, 0.1)):
+        assert np.array_equal(a, b), 'fmd'
+    for method in (maxc, gft, mbs):
+        assert str(method(nan, 0.1)) == str(method(clean, 0.1)), method.__name__
+    for mc_method in ('maxc', 'gft', 'mbs'):
+        assert np.array_equal(mc_bootstrap(nan, mc_method, nbsample=20, rng=2),
+                              mc_bootstrap(clean, mc_method, nbsample=20, rng=2)), mc_method
+        for kwargs in ({'batched': True}, {'batched': False}, {'batched': True, 'cv_method': 'b-value pois'}):
+            a = fmd_details(nan, mc_method, nbsample=10, rng=3, **kwargs)
+            b = fmd_details(clean, mc_method, nbsample=10, rng=3, **kwargs)
+            for key in ('mc', 'mc_mean', 'maxmag', 'x', 'y', 'm', 'noncum', 'mag_bvalue'):
+                assert np.array_equal(a[key], b[key]), (mc_method, kwargs, key)
+    assert mc_ensemble(nan, nbsample=10, rng=4).equals(mc_ensemble(clean, nbsample=10, rng=4)), 'mc_ensemble'
+
+
+def check_grid_ends():
+    """
+    a function to check that the grids and profiles place no node past their end when the extent is not a whole
+    number of node spacings, and still place one on the end when it is.
+    """
+
+    # a 3-4-5 profile of length 5: 0.7 does not divide it, 0.5 does (0.1 only up to rounding)
+    for ds, count, end in ((0.7, 8, False), (0.5, 11, True), (0.1, 51, True), (3., 2, False)):
+        nodes, shape, dist, normal = profile_nodes((1., 2.), (4., 6.), (0., 1.), ds, 0.5)
+        assert shape == (3, count), (ds, shape)
+        assert dist.min() == 0. and dist.max() <= 5., (ds, dist.max())
+        assert np.all(np.abs(np.hypot(nodes[:, 0] - 1., nodes[:, 1] - 2.) - dist) < 1e-9), ds
+        assert np.isclose(dist.max(), 5.) == end, ds
+    nodes, shape = grid_nodes((0., 1.), (0., 0.95), 0.3)
+    assert shape == (4, 4) and nodes[:, 0].max() <= 1. and nodes[:, 1].max() <= 0.95, shape
+    nodes, shape = grid_nodes_3d((0., 1.), (0., 0.9), (0., 1.), 0.3)
+    assert shape == (4, 4, 4) and nodes.max() <= 1. and np.isclose(nodes[:, 1].max(), 0.9), shape
+
+
+CHECKS = [check_nan_magnitudes, check_grid_ends]
+
+
+def main(argv=None):
+    failed = 0
+    for check in CHECKS:
+        try:
+            check()
+            print('%-40s ok' % check.__name__)
+        except Exception:
+            failed += 1
+            print('%-40s FAIL' % check.__name__)
+            traceback.print_exc()
+    if failed:
+        sys.exit("%d checks failed" % failed)
+
+
+if __name__ == '__main__':
+    main()
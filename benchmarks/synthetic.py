@@ -0,0 +1,54 @@
+import numpy as np
+from scipy.stats import norm
+
+
+def gr_catalog(n, bvalue=1.0, mc=1.5, sigma=0.1, mmin=0.0, decimals=1, rng=None, extent=(0., 1., 0., 1.)):
+    """
+    a function to generate a synthetic catalog whose magnitudes follow a Gutenberg-Richter distribution with
+    a known b-value, detected with a probability that rolls off below mc as a cumulative normal distribution
+    (Ogata & Katsura, 1993).
+
+    :param n (int): number of events
+    :param bvalue (float): b-value
+    :param mc (float): magnitude where half of the events are detected
+    :param sigma (float): width of the detection roll-off
+    :param mmin (float): smallest generated magnitude, before detection
+    :param decimals (int): magnitudes are rounded to this many decimals, like a real catalog. None keeps them
+    continuous
+    :param rng (Generator, int or None): random number generator or seed
+    :param extent (tuple): xmin, xmax, ymin and ymax of the uniformly distributed epicenters
+    :return:
+    catalog (dict): X, Y, Z and M of every event
+    """
+
+    rng = np.random.default_rng(rng)
+    beta = bvalue*np.log(10)
+    mag = np.zeros(0)
+    while len(mag) < n:
+        m = mmin + rng.exponential(1/beta, size=2*(n - len(mag)) + 1000)
+        mag = np.concatenate([mag, m[rng.random(len(m)) < norm.cdf(m, mc, sigma)]])
+    mag = mag[:n]
+    if decimals is not None:
+        mag = np.round(mag, decimals)
+    catalog = {
+        'X': rng.uniform(extent[0], extent[1], n),
+        'Y': rng.uniform(extent[2], extent[3], n),
+        'Z': rng.uniform(0, 30, n),
+        'M': mag
+    }
+    return catalog
+
+
+def completeness(bvalue=1.0, mc=1.5, sigma=0.1, level=0.95):
+    """
+    a function to get the magnitude above which the synthetic catalog is complete at the given detection level.
+
+    :param bvalue (float): b-value
+    :param mc (float): magnitude where half of the events are detected
+    :param sigma (float): width of the detection roll-off
+    :param level (float): detection probability
+    :return:
+    mc_true (float): magnitude of completeness
+    """
+
+    return mc + norm.ppf(level)*sigma
@@ -0,0 +1,143 @@
+import os
+import json
+import pickle
+import hashlib
+import numpy as np
+from library.mag_of_completeness import fmd_details
+from library.curve_fitting_method import generate_autobvalue
+
+
+def result_key(mag, **params):
+    """
+    a function to make the cache key of a b-value calculation from the content of the magnitude array and the
+    parameters of the calculation. the array is hashed in its stored dtype, e.g. float64 or int16 tenths (see
+    compact_magnitudes()), straight from its buffer without a copy.
+
+    :param mag (series): a series of earthquake magnitudes
+    :param params: parameters of the calculation, e.g. mc_method, cv_method, mbin, nbsample and seed
+    :return:
+    key (str): hex digest of the magnitudes and the parameters
+    """
+
+    mag = np.ascontiguousarray(mag)
+    h = hashlib.sha256(json.dumps([mag.dtype.str, mag.shape]).encode())
+    h.update(mag)
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    an on-disk cache of pickled results with a bound on its total size. every entry is one file named after its
+    key. reading an entry touches its file, and the least recently used files are removed once the cache grows
+    beyond max_bytes. hits, misses and evictions are counted per instance.
+    """
+
+    def __init__(self, directory, max_bytes=2**30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def get(self, key, default=None):
+        try:
+            with open(self.path(key), 'rb') as fp:
+                value = pickle.load(fp)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return default
+        try:
+            os.utime(self.path(key))
+        except FileNotFoundError:
+            # evicted by another process since it was read, the loaded value is still good
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        tmp = self.path(key) + '.tmp%d' % os.getpid()
+        with open(tmp, 'wb') as fp:
+            pickle.dump(value, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path(key))
+        self.evict()
+
+    def entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                try:
+                    st = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, name))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        size = sum(elem[1] for elem in entries)
+        for mtime, nbytes, name in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            size -= nbytes
+            self.evictions += 1
+
+    def clear(self):
+        for mtime, nbytes, name in self.entries():
+            os.remove(os.path.join(self.directory, name))
+
+    def stats(self):
+        entries = self.entries()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits/lookups if lookups else np.nan,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'bytes': sum(elem[1] for elem in entries),
+            'max_bytes': self.max_bytes
+        }
+
+
+def cached_autobvalue(mag, mc_method, cv_method, cache, mbin=0.1, nbsample=200, seed=None, **kwargs):
+    """
+    a function to run fmd_details and generate_autobvalue through a ResultCache. the key is the content of the
+    magnitudes plus mc_method, cv_method, mbin, nbsample, the seed and any other option, so a hit returns exactly
+    what the calculation would give and skips it.
+
+    :param mag (series): a series of earthquake magnitudes
+    :param mc_method (string): method for estimating Mc. options are 'maxc', 'mbs', and 'gft'.
+    :param cv_method (string): curve fitting method. options are 'b-value pois', 'b-value glin', 'b-value glog',
+    and 'b-value mle'.
+    :param cache (ResultCache): result cache
+    :param mbin (float): magnitude bin width
+    :param nbsample (int): number of bootstrap sample
+    :param seed (int): seed of the bootstrap. with None the bootstrap is not reproducible, and the first cached
+    result is returned for later calls
+    :param kwargs: other options of fmd_details (batched, n_jobs, ...) and backend of generate_autobvalue
+    :return:
+    fmd_data (dict) : output of fmd_details
+    cv_data (dict) : output of generate_autobvalue
+    """
+
+    backend = kwargs.pop('backend', 'statsmodels')
+    mag = np.asarray(mag)
+    key = result_key(mag, mc_method=mc_method, cv_method=cv_method, mbin=mbin, nbsample=nbsample, seed=seed,
+                     backend=backend, **{name: value for name, value in kwargs.items()
+                                         if name not in ('n_jobs', 'executor')})
+    result = cache.get(key)
+    if result is None:
+        fmd_data = fmd_details(mag, mc_method, mbin, nbsample, rng=seed, **kwargs)
+        cv_data = generate_autobvalue(cv_method, fmd_data, backend, mbin=mbin)
+        result = (fmd_data, cv_data)
+        cache.put(key, result)
+    return result
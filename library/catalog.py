@@ -0,0 +1,209 @@
+import os
+import json
+import hashlib
+import shutil
+import numpy as np
+import pandas as pd
+from library.mag_of_completeness import compact_magnitudes
+from library.profiling import stage, timed
+
+
+CATALOG_DTYPES = {'X': np.float64, 'Y': np.float64, 'Z': np.float32, 'M': np.float64}
+
+
+def csv_dtypes(columns, dtypes, time_col=None):
+    """
+    a function to get the dtypes the columns are parsed with. magnitudes stored in a compact dtype, float32 or
+    tenths in an integer dtype (see compact_magnitudes()), are parsed as float64 and converted afterwards.
+
+    :param columns (list): columns that are read
+    :param dtypes (dict): dtype of each numeric column
+    :param time_col (str): column with event times, which is not given a dtype
+    :return:
+    dtypes (dict): dtype of each column given to pd.read_csv
+    """
+
+    return {col: np.float64 if col == 'M' and np.dtype(dtypes[col]) != np.float64 else dtypes[col]
+            for col in columns if col != time_col}
+
+
+def cache_key(file_name, columns, dtypes):
+    """
+    a function to make the cache key of a catalog file from its path, size and modification time, and the columns
+    and dtypes that are read from it.
+
+    :param file_name (str): catalog file
+    :param columns (list): columns that are read
+    :param dtypes (dict): dtype of each column
+    :return:
+    key (str): hex digest identifying this version of the catalog
+    """
+
+    st = os.stat(file_name)
+    ident = [os.path.abspath(file_name), st.st_size, st.st_mtime_ns, list(columns),
+             [np.dtype(dtypes[col]).str if col in dtypes else 'time' for col in columns]]
+    return hashlib.sha1(json.dumps(ident).encode()).hexdigest()
+
+
+def npy_header(fp, dtype, n):
+    """
+    a function to write the header of a one-dimensional .npy file at the start of an open file. the header of a
+    file whose length is not known yet is first written with a placeholder length and rewritten at the end, so
+    it has to keep the same size.
+
+    :param fp (file): file opened for binary writing
+    :param dtype (dtype): dtype of the array
+    :param n (int): length of the array
+    :return:
+    offset (int): size of the header, where the data starts
+    """
+
+    fp.seek(0)
+    np.lib.format.write_array_header_1_0(fp, {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                                              'fortran_order': False, 'shape': (n,)})
+    return fp.tell()
+
+
+def write_catalog_cache(file_name, cache_dir, columns, dtypes, time_col=None, chunksize=10**6):
+    """
+    a function to stream a CSV catalog in chunks and write every column to its own .npy file, without holding the
+    whole catalog in memory.
+
+    :param file_name (str): catalog file
+    :param cache_dir (str): directory to write the .npy files to
+    :param columns (list): columns that are read
+    :param dtypes (dict): dtype of each numeric column
+    :param time_col (str): column with event times, parsed to datetime64[ns] if it is not numeric
+    :param chunksize (int): number of rows per chunk
+    :return:
+    n (int): number of events
+    """
+
+    os.makedirs(cache_dir, exist_ok=True)
+    files, offsets, kinds = {}, {}, {}
+    n = 0
+    try:
+        reader = pd.read_csv(file_name, usecols=list(columns), chunksize=chunksize,
+                             dtype=csv_dtypes(columns, dtypes, time_col))
+        for chunk in reader:
+            for col in columns:
+                values = chunk[col]
+                if col == time_col:
+                    if not pd.api.types.is_numeric_dtype(values):
+                        values = pd.to_datetime(values).astype('datetime64[ns]')
+                    else:
+                        values = values.astype(np.float64)
+                values = np.ascontiguousarray(values.to_numpy())
+                if col == 'M' and values.dtype != dtypes[col]:
+                    values = compact_magnitudes(values, dtypes[col])
+                if col not in files:
+                    kinds[col] = values.dtype
+                    files[col] = open(os.path.join(cache_dir, col + '.npy'), 'wb')
+                    offsets[col] = npy_header(files[col], kinds[col], 10**15)
+                files[col].write(values.astype(kinds[col], copy=False).tobytes())
+            n += len(chunk)
+        for col in columns:
+            if col not in files:
+                kinds[col] = np.dtype(dtypes.get(col, np.float64))
+                files[col] = open(os.path.join(cache_dir, col + '.npy'), 'wb')
+                offsets[col] = npy_header(files[col], kinds[col], 10**15)
+            end = files[col].tell()
+            offset = npy_header(files[col], kinds[col], n)
+            if offset != offsets[col]:
+                raise RuntimeError("the .npy header of column %r changed from %d to %d bytes when its length was "
+                                   "written, which overwrites its data in %s" % (col, offsets[col], offset, cache_dir))
+            files[col].seek(end)
+    finally:
+        for fp in files.values():
+            fp.close()
+    return n
+
+
+def remove_stale_caches(file_name, cache_dir):
+    """
+    a function to remove the caches of older versions of a catalog file. only subdirectories written by
+    load_catalog() for this file are removed, i.e. with a meta.json naming it as the source and a different size
+    or modification time, so caches of other columns, dtypes or files and anything else in cache_dir are kept.
+
+    :param file_name (str): catalog file
+    :param cache_dir (str): cache directory
+    :return:
+    removed (list): removed subdirectories
+    """
+
+    if not os.path.isdir(cache_dir):
+        return []
+    st = os.stat(file_name)
+    source = os.path.abspath(file_name)
+    removed = []
+    for entry in os.scandir(cache_dir):
+        try:
+            with open(os.path.join(entry.path, 'meta.json')) as fp:
+                meta = json.load(fp)
+        except (OSError, ValueError):
+            continue
+        if not isinstance(meta, dict) or meta.get('source') != source:
+            continue
+        if meta.get('size') != st.st_size or meta.get('mtime_ns') != st.st_mtime_ns:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed.append(entry.path)
+    return removed
+
+
+@timed('load_catalog')
+def load_catalog(file_name, columns=('X', 'Y', 'Z', 'M'), time_col=None, dtypes=None, cache=True, cache_dir=None,
+                 chunksize=10**6, as_frame=False):
+    """
+    a function to read a seismic catalog. the CSV is read once in chunks, only the needed columns, and stored as one
+    .npy file per column. the cache is keyed by the file's size and modification time, and later calls map the
+    .npy files into memory instead of parsing the CSV again.
+
+    :param file_name (str): catalog file containing earthquake locations (x,y,z) and magnitudes (m)
+    :param columns (tuple): columns to read
+    :param time_col (str): column with event times. it is added to columns if needed
+    :param dtypes (dict): dtype of each numeric column. defaults to CATALOG_DTYPES and float64 for other columns.
+    magnitudes can be stored compactly as M float32, or as int16 tenths of magnitude units (see compact_magnitudes())
+    :param cache (bool): if False, the CSV is read without writing or using the cache
+    :param cache_dir (str): cache directory. defaults to a hidden directory next to the catalog file
+    :param chunksize (int): number of CSV rows per chunk
+    :param as_frame (bool): if True, a dataframe is returned. this copies the columns into memory
+    :return:
+    catalog (dict or dataframe): memory-mapped array of each column, or a dataframe
+    """
+
+    columns = list(columns)
+    if time_col is not None and time_col not in columns:
+        columns.append(time_col)
+    dtypes = {col: CATALOG_DTYPES.get(col, np.float64) for col in columns if col != time_col} | dict(dtypes or {})
+
+    if not cache:
+        with stage('read_csv'):
+            catalog = pd.read_csv(file_name, usecols=columns, dtype=csv_dtypes(columns, dtypes, time_col))
+        if 'M' in columns and catalog['M'].dtype != dtypes['M']:
+            catalog['M'] = compact_magnitudes(catalog['M'], dtypes['M'])
+        if time_col is not None and not pd.api.types.is_numeric_dtype(catalog[time_col]):
+            catalog[time_col] = pd.to_datetime(catalog[time_col]).astype('datetime64[ns]')
+        return catalog if as_frame else {col: catalog[col].to_numpy() for col in columns}
+
+    if cache_dir is None:
+        head, tail = os.path.split(os.path.abspath(file_name))
+        cache_dir = os.path.join(head, '.' + tail + '.cache')
+    key = cache_key(file_name, columns, dtypes)
+    path = os.path.join(cache_dir, key)
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        remove_stale_caches(file_name, cache_dir)
+        tmp = path + '.tmp%d' % os.getpid()
+        st = os.stat(file_name)
+        with stage('read_csv'):
+            n = write_catalog_cache(file_name, tmp, columns, dtypes, time_col, chunksize)
+        with open(os.path.join(tmp, 'meta.json'), 'w') as fp:
+            json.dump({'source': os.path.abspath(file_name), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                       'columns': columns, 'n': n}, fp)
+        try:
+            os.replace(tmp, path)
+        except OSError:
+            # another process wrote the same cache first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    catalog = {col: np.load(os.path.join(path, col + '.npy'), mmap_mode='r') for col in columns}
+    return pd.DataFrame(catalog) if as_frame else catalog
@@ -1,11 +1,137 @@
 import numpy as np
 import math
-import statsmodels.api as sm
-import statsmodels.formula.api as smf
-import scipy
+from statistics import NormalDist
+from library.lazy import lazy_import
+from library.results import CVResult
+from library.profiling import stage, timed
 
+# statsmodels and scipy.stats take about a second to import, so they are only loaded when a fit first needs them
+sm = lazy_import('statsmodels.api')
+smf = lazy_import('statsmodels.formula.api')
+stats = lazy_import('scipy.stats')
 
-def fit_data_with_poisson(data, x, xo, log_yo):
+CV_METHODS = ('b-value pois', 'b-value glin', 'b-value glog', 'b-value mle')
+FIT_BACKENDS = ('numpy', 'statsmodels')
+
+# errors raised by Mc and curve fitting on degenerate FMDs (a single magnitude, too few bins, a singular fit, ...).
+# maps and time series leave such nodes or windows empty, anything else is a bug and is raised
+FMD_ERRORS = (ValueError, ArithmeticError, np.linalg.LinAlgError)
+
+
+def check_cv_method(cv_method, backend=None):
+    """
+    a function to check a curve fitting method and backend before fitting, so a mistyped name is reported instead
+    of being taken as a degenerate FMD (see FMD_ERRORS).
+
+    :param cv_method (string): curve fitting method, one of CV_METHODS
+    :param backend (string): backend of generate_autobvalue, one of FIT_BACKENDS, or None for the batch fit
+    :return:
+    cv_method (string)
+    """
+
+    if cv_method not in CV_METHODS:
+        raise ValueError("unknown curve fitting method %r, options are %s" % (cv_method, ', '.join(CV_METHODS)))
+    if backend is not None and backend not in FIT_BACKENDS:
+        raise ValueError("unknown backend %r, options are %s" % (backend, ', '.join(FIT_BACKENDS)))
+    return cv_method
+
+
+def glm_irls(x, y, family, start_params=None, maxiter=100, tol=1e-12):
+    """
+    a function to fit y = exp(a + b*x) with a two-parameter GLM by iteratively reweighted least squares, using
+    plain NumPy instead of statsmodels. it gives the same estimates, standard errors and Wald confidence intervals
+    as statsmodels' GLM with the same family.
+
+    :param x (array): x
+    :param y (array): y
+    :param family (string): 'poisson' for Poisson residual with log link, 'gaussian' for Gaussian residual with
+    log link
+    :param start_params (array): intercept and slope to start from, e.g. a previous solution. if None, the start
+    is taken from the data like statsmodels does
+    :param maxiter (int): maximum number of iterations
+    :param tol (float): tolerance on the relative change of deviance
+    :return:
+    fit (dict): params (intercept, slope), bse, conf_int (95%, one row per parameter), fittedvalues, scale, nit
+    """
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    X = np.column_stack([np.ones(len(x)), x])
+    if start_params is None:
+        mu = (y + y.mean())/2
+        eta = np.log(mu)
+    else:
+        eta = X @ np.asarray(start_params, dtype=float)
+        mu = np.exp(eta)
+
+    dev = np.inf
+    for nit in range(1, maxiter+1):
+        # working response and weights of the log link. for poisson var(mu) = mu, for gaussian var(mu) = 1
+        z = eta + (y - mu)/mu
+        w = mu if family == 'poisson' else mu**2
+        XtW = X.T*w
+        params = np.linalg.solve(XtW @ X, XtW @ z)
+        eta = X @ params
+        mu = np.exp(eta)
+        if family == 'poisson':
+            dev_new = 2*np.sum(np.where(y > 0, y*np.log(np.where(y > 0, y, 1)/mu), 0) - (y - mu))
+        else:
+            dev_new = np.sum((y - mu)**2)
+        converged = abs(dev_new - dev) <= tol*max(abs(dev_new), 1)
+        dev = dev_new
+        if converged:
+            break
+
+    w = mu if family == 'poisson' else mu**2
+    scale = 1. if family == 'poisson' else np.sum((y - mu)**2)/(len(y) - 2)
+    cov = scale*np.linalg.inv((X.T*w) @ X)
+    bse = np.sqrt(np.diag(cov))
+    q = stats.norm.ppf(0.975)
+    fit = {
+        'params'        : params,
+        'bse'           : bse,
+        'conf_int'      : np.column_stack([params - q*bse, params + q*bse]),
+        'fittedvalues'  : mu,
+        'scale'         : scale,
+        'nit'           : nit
+    }
+    return fit
+
+
+def ols_line(x, y):
+    """
+    a function to fit y = a + b*x by ordinary least squares in closed form, using plain NumPy instead of
+    statsmodels. it gives the same estimates and t-based 95% confidence intervals as statsmodels' OLS.
+
+    :param x (array): x
+    :param y (array): y
+    :return:
+    fit (dict): params (intercept, slope), bse, conf_int (95%, one row per parameter), fittedvalues, scale
+    """
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    xm, ym = x.mean(), y.mean()
+    sxx = np.sum((x - xm)**2)
+    b = np.sum((x - xm)*(y - ym))/sxx
+    a = ym - b*xm
+    fitted = a + b*x
+    scale = np.sum((y - fitted)**2)/(n - 2)
+    bse = np.sqrt(scale*np.array([1/n + xm**2/sxx, 1/sxx]))
+    params = np.array([a, b])
+    q = stats.t.ppf(0.975, n - 2)
+    fit = {
+        'params'        : params,
+        'bse'           : bse,
+        'conf_int'      : np.column_stack([params - q*bse, params + q*bse]),
+        'fittedvalues'  : fitted,
+        'scale'         : scale
+    }
+    return fit
+
+
+def fit_data_with_poisson(data, x, xo, log_yo, backend='statsmodels', start_params=None, keep_model=False):
     """
     a function to calculate b-value, its uncertainty and its 95% confidence interval 
     using GLM with Poisson residual curve fitting method (b-value pois)
@@ -14,50 +140,56 @@ def fit_data_with_poisson(data, x, xo, log_yo):
     :param x (array): x
     :param xo (array): x without zero value
     :param log_yo (array): log10(y) without zero value
+    :param backend (string): 'statsmodels' or 'numpy' (see glm_irls())
+    :param start_params (array): intercept and slope to start the fit from, e.g. a previous solution
+    :param keep_model (bool): if True, the fitted model is kept in the result
     :return:
-    cv_data (dictionary): a dictionary containing b-value, its uncertainty, its 95% confidence interval, etc.
+    cv_data (CVResult): b-value, its uncertainty, its 95% confidence interval, etc., also readable as a dictionary
     """
     
-    pois=smf.glm(formula='y~x',family=sm.families.Poisson(),data=data).fit()  
-    bpois=round(-1*pois.params['x']/math.log(10),2)
+    with stage('fit', len(x)):
+        if backend == 'numpy':
+            pois = glm_irls(data['x'], data['y'], 'poisson', start_params)
+            params, ci = pois['params'], pois['conf_int'][1]
+            ppois = pois['fittedvalues']
+        else:
+            pois=smf.glm(formula='y~x',family=sm.families.Poisson(),data=data).fit(start_params=start_params)
+            params, ci = pois.params.to_numpy(), pois.conf_int().loc['x']
+            ppois = pois.fittedvalues.to_numpy()
+    slope = params[1]
+    bpois=round(-1*slope/math.log(10),2)
 
-    cipois2=round(100*(pois.conf_int().loc['x',0])/math.log(10),3)/100
-    cipois4=round(100*(pois.conf_int().loc['x',1])/math.log(10),3)/100
+    cipois2=round(100*(ci[0])/math.log(10),3)/100
+    cipois4=round(100*(ci[1])/math.log(10),3)/100
 
     uncpois=round(100*(cipois4-cipois2)/2)/100 
 
     qhi = 0.975
     qlo = 0.025
 
-    ppois = pois.fittedvalues
-    nhpois = scipy.stats.poisson.ppf(qhi, ppois)
-    nlpois = scipy.stats.poisson.ppf(qlo, ppois)
-    nlpoiso = nlpois[list(np.where(np.array(nlpois) != 0)[0])]
-    xonlpois = x[list(np.where(np.array(nlpois) != 0)[0])]
-    nhpoiso = nhpois[list(np.where(np.array(nhpois) != 0)[0])]
-    xonhpois = x[list(np.where(np.array(nhpois) != 0)[0])]
+    with stage('ppf', len(x)):
+        nhpois = stats.poisson.ppf(qhi, ppois)
+        nlpois = stats.poisson.ppf(qlo, ppois)
 
-    cv_data = {
-        'pois'      : pois,
-        'bvalue'     : bpois,
-        'cipois2'   : cipois2,
-        'cipois4'   : cipois4,
-        'unc'        : uncpois,
-        'ppois'     : ppois,
-        'nhpois'    : nhpois,
-        'nlpois'    : nlpois,
-        'nlpoiso'   : nlpoiso,
-        'xonlpois'  : xonlpois,
-        'nhpoiso'   : nhpoiso,
-        'xonhpois'  : xonhpois,
-        'x'         : x,
-        'xo'        : xo,
-        'log_yo'       : log_yo
-    }
+    cv_data = CVResult(
+        method      = 'pois',
+        bvalue      = bpois,
+        unc         = uncpois,
+        ci2         = cipois2,
+        ci4         = cipois4,
+        params      = params,
+        fitted      = ppois,
+        nh          = nhpois,
+        nl          = nlpois,
+        x           = x,
+        xo          = xo,
+        log_yo      = log_yo,
+        model       = pois if keep_model else None
+    )
     return cv_data
 
 
-def fit_data_with_gaussian_glm(data, x, xo, log_yo):
+def fit_data_with_gaussian_glm(data, x, xo, log_yo, backend='statsmodels', start_params=None, keep_model=False):
     """
     a function to calculate b-value, its uncertainty and its 95% confidence interval 
     GLM with Gaussian residual curve fitting method (b-value glin)
@@ -66,46 +198,57 @@ def fit_data_with_gaussian_glm(data, x, xo, log_yo):
     :param x (array): x
     :param xo (array): x without zero value
     :param log_yo (array): log10(y) without zero value
+    :param backend (string): 'statsmodels' or 'numpy' (see glm_irls())
+    :param start_params (array): intercept and slope to start the fit from, e.g. a previous solution
+    :param keep_model (bool): if True, the fitted model is kept in the result
     :return:
-    cv_data (dictionary): a dictionary containing b-value, its uncertainty, its 95% confidence interval, etc.
+    cv_data (CVResult): b-value, its uncertainty, its 95% confidence interval, etc., also readable as a dictionary
     """
 
-    glin=smf.glm(formula='yo~xo',family=sm.families.Gaussian(link=sm.genmod.families.links.log), data=data).fit()
-    bglin=round(-1*glin.params['xo']/math.log(10),2)
+    with stage('fit', len(x)):
+        if backend == 'numpy':
+            glin = glm_irls(data['xo'], data['yo'], 'gaussian', start_params)
+            params, ci = glin['params'], glin['conf_int'][1]
+            pglin = glin['fittedvalues']
+        else:
+            glin=smf.glm(formula='yo~xo',family=sm.families.Gaussian(link=sm.genmod.families.links.Log()), data=data).fit(start_params=start_params)
+            params, ci = glin.params.to_numpy(), glin.conf_int().loc['xo']
+            pglin = glin.fittedvalues.to_numpy()
+    slope = params[1]
+    bglin=round(-1*slope/math.log(10),2)
 
-    ciglin2=round(100*(glin.conf_int().loc['xo',0])/math.log(10),3)/100
-    ciglin4=round(100*(glin.conf_int().loc['xo',1])/math.log(10),3)/100
+    ciglin2=round(100*(ci[0])/math.log(10),3)/100
+    ciglin4=round(100*(ci[1])/math.log(10),3)/100
 
     uncglin=round(100*(ciglin4-ciglin2)/2)/100
 
     qhi = 0.975
     qlo = 0.025
 
-    pglin=glin.fittedvalues
-    nhglin=scipy.stats.norm.ppf(qhi, pglin, np.std(log_yo-pglin))
-    nlglin=scipy.stats.norm.ppf(qlo, pglin, np.std(log_yo-pglin))
-    nlglinp = nlglin[list(np.where(np.array(nlglin)>0)[0])]
-    xop = xo[tuple([list(np.where(np.array(nlglin)>0)[0])])]
+    with stage('ppf', len(x)):
+        sd = np.std(np.asarray(log_yo)-pglin)
+        nhglin=stats.norm.ppf(qhi, pglin, sd)
+        nlglin=stats.norm.ppf(qlo, pglin, sd)
 
-    cv_data = {
-        'glin'      : glin,
-        'bvalue'    : bglin,
-        'ciglin2'   : ciglin2,
-        'ciglin4'   : ciglin4,
-        'unc'        : uncglin,
-        'pglin'     : pglin,
-        'nhglin'    : nhglin,
-        'nlglin'    : nlglin,
-        'nlglinp'   : nlglinp,
-        'xop'       : xop,
-        'x'         : x,
-        'xo'        : xo,
-        'log_yo'    : log_yo
-    }
+    cv_data = CVResult(
+        method      = 'glin',
+        bvalue      = bglin,
+        unc         = uncglin,
+        ci2         = ciglin2,
+        ci4         = ciglin4,
+        params      = params,
+        fitted      = pglin,
+        nh          = nhglin,
+        nl          = nlglin,
+        x           = x,
+        xo          = xo,
+        log_yo      = log_yo,
+        model       = glin if keep_model else None
+    )
     return cv_data
 
 
-def fit_data_with_gaussian_lm(data, x, xo, log_yo):
+def fit_data_with_gaussian_lm(data, x, xo, log_yo, backend='statsmodels', keep_model=False):
     """
     a function to calculate b-value, its uncertainty and its 95% confidence interval 
     LM with Gaussian residual curve fitting method (b-value glog)
@@ -114,58 +257,433 @@ def fit_data_with_gaussian_lm(data, x, xo, log_yo):
     :param x (array): x
     :param xo (array): x without zero value
     :param log_yo (array): log10(y) without zero value
+    :param backend (string): 'statsmodels' or 'numpy' (see ols_line())
+    :param keep_model (bool): if True, the fitted model is kept in the result
     :return:
-    cv_data (dictionary): a dictionary containing b-value, its uncertainty, its 95% confidence interval, etc.
+    cv_data (CVResult): b-value, its uncertainty, its 95% confidence interval, etc., also readable as a dictionary
     """
     
-    glog=smf.ols(formula='log_yo~xo', data=data).fit()
-    bglog=round(-1*glog.params['xo'],2)
+    with stage('fit', len(x)):
+        if backend == 'numpy':
+            glog = ols_line(data['xo'], data['log_yo'])
+            params, ci = glog['params'], glog['conf_int'][1]
+            pglog = glog['fittedvalues']
+        else:
+            glog=smf.ols(formula='log_yo~xo', data=data).fit()
+            params, ci = glog.params.to_numpy(), glog.conf_int().loc['xo']
+            pglog = glog.fittedvalues.to_numpy()
+    slope = params[1]
+    bglog=round(-1*slope,2)
 
-    ciglog2=glog.conf_int().loc['xo',0]
-    ciglog4=glog.conf_int().loc['xo',1]
+    ciglog2=ci[0]
+    ciglog4=ci[1]
 
     uncglog=round(100*(ciglog4-ciglog2)/2)/100
 
     qhi = 0.975
     qlo = 0.025
 
-    pglog=glog.fittedvalues
-    nhglog=scipy.stats.norm.ppf(qhi, pglog, np.std(log_yo-pglog))
-    nlglog=scipy.stats.norm.ppf(qlo, pglog, np.std(log_yo-pglog))
+    with stage('ppf', len(x)):
+        sd = np.std(np.asarray(log_yo)-pglog)
+        nhglog=stats.norm.ppf(qhi, pglog, sd)
+        nlglog=stats.norm.ppf(qlo, pglog, sd)
 
-    cv_data = {
-        'glog'      : glog,
-        'bvalue'     : bglog,
-        'ciglog2'   : ciglog2,
-        'ciglog4'   : ciglog4,
-        'unc'    : uncglog,
-        'pglog'     : pglog,
-        'nhglog'    : nhglog,
-        'nlglog'    : nlglog,
-        'x'         : x,
-        'xo'        : xo,
-        'log_yo'       : log_yo
-    }
+    cv_data = CVResult(
+        method      = 'glog',
+        bvalue      = bglog,
+        unc         = uncglog,
+        ci2         = ciglog2,
+        ci4         = ciglog4,
+        params      = params,
+        fitted      = pglog,
+        nh          = nhglog,
+        nl          = nlglog,
+        x           = x,
+        xo          = xo,
+        log_yo      = log_yo,
+        model       = glog if keep_model else None
+    )
+    return cv_data
+
+
+def aki_utsu(nbev, mean, ssd, mc, mbin):
+    """
+    a function to calculate the maximum likelihood b-value (Aki, 1965) with the correction for binned magnitudes
+    (Utsu, 1966), and its uncertainty (Shi & Bolt, 1982), from the number, mean and sum of squared deviations of
+    the magnitudes above Mc. it works on numbers or arrays.
+
+    :param nbev (int or array): number of magnitudes
+    :param mean (float or array): mean of the magnitudes
+    :param ssd (float or array): sum of squared deviations of the magnitudes from their mean
+    :param mc (float or array): magnitude of completeness
+    :param mbin (float): magnitude bin width
+    :return:
+    b (float or array): b-value
+    unc (float or array): Shi & Bolt uncertainty of b-value
+    """
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        b = math.log10(math.exp(1))/(mean - (mc - mbin/2))
+        unc = 2.3*b**2*np.sqrt(ssd/(nbev*(nbev-1)))
+    return b, unc
+
+
+def fit_data_with_mle(mag, x, y, xo, log_yo, mc, mbin=0.1, counts=None):
+    """
+    a function to calculate b-value, its uncertainty and its 95% confidence interval with the Aki-Utsu maximum
+    likelihood estimator (b-value mle). it needs only the number, mean and spread of the magnitudes above Mc, so
+    it is O(n) and fits no model. unc is the Shi & Bolt uncertainty, and the confidence interval is b-value
+    +- 1.96 unc, given for the slope like the other methods. the fitted line and its band are the Poisson
+    expected counts of every bin for this b-value, scaled to the number of events in the bins, for plotting.
+    the estimator and the plotted FMD count different events: the estimator reads every magnitude from Mc up
+    (M >= Mc, as Aki-Utsu assumes), while bin x of the FMD holds the magnitudes in (x, x+mbin] from x = Mc, so
+    the events exactly at Mc are in the estimate but in no plotted bin. only the slope of the line comes from
+    the estimate, and it is scaled to sum(y), so it is drawn over the plotted bins without an offset.
+
+    :param mag (array): magnitudes between Mc and maxmag, or their distinct values when counts is given
+    :param x (array): x
+    :param y (array): y
+    :param xo (array): x without zero value
+    :param log_yo (array): log10(y) without zero value
+    :param mc (float): magnitude of completeness
+    :param mbin (float): magnitude bin width
+    :param counts (array): number of times each magnitude occurs, for a histogram of magnitudes
+    :return:
+    cv_data (CVResult): b-value, its uncertainty, its 95% confidence interval, etc., also readable as a dictionary
+    """
+
+    with stage('fit', len(mag)):
+        mag = np.asarray(mag, dtype=float)
+        counts = np.ones(len(mag)) if counts is None else np.asarray(counts, dtype=float)
+        nbev = counts.sum()
+        mean = (counts*mag).sum()/nbev
+        ssd = (counts*(mag - mean)**2).sum()
+        b, sd = aki_utsu(nbev, mean, ssd, mc, mbin)
+
+        # Poisson expected counts of the bins, scaled to the number of events in them
+        x = np.asarray(x, dtype=float)
+        slope = -b*math.log(10)
+        intercept = math.log(np.sum(y)) - np.log(np.exp(slope*(x - x[0])).sum()) - slope*x[0]
+        params = np.array([intercept, slope])
+        pmle = np.exp(intercept + slope*x)
+
+    bmle = round(b, 2)
+    q = NormalDist().inv_cdf(0.975)
+    cimle2 = round(100*(-b - q*sd), 3)/100
+    cimle4 = round(100*(-b + q*sd), 3)/100
+    uncmle = round(100*sd)/100
+
+    qhi = 0.975
+    qlo = 0.025
+
+    with stage('ppf', len(x)):
+        nhmle = stats.poisson.ppf(qhi, pmle)
+        nlmle = stats.poisson.ppf(qlo, pmle)
+
+    cv_data = CVResult(
+        method      = 'mle',
+        bvalue      = bmle,
+        unc         = uncmle,
+        ci2         = cimle2,
+        ci4         = cimle4,
+        params      = params,
+        fitted      = pmle,
+        nh          = nhmle,
+        nl          = nlmle,
+        x           = x,
+        xo          = xo,
+        log_yo      = log_yo
+    )
     return cv_data
 
 
-def generate_autobvalue(cv_method, fmd_data):
+def bootstrap_unc(b_bs):
+    """
+    a function to summarize the b-values of bootstrap samples, with the same rounding as the curve fitting methods.
+
+    :param b_bs (array): b-value of each bootstrap sample. NaN samples are left out
+    :return:
+    unc (float): standard deviation of the bootstrap b-values
+    ci2 (float): lower bound of the 95% percentile interval, for the slope (-b) like the fitting methods
+    ci4 (float): upper bound of the 95% percentile interval, for the slope (-b)
+    """
+
+    b_bs = np.asarray(b_bs, dtype=float)
+    b_bs = b_bs[~np.isnan(b_bs)]
+    if len(b_bs) < 2:
+        return np.nan, np.nan, np.nan
+    lo, hi = np.percentile(b_bs, [2.5, 97.5])
+    return round(100*np.std(b_bs))/100, round(-100*hi, 3)/100, round(-100*lo, 3)/100
+
+
+@timed('generate_autobvalue')
+def generate_autobvalue(cv_method, fmd_data, backend='statsmodels', start_params=None, keep_model=False, mbin=0.1):
     """
     a function to calculate b-value, its uncertainty and its 95% confidence interval 
     based on what curve fitting method that we use.
     
-    :param cv_method (string): curve fitting method. options are 'b-value-pois', 'b-value glin', and 'b-value glog'.
+    :param cv_method (string): curve fitting method. options are 'b-value-pois', 'b-value glin', 'b-value glog',
+    and 'b-value mle'.
     :param fmd_data (dictionary): a dictionary containing x, xo, and log10(yo) and one of these dataframes:
      1. dataframe containing x and y
      2. dataframe containing x, xo, and log10(yo)
+    'b-value mle' uses mag_bvalue, or mval_bvalue and mcount_bvalue, and falls back to the binned FMD (x, y)
+    without them
+    :param backend (string): 'statsmodels', or 'numpy' for the lightweight fitters glm_irls() and ols_line()
+    :param start_params (array): intercept and slope to start the GLM fits from, e.g. a previous solution
+    :param keep_model (bool): if True, the fitted model (e.g. statsmodels results) is kept in cv_data
+    :param mbin (float): magnitude bin width, used by 'b-value mle'
     :return:
-    cv_data (dictionary): a dictionary containing b-value, its uncertainty, its 95% confidence interval, etc.
+    cv_data (CVResult): b-value, its uncertainty, its 95% confidence interval, etc., also readable as a dictionary.
+    when fmd_data has bootstrap b-values of the same method (fmd_details() with cv_method), their spread is added
+    as unc_bs, ci2_bs and ci4_bs
     """
     
+    check_cv_method(cv_method, backend)
+    # the numpy backend reads x, y, xo, yo and log_yo directly and does not need the dataframes
+    d1 = fmd_data['d1'] if backend == 'statsmodels' else fmd_data
+    d2 = fmd_data['d2'] if backend == 'statsmodels' else fmd_data
+    log_yo = fmd_data['log_yo']
+    if cv_method == "b-value pois":
+        cv_data = fit_data_with_poisson(d1, fmd_data['x'], fmd_data['xo'], log_yo, backend, start_params,
+                                        keep_model)
+    elif cv_method == "b-value glin":
+        cv_data = fit_data_with_gaussian_glm(d2, fmd_data['x'], fmd_data['xo'], log_yo, backend, start_params,
+                                             keep_model)
+    elif cv_method == "b-value glog":
+        cv_data = fit_data_with_gaussian_lm(d2, fmd_data['x'], fmd_data['xo'], log_yo, backend, keep_model)
+    elif cv_method == "b-value mle":
+        if fmd_data.get('mag_bvalue') is not None:
+            mag, counts, mc = fmd_data['mag_bvalue'], None, fmd_data['mc']
+        elif fmd_data.get('mval_bvalue') is not None:
+            mag, counts, mc = fmd_data['mval_bvalue'], fmd_data['mcount_bvalue'], fmd_data['mc']
+        else:
+            # bin x holds the magnitudes in (x, x+mbin], so the binned magnitudes start one bin above Mc
+            mag, counts, mc = fmd_data['x'] + mbin, fmd_data['y'], fmd_data['x'][0] + mbin
+        cv_data = fit_data_with_mle(mag, fmd_data['x'], fmd_data['y'], fmd_data['xo'], log_yo, mc, mbin, counts)
+    if fmd_data.get('b_bs') is not None and fmd_data.get('cv_method') == cv_method:
+        cv_data.unc_bs, cv_data.ci2_bs, cv_data.ci4_bs = bootstrap_unc(fmd_data['b_bs'])
+    return cv_data
+
+
+
+def stack_fmd(fmds):
+    """
+    a function to stack frequency-magnitude distributions of different lengths into padded arrays for
+    generate_autobvalue_batch().
+
+    :param fmds (list): (x, y) of every FMD, e.g. fmd_data['x'] and fmd_data['y']
+    :return:
+    x (array): magnitude bins, one row per FMD
+    y (array): noncumulative magnitude frequency, one row per FMD
+    mask (array): True where a bin belongs to the FMD, False for padding
+    """
+
+    nbin = max([len(elem[0]) for elem in fmds], default=0)
+    x = np.zeros((len(fmds), nbin))
+    y = np.zeros((len(fmds), nbin))
+    mask = np.zeros((len(fmds), nbin), dtype=bool)
+    for i, (xi, yi) in enumerate(fmds):
+        x[i, :len(xi)] = xi
+        y[i, :len(yi)] = yi
+        mask[i, :len(xi)] = True
+    return x, y, mask
+
+
+def glm_irls_batch(x, y, mask, family, start_params=None, maxiter=100, tol=1e-12):
+    """
+    a function to fit y = exp(a + b*x) to many FMDs at once, the same as glm_irls() on every row. all rows are
+    updated together by solving their 2x2 weighted least squares systems in closed form, and rows stop being
+    updated once they have converged.
+
+    :param x (array): x, one row per FMD
+    :param y (array): y, one row per FMD
+    :param mask (array): True where a bin is used in the fit
+    :param family (string): 'poisson' for Poisson residual with log link, 'gaussian' for Gaussian residual with
+    log link
+    :param start_params (array): intercept and slope to start from, one row per FMD
+    :param maxiter (int): maximum number of iterations
+    :param tol (float): tolerance on the relative change of deviance
+    :return:
+    fit (dict): params, bse and conf_int (95%) of the slope, fittedvalues, nbin, one entry or row per FMD
+    """
+
+    w0 = mask.astype(float)
+    n = w0.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        if start_params is None:
+            ymean = (y*w0).sum(axis=1)/n
+            eta = np.log(np.where(mask, (y + ymean[:, None])/2, 1))
+        else:
+            start_params = np.asarray(start_params, dtype=float)
+            eta = start_params[:, :1] + start_params[:, 1:]*x
+        mu = np.exp(eta)
+        params = np.full((len(x), 2), np.nan)
+        dev = np.full(len(x), np.inf)
+        active = n > 2
+        for nit in range(maxiter):
+            z = np.where(mask, eta + (y - mu)/mu, 0)
+            w = w0*(mu if family == 'poisson' else mu**2)
+            s0, s1, s2 = w.sum(axis=1), (w*x).sum(axis=1), (w*x**2).sum(axis=1)
+            t0, t1 = (w*z).sum(axis=1), (w*x*z).sum(axis=1)
+            det = s0*s2 - s1**2
+            a = (s2*t0 - s1*t1)/det
+            b = (s0*t1 - s1*t0)/det
+            params[active] = np.column_stack([a, b])[active]
+            eta = np.where(active[:, None], params[:, :1] + params[:, 1:]*x, eta)
+            mu = np.exp(eta)
+            if family == 'poisson':
+                ylogy = np.where(y > 0, y*np.log(np.where(y > 0, y, 1)/mu), 0)
+                dev_new = 2*(w0*(ylogy - (y - mu))).sum(axis=1)
+            else:
+                dev_new = (w0*(y - mu)**2).sum(axis=1)
+            active &= ~(np.abs(dev_new - dev) <= tol*np.maximum(np.abs(dev_new), 1))
+            dev = dev_new
+            if not active.any():
+                break
+
+        w = w0*(mu if family == 'poisson' else mu**2)
+        s0, s1, s2 = w.sum(axis=1), (w*x).sum(axis=1), (w*x**2).sum(axis=1)
+        scale = 1. if family == 'poisson' else (w0*(y - mu)**2).sum(axis=1)/(n - 2)
+        bse = np.sqrt(scale*s0/(s0*s2 - s1**2))
+    q = stats.norm.ppf(0.975)
+    fit = {
+        'params'        : params,
+        'bse'           : bse,
+        'conf_int'      : np.column_stack([params[:, 1] - q*bse, params[:, 1] + q*bse]),
+        'fittedvalues'  : np.where(mask, mu, np.nan),
+        'nbin'          : n
+    }
+    return fit
+
+
+def ols_line_batch(x, y, mask):
+    """
+    a function to fit y = a + b*x to many FMDs at once by ordinary least squares, the same as ols_line() on every
+    row.
+
+    :param x (array): x, one row per FMD
+    :param y (array): y, one row per FMD
+    :param mask (array): True where a bin is used in the fit
+    :return:
+    fit (dict): params, bse and conf_int (95%) of the slope, fittedvalues, nbin, one entry or row per FMD
+    """
+
+    w0 = mask.astype(float)
+    n = w0.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xm = (w0*x).sum(axis=1)/n
+        ym = (w0*y).sum(axis=1)/n
+        dx = w0*(x - xm[:, None])
+        sxx = (dx**2).sum(axis=1)
+        b = (dx*(y - ym[:, None])).sum(axis=1)/sxx
+        a = ym - b*xm
+        fitted = a[:, None] + b[:, None]*x
+        scale = (w0*(y - fitted)**2).sum(axis=1)/(n - 2)
+        bse = np.sqrt(scale/sxx)
+        q = stats.t.ppf(0.975, n - 2)
+    fit = {
+        'params'        : np.column_stack([a, b]),
+        'bse'           : bse,
+        'conf_int'      : np.column_stack([b - q*bse, b + q*bse]),
+        'fittedvalues'  : np.where(mask, fitted, np.nan),
+        'nbin'          : n
+    }
+    return fit
+
+
+def aki_utsu_batch(m, w, mask, mc, mbin):
+    """
+    a function to calculate the maximum likelihood b-value of many sets of magnitudes at once (see aki_utsu()).
+
+    :param m (array): distinct magnitudes, one row per set
+    :param w (array): number of times each magnitude occurs, one row per set
+    :param mask (array): True where a magnitude belongs to the set
+    :param mc (array): magnitude of completeness of every set
+    :param mbin (float): magnitude bin width
+    :return:
+    fit (dict): b-value, its Shi & Bolt uncertainty (sd), params and conf_int (95%) of the slope and nbev, one
+    entry or row per set
+    """
+
+    w = np.where(mask, w, 0)
+    nbev = w.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = (w*m).sum(axis=1)/nbev
+        ssd = (w*(m - mean[:, None])**2).sum(axis=1)
+    b, sd = aki_utsu(nbev, mean, ssd, mc, mbin)
+    q = NormalDist().inv_cdf(0.975)
+    fit = {
+        'bvalue'        : b,
+        'sd'            : sd,
+        'params'        : np.column_stack([np.full(len(m), np.nan), -b*math.log(10)]),
+        'conf_int'      : np.column_stack([-b - q*sd, -b + q*sd]),
+        'nbev'          : nbev
+    }
+    return fit
+
+
+def generate_autobvalue_batch(cv_method, x, y, mask, start_params=None, mbin=0.1, mc=None):
+    """
+    a function to calculate b-value, its uncertainty and its 95% confidence interval of many FMDs at once with
+    the same curve fitting method. it gives the same numbers as generate_autobvalue on every FMD, without building
+    dataframes or statsmodels models.
+
+    :param cv_method (string): curve fitting method. options are 'b-value pois', 'b-value glin', 'b-value glog',
+    and 'b-value mle'.
+    :param x (array): magnitude bins, one row per FMD (see stack_fmd())
+    :param y (array): noncumulative magnitude frequency, one row per FMD
+    :param mask (array): True where a bin belongs to the FMD
+    :param start_params (array): intercept and slope to start the GLM fits from, one row per FMD
+    :param mbin (float): magnitude bin width, used by 'b-value mle'
+    :param mc (array): magnitude of completeness of every row, used by 'b-value mle'. when it is given, x and y are
+    the distinct magnitudes between Mc and maxmag and their counts, e.g. from np.unique(fmd_data['mag_bvalue']).
+    otherwise they are the binned FMDs, where bin x holds the magnitudes in (x, x+mbin], so the magnitudes are
+    taken at x+mbin and start one bin above Mc
+    :return:
+    cv_data (dictionary): b-value, its uncertainty, the bounds of its 95% confidence interval (ci2, ci4) and the
+    fitted intercept and slope, one entry or row per FMD. FMDs with fewer than 3 bins to fit (fewer than 2 events
+    for 'b-value mle') are given NaN
+    """
+
+    check_cv_method(cv_method)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
     if cv_method == "b-value pois":
-        cv_data = fit_data_with_poisson(fmd_data['d1'], fmd_data['x'], fmd_data['xo'], fmd_data['log_yo'])
+        fit = glm_irls_batch(x, y, mask, 'poisson', start_params)
     elif cv_method == "b-value glin":
-        cv_data = fit_data_with_gaussian_glm(fmd_data['d2'], fmd_data['x'], fmd_data['xo'], fmd_data['log_yo'])
+        fit = glm_irls_batch(x, y, mask & (y > 0), 'gaussian', start_params)
     elif cv_method == "b-value glog":
-        cv_data = fit_data_with_gaussian_lm(fmd_data['d2'], fmd_data['x'], fmd_data['xo'], fmd_data['log_yo'])
+        with np.errstate(divide='ignore'):
+            fit = ols_line_batch(x, np.log10(np.where(y > 0, y, 1)), mask & (y > 0))
+    elif cv_method == "b-value mle":
+        if mc is None:
+            fit = aki_utsu_batch(x + mbin, y, mask, x[:, 0] + mbin, mbin)
+        else:
+            fit = aki_utsu_batch(x, y, mask, np.asarray(mc, dtype=float), mbin)
+
+    # same rounding as the single-FMD fitting functions
+    if cv_method == "b-value glog":
+        bvalue = np.round(-1*fit['params'][:, 1], 2)
+        ci2, ci4 = fit['conf_int'][:, 0], fit['conf_int'][:, 1]
+    elif cv_method == "b-value mle":
+        bvalue = np.round(fit['bvalue'], 2)
+        ci2 = np.round(100*fit['conf_int'][:, 0], 3)/100
+        ci4 = np.round(100*fit['conf_int'][:, 1], 3)/100
+    else:
+        bvalue = np.round(-1*fit['params'][:, 1]/math.log(10), 2)
+        ci2 = np.round(100*fit['conf_int'][:, 0]/math.log(10), 3)/100
+        ci4 = np.round(100*fit['conf_int'][:, 1]/math.log(10), 3)/100
+    unc = np.round(100*(ci4 - ci2)/2)/100
+    if cv_method == "b-value mle":
+        unc = np.round(100*fit['sd'])/100
+
+    bad = fit['nbev'] <= 1 if cv_method == "b-value mle" else fit['nbin'] <= 2
+    cv_data = {
+        'bvalue'    : np.where(bad, np.nan, bvalue),
+        'unc'       : np.where(bad, np.nan, unc),
+        'ci2'       : np.where(bad, np.nan, ci2),
+        'ci4'       : np.where(bad, np.nan, ci4),
+        'params'    : fit['params']
+    }
     return cv_data
@@ -0,0 +1,325 @@
+import numpy as np
+from scipy.spatial import cKDTree
+from library.mag_of_completeness import magnitude_values
+from library.profiling import stage, timed
+
+
+EARTH_RADIUS = 6371.0
+
+# distance (km) and time (days) windows of a mainshock of magnitude m
+GK_WINDOWS = {
+    'gardner-knopoff': lambda m: (10**(0.1238*m + 0.983),
+                                  np.where(m >= 6.5, 10**(0.032*m + 2.7389), 10**(0.5409*m - 0.547))),
+    'gruenthal': lambda m: (np.exp(1.77 + np.sqrt(0.037 + 1.02*m)),
+                            np.where(m >= 6.5, 10**(2.8 + 0.024*m), np.abs(np.exp(-3.95 + np.sqrt(0.62 + 17.32*m))))),
+    'uhrhammer': lambda m: (np.exp(-1.024 + 0.804*m), np.exp(-2.87 + 1.235*m))
+}
+
+
+def event_points(catalog, coor='lon/lat', scale=1.0):
+    """
+    a function to get the epicenters of a catalog as points in km, for the neighbour searches of the declustering.
+    longitude and latitude are placed on a sphere, where the straight-line distance is the great-circle distance
+    to well below a metre for the windows used here.
+
+    :param catalog (dict or dataframe): seismic catalog containing earthquake locations (x,y,z) and magnitudes (m)
+    :param coor (str): coordinate system of X and Y, 'lon/lat' (degrees) or 'utm'
+    :param scale (float): km per unit of X and Y for 'utm', e.g. 0.001 for metres
+    :return:
+    points (array): one row per event
+    """
+
+    x = np.asarray(catalog['X'], dtype=float)
+    y = np.asarray(catalog['Y'], dtype=float)
+    if coor == 'lon/lat':
+        lon, lat = np.radians(x), np.radians(y)
+        return EARTH_RADIUS*np.column_stack([np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)])
+    elif coor == 'utm':
+        return scale*np.column_stack([x, y])
+    else:
+        raise ValueError("unknown coor %r, options are 'lon/lat' and 'utm'" % coor)
+
+
+def event_days(time, time_scale=1.0):
+    """
+    a function to convert event times to days.
+
+    :param time (array): event times, datetime64 or numbers
+    :param time_scale (float): days per unit of numeric times, e.g. 365.25 for decimal years
+    :return:
+    days (array): time of every event in days
+    """
+
+    time = np.asarray(time)
+    if np.issubdtype(time.dtype, np.datetime64):
+        return (time - time.min())/np.timedelta64(1, 'D')
+    return time.astype(float)*time_scale
+
+
+def window_pairs(src, points, tree, torder, lo, hi, dist, rank, flagged, maxpairs=2**22, maxslice=4096):
+    """
+    a function to find the events in the space-time windows of several mainshocks. a window whose time range holds
+    few events is searched by comparing the events of that time range, all such windows at once. a window with a
+    long time range is searched with the spatial KD-tree and the candidates are filtered by time. only events that
+    are not flagged yet and come after the mainshock in the processing order are returned.
+
+    :param src (array): indices of the mainshocks
+    :param points (array): event locations in km
+    :param tree (cKDTree): KD-tree over points
+    :param torder (array): event indices in time order
+    :param lo (array): first position in time order of the window of every event
+    :param hi (array): position in time order after the window of every event
+    :param dist (array): distance window of every event
+    :param rank (array): processing order of every event
+    :param flagged (array): True for events already assigned to a mainshock
+    :param maxpairs (int): maximum number of event pairs compared at once
+    :param maxslice (int): longest time range searched by comparing all its events
+    :return:
+    src (array): mainshock of every pair
+    dst (array): event in the window of the mainshock
+    """
+
+    pairs = []
+    count = hi[src] - lo[src]
+    short = count <= maxslice
+
+    # short time ranges, compared in blocks of at most maxpairs pairs
+    s = src[short]
+    c = count[short]
+    ends = np.cumsum(c)
+    start = 0
+    while start < len(s):
+        stop = max(start + 1, np.searchsorted(ends, (ends[start-1] if start else 0) + maxpairs, side='right'))
+        si, ci = s[start:stop], c[start:stop]
+        i = np.repeat(si, ci)
+        offset = np.arange(ci.sum()) - np.repeat(np.cumsum(ci) - ci, ci)
+        j = torder[np.repeat(lo[si], ci) + offset]
+        keep = ~flagged[j] & (rank[j] > rank[i])
+        i, j = i[keep], j[keep]
+        keep = ((points[j] - points[i])**2).sum(axis=1) <= dist[i]**2
+        pairs.append((i[keep], j[keep]))
+        start = stop
+
+    # long time ranges, through the spatial index
+    s = src[~short]
+    if len(s):
+        pos = np.empty(len(torder), dtype=np.int64)
+        pos[torder] = np.arange(len(torder))
+        for i, cand in zip(s, tree.query_ball_point(points[s], dist[s], workers=-1)):
+            j = np.asarray(cand, dtype=np.int64)
+            j = j[(pos[j] >= lo[i]) & (pos[j] < hi[i]) & ~flagged[j] & (rank[j] > rank[i])]
+            pairs.append((np.full(len(j), i), j))
+
+    if not pairs:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    src, dst = (np.concatenate(elem) for elem in zip(*pairs))
+    return src, dst
+
+
+def gardner_knopoff(points, days, mag, window='gardner-knopoff', foreshocks=0., maxpairs=2**22):
+    """
+    a function to decluster a catalog with the windows of Gardner and Knopoff (1974). events are processed from
+    the largest magnitude down, and every event that is not yet part of a cluster takes the events within its
+    distance and time windows that are not yet part of a cluster. the events of one magnitude level (0.1) are
+    processed together (see window_pairs()), and only chains of windows between events of the same level are
+    resolved one by one, which gives the same result as processing the events one at a time.
+
+    :param points (array): event locations in km (see event_points())
+    :param days (array): event times in days (see event_days())
+    :param mag (array): event magnitudes
+    :param window (str): window formula, 'gardner-knopoff', 'gruenthal' or 'uhrhammer' (see GK_WINDOWS)
+    :param foreshocks (float): length of the time window before a mainshock, as a fraction of its time window
+    :param maxpairs (int): maximum number of event pairs compared at once
+    :return:
+    mask (array): True for mainshocks and single events
+    cluster (array): index of the mainshock of every event, the event itself for mainshocks and single events
+    """
+
+    n = len(mag)
+    dist, duration = GK_WINDOWS[window](mag)
+    torder = np.argsort(days, kind='stable')
+    tsorted = days[torder]
+    lo = np.searchsorted(tsorted, days - foreshocks*duration, side='left')
+    hi = np.searchsorted(tsorted, days + duration, side='right')
+    order = np.lexsort((days, -mag))
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n)
+    tree = cKDTree(points)
+
+    flagged = np.zeros(n, dtype=bool)
+    active = np.ones(n, dtype=bool)
+    cluster = np.arange(n)
+    level = np.round(mag[order], 1)
+    bounds = np.flatnonzero(np.r_[True, level[1:] != level[:-1], True])
+    for r0, r1 in zip(bounds[:-1], bounds[1:]):
+        group = order[r0:r1]
+        src, dst = window_pairs(group[~flagged[group]], points, tree, torder, lo, hi, dist, rank, flagged,
+                                maxpairs)
+
+        # an event of this level in the window of an earlier one of the same level is only a mainshock if no
+        # mainshock before it has taken it
+        inlevel = rank[dst] < r1
+        if inlevel.any():
+            csrc, cdst = src[inlevel], dst[inlevel]
+            csort = np.argsort(rank[cdst], kind='stable')
+            csrc, cdst = csrc[csort], cdst[csort]
+            split = np.flatnonzero(np.r_[True, cdst[1:] != cdst[:-1], True])
+            for a, b in zip(split[:-1], split[1:]):
+                active[cdst[a]] = not active[csrc[a:b]].any()
+        keep = active[src]
+        src, dst = src[keep], dst[keep]
+
+        # an event in the windows of several mainshocks goes to the first one
+        first = np.lexsort((rank[src], dst))
+        src, dst = src[first], dst[first]
+        start = np.r_[True, dst[1:] != dst[:-1]] if len(dst) else np.zeros(0, dtype=bool)
+        flagged[dst[start]] = True
+        cluster[dst[start]] = src[start]
+    return ~flagged, cluster
+
+
+def eta_threshold(log_eta, niter=200, nbins=400):
+    """
+    a function to find the threshold between clustered and background events in the nearest-neighbour distances
+    by fitting a mixture of two normal distributions to log10(eta) and taking the point between the two means
+    where both components are equally likely. the mixture is fitted to a histogram of log10(eta), so the cost does
+    not grow with the catalog.
+
+    :param log_eta (array): log10 of the nearest-neighbour distances
+    :param niter (int): number of EM iterations
+    :param nbins (int): number of histogram bins
+    :return:
+    log_eta0 (float): log10 of the threshold
+    """
+
+    counts, edges = np.histogram(log_eta[np.isfinite(log_eta)], bins=nbins)
+    x = (edges[1:] + edges[:-1])/2
+    total = counts.sum()
+    cum = np.cumsum(counts)/total
+    mu = x[np.searchsorted(cum, [0.25, 0.75])]
+    sd = np.full(2, np.sqrt((counts*(x - (counts*x).sum()/total)**2).sum()/total))
+    w = np.full(2, 0.5)
+    for _ in range(niter):
+        pdf = w/sd*np.exp(-0.5*((x[:, None] - mu)/sd)**2)
+        resp = counts[:, None]*pdf/np.maximum(pdf.sum(axis=1, keepdims=True), 1e-300)
+        nk = resp.sum(axis=0)
+        w = nk/total
+        mu = (resp*x[:, None]).sum(axis=0)/nk
+        sd = np.maximum(np.sqrt((resp*(x[:, None] - mu)**2).sum(axis=0)/nk), 1e-6)
+    grid = np.linspace(mu.min(), mu.max(), 1001)
+    pdf = w/sd*np.exp(-0.5*((grid[:, None] - mu)/sd)**2)
+    diff = pdf[:, np.argmin(mu)] - pdf[:, np.argmax(mu)]
+    return grid[np.argmax(diff <= 0)]
+
+
+def nearest_neighbour(points, days, mag, bvalue=1.0, df=1.6, eta0=None, k=16, rmin=0.1, chunk=2**15):
+    """
+    a function to decluster a catalog with the nearest-neighbour distances of Zaliapin and Ben-Zion (2013). the
+    parent of every event is the earlier event i with the smallest eta = t * r**df * 10**(-bvalue*m_i), with t in
+    years and r in km. events linked to their parent with eta below eta0 form clusters, and the largest event of
+    every cluster is its mainshock. instead of all earlier events, the candidate parents of an event are its k
+    nearest events and k nearest of the largest 1% of events, from KD-trees, and the k events right before it in
+    time order, which finds the parent of nearly every clustered event.
+
+    :param points (array): event locations in km (see event_points())
+    :param days (array): event times in days (see event_days())
+    :param mag (array): event magnitudes
+    :param bvalue (float): b-value in eta
+    :param df (float): fractal dimension of the epicenters
+    :param eta0 (float): threshold of eta. if None, it is estimated with eta_threshold()
+    :param k (int): number of candidate parents of every event from each search
+    :param rmin (float): smallest distance in km, for events at the same location
+    :param chunk (int): number of events searched at once
+    :return:
+    mask (array): True for mainshocks and single events
+    cluster (array): index of the mainshock of every event, the event itself for mainshocks and single events
+    eta (array): nearest-neighbour distance of every event, inf for events without an earlier neighbour
+    parent (array): nearest neighbour of every event, -1 for events without an earlier neighbour
+    eta0 (float): threshold of eta
+    """
+
+    n = len(mag)
+    years = days/365.25
+    scale = 10**(-bvalue*mag)
+    tree = cKDTree(points)
+    large = np.argsort(mag, kind='stable')[-max(min(k, n), n//100):]
+    tree_large = cKDTree(points[large])
+    torder = np.argsort(days, kind='stable')
+    pos = np.empty(n, dtype=np.int64)
+    pos[torder] = np.arange(n)
+    before = np.arange(1, min(k, n) + 1)
+
+    eta = np.full(n, np.inf)
+    parent = np.full(n, -1)
+    for start in range(0, n, chunk):
+        child = np.arange(start, min(start + chunk, n))
+        dnear, near = tree.query(points[child], k=min(k, n), workers=-1)
+        dlarge, ilarge = tree_large.query(points[child], k=min(k, len(large)), workers=-1)
+        prev = torder[np.maximum(pos[child, None] - before, 0)]
+        dprev = np.sqrt(((points[child, None, :] - points[prev])**2).sum(axis=2))
+        cand = np.hstack([near.reshape(len(child), -1), large[ilarge].reshape(len(child), -1), prev])
+        r = np.hstack([dnear.reshape(len(child), -1), dlarge.reshape(len(child), -1), dprev])
+        dt = years[child, None] - years[cand]
+        value = np.where(dt > 0, dt*np.maximum(r, rmin)**df*scale[cand], np.inf)
+        best = np.argmin(value, axis=1)
+        eta[child] = value[np.arange(len(child)), best]
+        parent[child] = np.where(np.isfinite(eta[child]), cand[np.arange(len(child)), best], -1)
+
+    with np.errstate(divide='ignore'):
+        log_eta = np.log10(eta)
+    eta0 = 10**eta_threshold(log_eta) if eta0 is None else eta0
+
+    # parents are earlier in time, so following the strong links always ends at the first event of the cluster
+    root = np.where((eta < eta0) & (parent >= 0), parent, np.arange(n))
+    while True:
+        nxt = root[root]
+        if np.array_equal(nxt, root):
+            break
+        root = nxt
+    order = np.lexsort((days, -mag))
+    roots, first = np.unique(root[order], return_index=True)
+    mainshock = np.empty(n, dtype=np.int64)
+    mainshock[roots] = order[first]
+    cluster = mainshock[root]
+    return cluster == np.arange(n), cluster, eta, parent, eta0
+
+
+@timed('decluster')
+def decluster(catalog, method='gk', time_col='T', coor='lon/lat', scale=1.0, time_scale=1.0, **kwargs):
+    """
+    a function to separate mainshocks from foreshocks and aftershocks before estimating Mc and b-value. the
+    catalog needs event times (see load_catalog(time_col=...)). the mask it returns selects the mainshocks, e.g.
+    fmd_details(catalog['M'][mask], ...), select_region(catalog, poly, mask=mask) or
+    bvalue_map(catalog, nodes, ..., mask=mask).
+
+    example:
+        catalog = load_catalog('catalogs/earthquakes.csv', time_col='T')
+        decluster_data = decluster(catalog, 'gk')
+        fmd_data = fmd_details(catalog['M'][decluster_data['mask']], 'maxc')
+
+    :param catalog (dict or dataframe): seismic catalog containing earthquake locations (x,y,z), magnitudes (m) and
+    times
+    :param method (str): 'gk' for the windows of Gardner and Knopoff (see gardner_knopoff()) or 'nn' for the
+    nearest-neighbour distances (see nearest_neighbour())
+    :param time_col (str): column with event times
+    :param coor (str): coordinate system of X and Y, 'lon/lat' (degrees) or 'utm' (see event_points())
+    :param scale (float): km per unit of X and Y for 'utm'
+    :param time_scale (float): days per unit of numeric times
+    :param kwargs: options of gardner_knopoff() or nearest_neighbour()
+    :return:
+    decluster_data (dict): mainshock mask (mask) and index of the mainshock of every event (cluster), for 'nn'
+    also eta, parent and eta0
+    """
+
+    with stage('index', len(catalog['M'])):
+        points = event_points(catalog, coor, scale)
+        days = event_days(catalog[time_col], time_scale)
+        mag = magnitude_values(catalog['M'])
+    if method == 'gk':
+        mask, cluster = gardner_knopoff(points, days, mag, **kwargs)
+        return {'mask': mask, 'cluster': cluster}
+    elif method == 'nn':
+        mask, cluster, eta, parent, eta0 = nearest_neighbour(points, days, mag, **kwargs)
+        return {'mask': mask, 'cluster': cluster, 'eta': eta, 'parent': parent, 'eta0': eta0}
+    else:
+        raise ValueError("unknown method %r, options are 'gk' and 'nn'" % method)
@@ -0,0 +1,36 @@
+import importlib
+
+
+class LazyModule:
+    """
+    a stand-in for a module that is imported on first attribute access, so that heavy dependencies (statsmodels,
+    scipy.stats, pandas) are only loaded by the processes that actually use them.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return '<lazy module %r (%s)>' % (self._name, state)
+
+
+def lazy_import(name):
+    """
+    a function to import a module lazily. the module is returned directly if it was already imported.
+
+    :param name (str): full name of the module, e.g. 'statsmodels.formula.api'
+    :return:
+    module (module or LazyModule)
+    """
+
+    import sys
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
@@ -1,6 +1,17 @@
 import numpy as np
-import pandas as pd
 import math
+from functools import cached_property
+from concurrent.futures import ProcessPoolExecutor
+from library.parallel import share_array, attach_array, release
+from library.lazy import lazy_import
+from library.results import FMDResult
+from library.curve_fitting_method import generate_autobvalue_batch, stack_fmd
+from library.profiling import stage, timed
+
+pd = lazy_import('pandas')
+
+# number of magnitudes converted and counted at once, which bounds the temporary arrays of a pass over a catalog
+MAG_CHUNK = 2**16
 
 
 def round_up(x):
@@ -15,9 +26,156 @@ def round_up(x):
     return math.ceil(x*10)/10
 
 
+def compact_magnitudes(mag, dtype=np.int16):
+    """
+    a function to store magnitudes in a compact dtype: float32, which keeps magnitudes with up to 3 decimals, or
+    int8/int16 holding tenths of magnitude units, which needs magnitudes with one decimal. every function of this
+    module reads magnitudes in these dtypes (see magnitude_values()) and gives the same results as with the float64
+    magnitudes. magnitudes that the dtype cannot hold exactly raise a ValueError instead of being rounded or
+    wrapped around.
+
+    :param mag (series): a series of earthquake magnitudes, in any supported dtype
+    :param dtype (dtype): np.float32, np.int16 or np.int8
+    :return:
+    compact (array): magnitudes in the compact dtype
+    """
+
+    dtype = np.dtype(dtype)
+    tenths = np.issubdtype(dtype, np.integer)
+    if (tenths and dtype.itemsize > 2) or not (tenths or dtype == np.float32):
+        raise ValueError("magnitudes are stored as float32, int8 or int16, not %s" % dtype)
+    mag = np.asarray(mag)
+    compact = np.empty(len(mag), dtype=dtype)
+    for i in range(0, len(mag), MAG_CHUNK):
+        values = magnitude_values(mag[i:i+MAG_CHUNK])
+        if tenths:
+            if np.isnan(values).any():
+                raise ValueError("NaN magnitudes cannot be stored in tenths")
+            codes = np.rint(values*10)
+            if not np.array_equal(codes/10, values):
+                raise ValueError("magnitudes with more than one decimal cannot be stored in tenths")
+            info = np.iinfo(dtype)
+            if len(codes) and (codes.min() < info.min or codes.max() > info.max):
+                raise ValueError("magnitudes outside [%g, %g] cannot be stored as %s"
+                                 % (info.min/10, info.max/10, dtype))
+            compact[i:i+MAG_CHUNK] = codes
+        else:
+            compact[i:i+MAG_CHUNK] = values
+            if not np.array_equal(magnitude_values(compact[i:i+MAG_CHUNK]), values, equal_nan=True):
+                raise ValueError("magnitudes with more than 3 decimals cannot be stored as float32")
+    return compact
+
+
+def magnitude_values(mag):
+    """
+    a function to get float64 magnitudes from magnitudes in any supported dtype. float64 arrays, memory-mapped or
+    not, are returned as they are without a copy. int8 and int16 magnitudes are tenths of magnitude units (see
+    compact_magnitudes()), and float32 magnitudes are rounded to 3 decimals, which gives back the float64 values
+    of magnitudes with up to 3 decimals. other dtypes are converted to float64.
+
+    :param mag (array): earthquake magnitudes
+    :return:
+    values (array): float64 magnitudes
+    """
+
+    mag = np.asarray(mag)
+    if mag.dtype == np.float64:
+        return mag
+    if np.issubdtype(mag.dtype, np.integer) and mag.dtype.itemsize <= 2:
+        return mag/10
+    if mag.dtype == np.float32:
+        return np.round(mag.astype(np.float64), 3)
+    return mag.astype(np.float64)
+
+
+def magnitude_chunks(mag, chunk=MAG_CHUNK):
+    """
+    a function to go over the magnitudes in float64 chunks (see magnitude_values()). the chunks are views of the
+    magnitudes where possible, so a pass over a catalog holds at most one chunk of temporary arrays.
+
+    :param mag (series): a series of earthquake magnitudes, in any supported dtype
+    :param chunk (int): number of magnitudes per chunk
+    :return:
+    chunks (generator): float64 magnitudes
+    """
+
+    mag = np.asarray(mag)
+    for i in range(0, len(mag), chunk):
+        yield magnitude_values(mag[i:i+chunk])
+
+
+def magnitude_hist(mag):
+    """
+    a function to get the histogram of distinct magnitudes, as np.unique(mag, return_counts=True) on the float64
+    magnitudes without NaN. the magnitudes are counted chunk by chunk (see accumulate_hist()), so they are not
+    sorted or converted as a whole. float64 magnitudes held in memory whose first chunk is mostly distinct values,
+    i.e. continuous magnitudes, are counted in one np.unique call instead, which is faster for them.
+
+    :param mag (series): a series of earthquake magnitudes, in any supported dtype
+    :return:
+    mval (array): distinct magnitudes in ascending order
+    mcount (array): number of times each distinct magnitude occurs
+    """
+
+    mapped = isinstance(mag, np.memmap)
+    mag = np.asarray(mag)
+    if mag.dtype == np.float64 and not mapped:
+        if len(mag) <= MAG_CHUNK or len(chunk_hist(mag[:MAG_CHUNK])[0]) > MAG_CHUNK//8:
+            return chunk_hist(mag)
+    return accumulate_hist(magnitude_chunks(mag))
+
+
+def top_magnitudes(mag):
+    """
+    a function to find the two largest distinct magnitudes in two passes over the magnitudes, without sorting them.
+    NaN magnitudes are left out.
+
+    :param mag (series): a series of earthquake magnitudes, in any supported dtype
+    :return:
+    max1 (float): largest magnitude
+    max2 (float): largest magnitude smaller than max1
+    """
+
+    max1 = max(np.max(chunk, where=~np.isnan(chunk), initial=-np.inf) for chunk in magnitude_chunks(mag))
+    max2 = max(np.max(chunk, where=chunk < max1, initial=-np.inf) for chunk in magnitude_chunks(mag))
+    if max2 == -np.inf:
+        raise ValueError("maximum magnitude needs at least two distinct magnitudes")
+    return max1, max2
+
+
+def fmd_counts(mag, m, lo=None, hi=None):
+    """
+    a function to count earthquakes above every magnitude bin in a single pass. each magnitude is given the
+    integer index of the first bin that is not smaller than it, so one bincount gives the noncumulative
+    frequency and a reversed cumulative sum gives the cumulative one. the magnitudes are counted chunk by chunk,
+    and NaN magnitudes are left out.
+
+    :param mag (series): a series of eartquake magnitudes, in any supported dtype (see magnitude_values())
+    :param m (array): magnitude bins (ascending)
+    :param lo (float): if given, only magnitudes between lo and hi (inclusive) are counted
+    :param hi (float): upper limit of the counted magnitudes, with lo
+    :return:
+    cum (array) : cumulative magnitude frequency, number of magnitudes > round(m, 1)
+    noncum (array) : noncumulative magnitude frequency
+    """
+
+    mbins = np.round(m, 1)
+    noncum = np.zeros(len(mbins)+1)
+    for chunk in magnitude_chunks(mag):
+        if lo is not None:
+            chunk = chunk[(chunk >= lo) & (chunk <= hi)]
+        else:
+            chunk = chunk[~np.isnan(chunk)]
+        noncum += np.bincount(np.searchsorted(mbins, chunk, side='left'), minlength=len(mbins)+1)
+    noncum = noncum[1:]
+    cum = np.cumsum(noncum[::-1])[::-1]
+    return cum, noncum
+
+
 def fmd(mag, mbin):
     """
-    a function to create frequency-magnitude distribution from a series of earthquake magnitudes.
+    a function to create frequency-magnitude distribution from a series of earthquake magnitudes. NaN magnitudes
+    are left out, as in every Mc method.
 
     :param mag (series): a series of eartquake magnitudes
     :param mbin (float): magnitude bin width
@@ -27,14 +185,13 @@ def fmd(mag, mbin):
     noncum (array) : noncumulative magnitude frequency
     """
 
-    m = np.arange(min(round(mag/mbin)*mbin), (max(round(mag/mbin)*mbin)+mbin), mbin)
-    nbm = len(m)
-    cum = np.zeros(nbm)
-    for i in range(nbm):
-        cum[i] = len(np.where(mag > round(m[i],1))[0])
-    cumnbmagtmp = list(cum)
-    cumnbmagtmp.append(0)
-    noncum = abs(np.diff(cumnbmagtmp))
+    # rounding to bins keeps the order, so the bins of the smallest and largest magnitudes bound all of them
+    lo = min(np.min(chunk, where=~np.isnan(chunk), initial=np.inf) for chunk in magnitude_chunks(mag))
+    hi = max(np.max(chunk, where=~np.isnan(chunk), initial=-np.inf) for chunk in magnitude_chunks(mag))
+    if lo > hi:
+        raise ValueError("no magnitudes to make a frequency-magnitude distribution from")
+    m = np.arange(np.round(lo/mbin)*mbin, np.round(hi/mbin)*mbin+mbin, mbin)
+    cum, noncum = fmd_counts(mag, m)
     return m, cum, noncum
 
 
@@ -58,7 +215,8 @@ def maxc(mag, mbin):
 
 def gft(mag, mbin):
     """
-    a function to estimate magnitude of completeness using Goodness-of-fit test method
+    a function to estimate magnitude of completeness using Goodness-of-fit test method. the magnitudes are sorted
+    once and every cutoff is evaluated from cumulative sums (see gft_batch()).
 
     :param mag (series): a series of eartquake magnitudes
     :param mbin (float): magnitude bin width
@@ -69,38 +227,16 @@ def gft(mag, mbin):
     R (array): residual
 
     """
-    
-    FMD = fmd(mag, mbin)
-    Mcbound = maxc(mag, mbin)[0]
-    Mco = Mcbound - 0.4 + (np.arange(1,16,1) - 1) / 10
-    Mco = [round(elem, 1) for elem in Mco]
-    R = np.zeros(len(Mco))
-    for i in range(len(R)):
-        indmag = np.where( mag > Mco[i]- mbin/2 )
-        b = math.log10(math.exp(1))/(np.mean(np.array(mag)[indmag])-(Mco[i] - mbin/2))
-        a = math.log10(len(np.array(indmag)[0]))+b*Mco[i]
-        fmd0 = [round(elem,1) for elem in FMD[0]]
-        FMDcum_model = 10**(a-[b*elem for elem in fmd0])
-        indmi = np.where(fmd0 >= Mco[i])
-        R[i] = sum(sum(abs(np.reshape(FMD[1][indmi],(1,len(FMDcum_model[indmi])))-FMDcum_model[indmi])))/sum(FMD[1][indmi])*100
-    indgft = np.array(list(np.where(R <= 5)))
-    if (len(indgft[0]) != 0):
-        Mc = Mco[indgft[0,0]]
-        best = "95%"
-    else:
-        indgft = np.array(list(np.where(R <= 10)))
-        if (len(indgft[0]) != 0):
-            Mc = Mco[indgft[0,0]]
-            best = "90%"
-        else:
-            Mc = Mcbound
-            best = "MAXC"
-    return Mc, best, Mco, R
+
+    mval, mcount = magnitude_hist(mag)
+    Mc, best, Mco, R = gft_batch(mval, mcount[None, :], mbin)
+    return Mc[0], best[0], list(Mco[0]), R[0]
 
 
 def mbs(mag, mbin):
     """
-    a function to estimate magnitude of completeness using Mc by b-value stability method
+    a function to estimate magnitude of completeness using Mc by b-value stability method. the magnitudes are
+    sorted once and every cutoff is evaluated from cumulative sums (see mbs_batch()).
 
     :param mag (series): a series of eartquake magnitudes
     :param mbin (float): magnitude bin width
@@ -112,30 +248,10 @@ def mbs(mag, mbin):
     bave (array) b-value average
 
     """
-    
-    Mcbound = round(maxc(mag, mbin)[0],1)
-    Mco = Mcbound - 0.7 + (np.arange(1,21,1) - 1) / 10
-    Mco = [round(elem,1) for elem in Mco]
-    bi = np.zeros(20)
-    unc = np.zeros(20)
-    for i in range(20):
-        indmag = np.where( mag > Mco[i]-mbin/2 )
-        nbev = len(np.array(indmag[0]))
-        bi[i] = math.log10(math.exp(1))/(np.mean(np.array(mag)[indmag])-(Mco[i]-mbin/2))
-        if nbev > 1:
-            unc[i] = 2.3*bi[i]**2*(sum((np.array(mag)[indmag]-np.mean(np.array(mag)[indmag]))**2)/(nbev*(nbev-1)))**(1/2)
-        else: unc[i] = np.nan
-    
-    n = 15    
-    bave = np.zeros(n)
-    for i in range(n):
-        bave[i] = np.mean(bi[i:i+(len(bi)-n)])
-    dbi = abs(bave[0:n]-bi[0:n])
-    indmbs = np.where(dbi <= unc[0:n])
-    if len(list(indmbs[0])) != 0:
-        Mc = Mco[list(indmbs[0])[0]]
-    else: Mc = np.nan    
-    return Mc, Mco, bi, unc, bave
+
+    mval, mcount = magnitude_hist(mag)
+    Mc, Mco, bi, unc, bave = mbs_batch(mval, mcount[None, :], mbin)
+    return Mc[0], list(Mco[0]), bi[0], unc[0], bave[0]
 
 
 def fmd_bvalue(mag, mc, maxmag, mbin):
@@ -154,35 +270,416 @@ def fmd_bvalue(mag, mc, maxmag, mbin):
     """
     
     x = np.arange(mc, maxmag, mbin)
-    nbm = len(x)
-    cum = np.zeros(nbm)
-    for i in range(nbm):
-        cum[i] = len(np.where(mag > round(x[i],1))[0])
-    cumnbmagtmp = list(cum)
-    cumnbmagtmp.append(0)
-    y = abs(np.diff(cumnbmagtmp))
+    cum, y = fmd_counts(mag, x)
     return x, cum, y
 
 
-def fmd_details(mag, mc_method, mbin=0.1, nbsample=200):
+def mag_in_range(mag, mc, maxmag):
     """
-    a function to generate FMD details including Mc and maximum magnitude that will be used for calculating b-value
+    a function to select the float64 magnitudes between Mc and maxmag (inclusive), chunk by chunk.
 
-    :param mag: a series of earthquake magnitudes
-    :param mc: magnitude of completeness
-    :param mbin: magnitude bin width
-    :param nbsample: number of bootstrap sample
+    :param mag (series): a series of earthquake magnitudes, in any supported dtype (see magnitude_values())
+    :param mc (float): magnitude of completeness
+    :param maxmag (float): maximum magnitude
     :return:
-    fmd_data (dict) : informations that will be used for calculating b-value and visualization
+    mag_bvalue (array): magnitudes between Mc and maxmag
     """
-    # pembentukan FMD
-    FMD = fmd(mag, mbin)
-    m = FMD[0]
-    cum = FMD[1]
-    noncum = FMD[2]
 
-    
-    # estimasi Mc
+    chunks = [chunk[(chunk >= mc) & (chunk <= maxmag)] for chunk in magnitude_chunks(mag)]
+    return np.concatenate(chunks) if chunks else np.zeros(0)
+
+
+def bootstrap_fmd(mag, nbsample, rng=None):
+    """
+    a function to draw all bootstrap samples of a series of earthquake magnitudes at once. resampling n magnitudes
+    with replacement is the same as drawing how many times each distinct magnitude is picked from a multinomial
+    distribution, so every bootstrap sample is kept as a row of counts instead of a resampled series.
+
+    :param mag (series): a series of eartquake magnitudes
+    :param nbsample (int): number of bootstrap sample
+    :param rng (Generator, int or None): random number generator or seed
+    :return:
+    mval (array): distinct magnitudes in ascending order
+    counts (array): number of times each distinct magnitude is drawn, one row per bootstrap sample
+    """
+
+    rng = np.random.default_rng(rng)
+    mval, mcount = magnitude_hist(mag)
+    counts = rng.multinomial(mcount.sum(), mcount/mcount.sum(), size=nbsample)
+    return mval, counts
+
+
+def tail_sums(mval, counts):
+    """
+    a function to get the cumulative sums from the top of the distinct magnitudes that tail_stats() reads the
+    number, mean and sum of squared deviations of the magnitudes above any threshold from.
+
+    :param mval (array): distinct magnitudes in ascending order
+    :param counts (array): number of times each distinct magnitude occurs, one row per sample
+    :return:
+    shift (float): magnitude the sums are taken around
+    tail (array): number, sum and sum of squares of the magnitudes from each distinct magnitude up, one row per
+    sample, with a zero column at the end
+    """
+
+    # magnitudes are shifted to their median so that the sums of squares do not lose precision
+    shift = mval[len(mval)//2]
+    dm = mval - shift
+    tail = np.zeros((3, counts.shape[0], counts.shape[1]+1))
+    tail[0, :, :-1] = np.cumsum(counts[:, ::-1], axis=1)[:, ::-1]
+    tail[1, :, :-1] = np.cumsum((counts*dm)[:, ::-1], axis=1)[:, ::-1]
+    tail[2, :, :-1] = np.cumsum((counts*dm**2)[:, ::-1], axis=1)[:, ::-1]
+    return shift, tail
+
+
+def tail_stats(mval, counts, thr, samples=None):
+    """
+    a function to get the number, mean and sum of squared deviations of magnitudes larger than the given thresholds
+    for several samples at once, using cumulative sums over the distinct magnitudes.
+
+    :param mval (array): distinct magnitudes in ascending order
+    :param counts (array): number of times each distinct magnitude occurs, one row per sample
+    :param thr (array): magnitude thresholds, one row per sample
+    :param samples (FMDSamples): shared precomputation of mval and counts, to reuse its cumulative sums
+    :return:
+    nbev (array): number of magnitudes > thr
+    mean (array): mean of magnitudes > thr
+    ssd (array): sum of squared deviations of magnitudes > thr from their mean
+    """
+
+    shift, tail = samples.tail if samples is not None else tail_sums(mval, counts)
+    ind = np.searchsorted(mval, thr, side='right')
+    nbev, s1, s2 = (np.take_along_axis(elem, ind, axis=1) for elem in tail)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = s1/nbev
+        ssd = np.maximum(s2 - s1*mean, 0)
+    return nbev, mean + shift, ssd
+
+
+def fmd_batch(mval, counts, mbin):
+    """
+    a function to create frequency-magnitude distributions of several samples at once. all samples share the
+    magnitude bins of the full distinct-magnitude range, and bins outside the range of each sample are flagged.
+
+    :param mval (array): distinct magnitudes in ascending order
+    :param counts (array): number of times each distinct magnitude occurs, one row per sample
+    :param mbin (float): magnitude bin width
+    :return:
+    m (array) : magnitude bins shared by all samples
+    cum (array) : cumulative magnitude frequency, one row per sample
+    noncum (array) : noncumulative magnitude frequency, one row per sample
+    inrange (array) : True for bins between the smallest and the largest magnitude bin of each sample
+    m0 (array) : first magnitude bin of each sample
+    """
+
+    r = np.round(mval/mbin)
+    m = np.arange(r[0]*mbin, r[-1]*mbin+2*mbin, mbin)
+    mbins = np.round(m, 1)
+
+    # every distinct magnitude adds to the noncumulative frequency of bin (ind - 1)
+    ind = np.searchsorted(mbins, mval, side='left')
+    noncum = np.zeros((counts.shape[0], len(m)+1))
+    start = np.flatnonzero(np.r_[True, np.diff(ind) != 0])
+    noncum[:, ind[start]] = np.add.reduceat(counts, start, axis=1)
+    noncum = noncum[:, 1:]
+    cum = np.cumsum(noncum[:, ::-1], axis=1)[:, ::-1]
+
+    # magnitude bins of every sample, as fmd() would make them from the sample alone. the number of bins follows
+    # np.arange, which may add one empty bin at the top
+    present = counts > 0
+    rlo = r[np.argmax(present, axis=1)]
+    rhi = r[len(r) - 1 - np.argmax(present[:, ::-1], axis=1)]
+    m0 = rlo*mbin
+    nbm = np.ceil(((rhi*mbin+mbin) - m0)/mbin).astype(int)
+    ilo = (rlo - r[0]).astype(int)
+    pos = np.arange(len(m))
+    inrange = (pos >= ilo[:, None]) & (pos < (ilo + nbm)[:, None])
+    return m, cum, noncum, inrange, m0
+
+
+class FMDSamples:
+    """
+    the precomputation that the Mc methods share for several samples of a histogram of distinct magnitudes: the
+    FMD of every sample (see fmd_batch()), their maxc Mc, and the cumulative sums read by tail_stats(). each one is
+    computed when it is first used and then kept, so methods evaluated on the same samples bin and sum the
+    magnitudes once. gft and mbs start from maxc, which is then computed once as well.
+    """
+
+    def __init__(self, mval, counts, mbin):
+        self.mval = mval
+        self.counts = counts
+        self.mbin = mbin
+
+    def __len__(self):
+        return len(self.counts)
+
+    @cached_property
+    def fmd(self):
+        return fmd_batch(self.mval, self.counts, self.mbin)
+
+    @cached_property
+    def maxc(self):
+        return maxc_batch(self.mval, self.counts, self.mbin, self)
+
+    @cached_property
+    def tail(self):
+        return tail_sums(self.mval, self.counts)
+
+    def tail_stats(self, thr):
+        return tail_stats(self.mval, self.counts, thr, self)
+
+
+def maxc_batch(mval, counts, mbin, samples=None):
+    """
+    a function to estimate magnitude of completeness of several samples at once using maximum curvature method
+
+    :param mval (array): distinct magnitudes in ascending order
+    :param counts (array): number of times each distinct magnitude occurs, one row per sample
+    :param mbin (float): magnitude bin width
+    :param samples (FMDSamples): shared precomputation of mval and counts
+    :return:
+    Mc (array): magnitude of completeness of each sample
+    """
+
+    m, cum, noncum, inrange, m0 = (samples if samples is not None else FMDSamples(mval, counts, mbin)).fmd
+    imax = np.argmax(np.where(inrange, noncum, -1), axis=1)
+    ilo = np.argmax(inrange, axis=1)
+    # same bin values as np.arange(m0, ..., mbin) in fmd()
+    Mc = m0 + (imax - ilo)*((m0 + mbin) - m0)
+    return Mc
+
+
+def gft_batch(mval, counts, mbin, samples=None):
+    """
+    a function to estimate magnitude of completeness of several samples at once using Goodness-of-fit test method
+
+    :param mval (array): distinct magnitudes in ascending order
+    :param counts (array): number of times each distinct magnitude occurs, one row per sample
+    :param mbin (float): magnitude bin width
+    :param samples (FMDSamples): shared precomputation of mval and counts
+    :return:
+    Mc (array): magnitude of completeness of each sample
+    best (array): best confidence level of each sample
+    Mco (array): magnitude cutoff, one row per sample
+    R (array): residual, one row per sample
+    """
+
+    samples = samples if samples is not None else FMDSamples(mval, counts, mbin)
+    m, cum, noncum, inrange, m0 = samples.fmd
+    Mcbound = samples.maxc
+    Mco = np.round(Mcbound[:, None] - 0.4 + (np.arange(1,16,1) - 1) / 10, 1)
+    nbev, mean, ssd = samples.tail_stats(Mco - mbin/2)
+    fmd0 = np.round(m, 1)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        b = math.log10(math.exp(1))/(mean - (Mco - mbin/2))
+        a = np.log10(nbev) + b*Mco
+        FMDcum_model = 10**(a[:, :, None] - b[:, :, None]*fmd0)
+        indmi = (fmd0 >= Mco[:, :, None]) & inrange[:, None, :]
+        R = (np.abs(cum[:, None, :] - FMDcum_model)*indmi).sum(axis=2)/(cum[:, None, :]*indmi).sum(axis=2)*100
+
+    Mc = Mcbound.copy()
+    best = np.full(len(Mc), "MAXC", dtype=object)
+    for level, lim in (("90%", 10), ("95%", 5)):
+        ok = R <= lim
+        found = ok.any(axis=1)
+        Mc[found] = Mco[found, np.argmax(ok[found], axis=1)]
+        best[found] = level
+    return Mc, best, Mco, R
+
+
+def mbs_batch(mval, counts, mbin, samples=None):
+    """
+    a function to estimate magnitude of completeness of several samples at once using Mc by b-value stability method
+
+    :param mval (array): distinct magnitudes in ascending order
+    :param counts (array): number of times each distinct magnitude occurs, one row per sample
+    :param mbin (float): magnitude bin width
+    :param samples (FMDSamples): shared precomputation of mval and counts
+    :return:
+    Mc (array): magnitude of completeness of each sample
+    Mco (array): magnitude cutoff, one row per sample
+    bi (array): b-value for each Mco, one row per sample
+    unc (array): b-value uncertainty for each Mco, one row per sample
+    bave (array) b-value average, one row per sample
+    """
+
+    samples = samples if samples is not None else FMDSamples(mval, counts, mbin)
+    Mcbound = np.round(samples.maxc, 1)
+    Mco = np.round(Mcbound[:, None] - 0.7 + (np.arange(1,21,1) - 1) / 10, 1)
+    nbev, mean, ssd = samples.tail_stats(Mco - mbin/2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bi = math.log10(math.exp(1))/(mean - (Mco - mbin/2))
+        unc = np.where(nbev > 1, 2.3*bi**2*(ssd/(nbev*(nbev-1)))**(1/2), np.nan)
+
+    n = 15
+    w = Mco.shape[1] - n
+    bave = np.stack([bi[:, i:i+w].mean(axis=1) for i in range(n)], axis=1)
+    dbi = abs(bave - bi[:, 0:n])
+    ok = dbi <= unc[:, 0:n]
+    found = ok.any(axis=1)
+    Mc = np.where(found, Mco[np.arange(len(Mco)), np.argmax(ok, axis=1)], np.nan)
+    return Mc, Mco, bi, unc, bave
+
+
+# Mc methods of the batched estimators by name. each takes the shared precomputation of several samples
+# (FMDSamples) and returns the Mc of every sample. more methods are added with register_mc_method()
+MC_METHODS = {
+    'maxc'  : lambda samples: samples.maxc,
+    'gft'   : lambda samples: gft_batch(samples.mval, samples.counts, samples.mbin, samples)[0],
+    'mbs'   : lambda samples: mbs_batch(samples.mval, samples.counts, samples.mbin, samples)[0]
+}
+
+
+def register_mc_method(name, func):
+    """
+    a function to add an Mc method to the batched estimators, so that it can be used by name in mc_ensemble(), the
+    batched bootstrap (mc_bootstrap_hist()) and the temporal b-value.
+
+    example:
+        register_mc_method('maxc+0.2', lambda samples: np.round(samples.maxc + 0.2, 1))
+
+    :param name (str): name of the method
+    :param func (callable): takes an FMDSamples and returns the Mc of every sample as an array. it can build on
+    samples.fmd, samples.maxc and samples.tail_stats(), which are shared with the other methods
+    :return:
+    func (callable)
+    """
+
+    MC_METHODS[name] = func
+    return func
+
+
+def mc_method_batch(mc_method):
+    """
+    a function to get a registered Mc method by name (see MC_METHODS).
+
+    :param mc_method (str): name of the method
+    :return:
+    func (callable): takes an FMDSamples and returns the Mc of every sample
+    """
+
+    try:
+        return MC_METHODS[mc_method]
+    except KeyError:
+        raise ValueError("unknown Mc method %r, options are %s" % (mc_method, ', '.join(MC_METHODS))) from None
+
+
+def bvalue_bootstrap_hist(mval, counts, mc, cv_method, mbin=0.1):
+    """
+    a function to estimate b-value of several bootstrap samples at once, each with its own Mc and maximum magnitude.
+    the FMDs between Mc and maxmag of the samples are fitted together with generate_autobvalue_batch().
+
+    :param mval (array): distinct magnitudes in ascending order
+    :param counts (array): number of times each distinct magnitude occurs, one row per sample
+    :param mc (array): magnitude of completeness of each sample
+    :param cv_method (string): curve fitting method. options are 'b-value pois', 'b-value glin', 'b-value glog',
+    and 'b-value mle'.
+    :param mbin (float): magnitude bin width
+    :return:
+    bvalue (array): b-value of each sample, not rounded. NaN where Mc or the fit cannot be estimated
+    """
+
+    mc = np.round(mc, 1)
+    nonzero = counts > 0
+    ok = ~np.isnan(mc) & (nonzero.sum(axis=1) >= 2)
+    if cv_method == "b-value mle":
+        # magnitudes above Mc are read directly, maxmag is above all of them
+        mask = (mval >= mc[:, None]) & ok[:, None]
+        cv_data = generate_autobvalue_batch(cv_method, np.broadcast_to(mval, counts.shape), counts, mask, mbin=mbin,
+                                            mc=mc)
+    else:
+        rows = np.flatnonzero(ok)
+        fmds = []
+        for i in rows:
+            max2, max1 = mval[nonzero[i]][-2:]
+            maxmag = round(max1 + (max1 - max2), 1)
+            x, cum, y = fmd_bvalue_hist(mval, counts[i], mc[i], maxmag, mbin)
+            fmds.append((x, y))
+        bvalue = np.full(len(counts), np.nan)
+        if not fmds:
+            return bvalue
+        fit = generate_autobvalue_batch(cv_method, *stack_fmd(fmds), mbin=mbin)
+        cv_data = {name: np.full((len(counts),) + fit[name].shape[1:], np.nan) for name in ('bvalue', 'params')}
+        for name in cv_data:
+            cv_data[name][rows] = fit[name]
+
+    slope = cv_data['params'][:, 1]
+    bvalue = -slope if cv_method == "b-value glog" else -slope/math.log(10)
+    return np.where(np.isnan(cv_data['bvalue']), np.nan, bvalue)
+
+
+def mc_bootstrap_hist(mval, mcount, mc_method, mbin=0.1, nbsample=200, rng=None, chunk=2**22, cv_method=None):
+    """
+    a function to estimate magnitude of completeness of many bootstrap samples of a magnitude histogram at once.
+    samples are drawn as multinomial counts of the distinct magnitudes and processed in blocks so that each block
+    holds about chunk magnitude counts. with cv_method, the b-value of every sample is also estimated from the same
+    resamples, with the sample's own Mc and maxmag (see bvalue_bootstrap_hist()).
+
+    :param mval (array): distinct magnitudes in ascending order
+    :param mcount (array): number of times each distinct magnitude occurs
+    :param mc_method (string): method for estimating Mc. options are 'maxc', 'mbs', 'gft', and the methods added
+    with register_mc_method().
+    :param mbin (float): magnitude bin width
+    :param nbsample (int): number of bootstrap sample
+    :param rng (Generator, int or None): random number generator or seed
+    :param chunk (int): maximum number of magnitude counts held in memory per block
+    :param cv_method (string): curve fitting method for the b-value of every sample, or None
+    :return:
+    mc_bootstrap (array): magnitude of completeness of each bootstrap sample
+    b_bootstrap (array): b-value of each bootstrap sample, only returned when cv_method is given
+    """
+
+    name = mc_method
+    mc_batch = mc_method_batch(mc_method)
+
+    rng = np.random.default_rng(rng)
+    step = max(1, chunk // len(mval))
+    mc = np.zeros(nbsample)
+    b = np.zeros(nbsample)
+    for i in range(0, nbsample, step):
+        with stage('resample', min(step, nbsample-i)):
+            counts = rng.multinomial(mcount.sum(), mcount/mcount.sum(), size=min(step, nbsample-i))
+        with stage(name, counts.size):
+            mc[i:i+step] = mc_batch(FMDSamples(mval, counts, mbin))
+        if cv_method is not None:
+            with stage('fit', len(counts)):
+                b[i:i+step] = bvalue_bootstrap_hist(mval, counts, mc[i:i+step], cv_method, mbin)
+    return mc if cv_method is None else (mc, b)
+
+
+def mc_bootstrap(mag, mc_method, mbin=0.1, nbsample=200, rng=None, chunk=2**22):
+    """
+    a function to estimate magnitude of completeness of many bootstrap samples at once (see mc_bootstrap_hist()).
+
+    :param mag (series): a series of eartquake magnitudes
+    :param mc_method (string): method for estimating Mc. options are 'maxc', 'mbs', and 'gft'.
+    :param mbin (float): magnitude bin width
+    :param nbsample (int): number of bootstrap sample
+    :param rng (Generator, int or None): random number generator or seed
+    :param chunk (int): maximum number of magnitude counts held in memory per block
+    :return:
+    mc_bootstrap (array): magnitude of completeness of each bootstrap sample
+    """
+
+    mval, mcount = magnitude_hist(mag)
+    return mc_bootstrap_hist(mval, mcount, mc_method, mbin, nbsample, rng, chunk)
+
+
+def mc_bootstrap_loop(mag, mc_method, mbin=0.1, nbsample=200, rng=None):
+    """
+    a function to estimate magnitude of completeness of bootstrap samples one by one, by resampling the magnitudes
+    and running the Mc method on every sample.
+
+    :param mag (series): a series of eartquake magnitudes
+    :param mc_method (string): method for estimating Mc. options are 'maxc', 'mbs', and 'gft'.
+    :param mbin (float): magnitude bin width
+    :param nbsample (int): number of bootstrap sample
+    :param rng (Generator, int or None): random number generator or seed. None uses numpy's global random state
+    :return:
+    mc_bootstrap (array): magnitude of completeness of each bootstrap sample
+    """
+
+    name = mc_method
     if mc_method == 'maxc':
         mc_method = maxc
     elif mc_method == 'mbs':
@@ -190,13 +687,119 @@ def fmd_details(mag, mc_method, mbin=0.1, nbsample=200):
     else:
         mc_method = gft
 
-    mc_bootstrap = np.zeros(nbsample)
+    mag = magnitude_values(mag)
+    mag = mag[~np.isnan(mag)]
+    choice = np.random.choice if rng is None else np.random.default_rng(rng).choice
+    mc = np.zeros(nbsample)
     for i in range(nbsample):
-        magbs = pd.Series(np.random.choice(mag, size=len(mag)))
-        mc_bootstrap[i] = mc_method(magbs, mbin)[0]
+        with stage('resample', len(mag)):
+            magbs = pd.Series(choice(mag, size=len(mag)))
+        with stage(name, len(mag)):
+            mc[i] = mc_method(magbs, mbin)[0]
+    return mc
+
+
+def mc_bootstrap_block(specs, mc_method, mbin, nbsample, seed, batched):
+    """
+    a function to run one block of bootstrap samples in a worker process on arrays held in shared memory.
+
+    :param specs (tuple): shared array specs, (distinct magnitudes, counts) if batched else (magnitudes,)
+    :param mc_method (string): method for estimating Mc. options are 'maxc', 'mbs', and 'gft'.
+    :param mbin (float): magnitude bin width
+    :param nbsample (int): number of bootstrap sample in this block
+    :param seed (SeedSequence): seed of this block
+    :param batched (bool): if True, the block is evaluated with mc_bootstrap_hist(), else with mc_bootstrap_loop()
+    :return:
+    mc_bootstrap (array): magnitude of completeness of each bootstrap sample in this block
+    """
+
+    shms, arrs = zip(*[attach_array(spec) for spec in specs])
+    rng = np.random.default_rng(seed)
+    if batched:
+        mc = mc_bootstrap_hist(arrs[0], arrs[1], mc_method, mbin, nbsample, rng)
+    else:
+        mc = mc_bootstrap_loop(arrs[0], mc_method, mbin, nbsample, rng)
+    del arrs
+    release(*shms)
+    return mc
+
+
+def mc_bootstrap_parallel(mag, mc_method, mbin=0.1, nbsample=200, rng=None, n_jobs=None, executor=None,
+                          batched=True, block=100):
+    """
+    a function to spread bootstrap samples over a pool of worker processes. the samples are split into blocks of a
+    fixed size and every block gets its own random stream spawned from one SeedSequence, so the result does not
+    depend on the number of workers. the magnitudes are passed to the workers through shared memory.
+
+    :param mag (series): a series of eartquake magnitudes
+    :param mc_method (string): method for estimating Mc. options are 'maxc', 'mbs', and 'gft'.
+    :param mbin (float): magnitude bin width
+    :param nbsample (int): number of bootstrap sample
+    :param rng (Generator, SeedSequence, int or None): random number generator or seed
+    :param n_jobs (int): number of worker processes, used when no executor is given. None uses all cores
+    :param executor (Executor): a concurrent.futures executor to run the blocks on. it is not shut down here
+    :param batched (bool): if True, blocks are evaluated with mc_bootstrap_hist(), else with mc_bootstrap_loop()
+    :param block (int): number of bootstrap sample per block
+    :return:
+    mc_bootstrap (array): magnitude of completeness of each bootstrap sample
+    """
+
+    if isinstance(rng, np.random.SeedSequence):
+        seed = rng
+    elif isinstance(rng, np.random.Generator):
+        seed = np.random.SeedSequence(rng.integers(2**63))
+    else:
+        seed = np.random.SeedSequence(rng)
+    sizes = [min(block, nbsample-i) for i in range(0, nbsample, block)]
+    seeds = seed.spawn(len(sizes))
+
+    if batched:
+        shared = [share_array(elem) for elem in magnitude_hist(mag)]
+    else:
+        shared = [share_array(magnitude_values(mag))]
+    shms, specs = zip(*shared)
+
+    pool = executor if executor is not None else ProcessPoolExecutor(n_jobs)
+    try:
+        futures = [pool.submit(mc_bootstrap_block, specs, mc_method, mbin, size, s, batched)
+                   for size, s in zip(sizes, seeds)]
+        mc = np.concatenate([elem.result() for elem in futures]) if futures else np.zeros(0)
+    finally:
+        if executor is None:
+            pool.shutdown()
+        release(*shms, unlink=True)
+    return mc
 
-    mc_mean = np.nanmean(mc_bootstrap)
-    mc_sd = np.nanstd(mc_bootstrap)
+
+def fmd_fit_data(x, y):
+    """
+    a function to arrange a frequency-magnitude distribution into the variables used by the curve fitting methods.
+
+    :param x (array): magnitude bins
+    :param y (array): noncumulative magnitude frequency
+    :return:
+    fit_data (FMDResult) : x and y, with their nonzero part xo and yo, log10(yo), and the dataframes d1 (x, y) and
+    d2 (xo, yo, log_yo) made when they are asked for
+    """
+
+    return FMDResult(x=x, y=y)
+
+
+def select_mc(mc_bs):
+    """
+    a function to choose the Mc used for calculating b-value from the Mc of the bootstrap samples. the mean is
+    rounded up to 1 decimal place if that stays within one standard deviation, otherwise it is rounded.
+
+    :param mc_bs (array): magnitude of completeness of each bootstrap sample
+    :return:
+    mc_mean (float): mean of Mc bootstrap
+    mc_sdl (float): mean minus standard deviation of Mc bootstrap
+    mc_sdr (float): mean plus standard deviation of Mc bootstrap
+    mc (float): magnitude of completeness
+    """
+
+    mc_mean = np.nanmean(mc_bs)
+    mc_sd = np.nanstd(mc_bs)
     mc_sdl = mc_mean - mc_sd
     mc_sdr = mc_mean + mc_sd
 
@@ -205,49 +808,350 @@ def fmd_details(mag, mc_method, mbin=0.1, nbsample=200):
         mc = mc_test
     else:
         mc = round(mc_mean, 1)
+    return mc_mean, mc_sdl, mc_sdr, mc
+
+
+@timed('fmd_details')
+def fmd_details(mag, mc_method, mbin=0.1, nbsample=200, rng=None, batched=False, n_jobs=None, executor=None,
+                keep_mag=True, cv_method=None):
+    """
+    a function to generate FMD details including Mc and maximum magnitude that will be used for calculating b-value
+
+    :param mag: a series of earthquake magnitudes
+    :param mc: magnitude of completeness
+    :param mbin: magnitude bin width
+    :param nbsample: number of bootstrap sample
+    :param rng: random number generator or seed for the bootstrap. None uses numpy's global random state
+    :param batched: if True, all bootstrap samples are drawn and evaluated at once with mc_bootstrap()
+    :param n_jobs: if given, the bootstrap runs on this many worker processes with mc_bootstrap_parallel()
+    :param executor: a concurrent.futures executor to run the bootstrap on, instead of a new process pool
+    :param keep_mag: if False, the magnitudes between Mc and maxmag (mag_bvalue) are not kept in the result
+    :param cv_method: if given, the b-value of every bootstrap sample is also estimated with this curve fitting
+    method, from the same resamples (see mc_bootstrap_hist()). the Mc and b-value of the samples are kept as mc_bs
+    and b_bs, and generate_autobvalue() with the same method adds their spread to cv_data. this bootstrap always
+    runs batched in this process
+    :return:
+    fmd_data (FMDResult) : informations that will be used for calculating b-value and visualization, also readable
+    as a dictionary
+    """
+    # pembentukan FMD
+    with stage('fmd', len(mag)):
+        FMD = fmd(mag, mbin)
+    m = FMD[0]
+    cum = FMD[1]
+    noncum = FMD[2]
+
+    
+    # estimasi Mc
+    b_bs = None
+    with stage('bootstrap', nbsample):
+        if cv_method is not None:
+            mval, mcount = magnitude_hist(mag)
+            mc_bs, b_bs = mc_bootstrap_hist(mval, mcount, mc_method, mbin, nbsample, rng, cv_method=cv_method)
+        elif n_jobs is not None or executor is not None:
+            mc_bs = mc_bootstrap_parallel(mag, mc_method, mbin, nbsample, rng, n_jobs, executor, batched)
+        elif batched:
+            mc_bs = mc_bootstrap(mag, mc_method, mbin, nbsample, rng)
+        else:
+            mc_bs = mc_bootstrap_loop(mag, mc_method, mbin, nbsample, rng)
+
+    mc_mean, mc_sdl, mc_sdr, mc = select_mc(mc_bs)
 
     # estimasi maximum magnitude
-    sorted_mag = sorted(mag, reverse=True)
-    max1 = sorted_mag[0]
-    for i in range(len(sorted_mag)):
-        if sorted_mag[i] != max1:
-            max2 = sorted_mag[i]
-            break
+    with stage('maxmag', len(mag)):
+        max1, max2 = top_magnitudes(mag)
     maxmag = round(max1 + (max1 - max2), 1)
     # maxmag = round(max1, 1)
 
     
-    mag_bvalue = mag[(mag >= mc) & (mag <= maxmag)]
-    FMD_bvalue = fmd_bvalue(mag_bvalue, mc, maxmag, mbin)
-    x = FMD_bvalue[0]
-    cum_bvalue = FMD_bvalue[1]
-    y = FMD_bvalue[2]
-    d1 = pd.DataFrame({"x": np.array(x), "y": np.array(y)})
-
-    # membentuk variabel xo dan yo
-    yo = y[list(np.where(y != 0)[0])]
-    xo = x[list(np.where(y != 0)[0])]
-    log_yo = [math.log10(elem) for elem in yo]
-    d2 = pd.DataFrame({"xo": np.array(xo), "yo": np.array(yo), "log_yo": np.array(log_yo)})
-
-    fmd_data = {
-        'm': m,
-        'noncum': noncum,
-        'cum': cum,
-        'mc_mean': mc_mean,
-        'mc_sdl': mc_sdl,
-        'mc_sdr': mc_sdr,
-        'mc': mc,
-        'maxmag': maxmag,
-        'mag_bvalue': mag_bvalue,
-        'cum_bvalue':cum_bvalue,
-        'd1': d1,
-        'x': x,
-        'y': y,
-        'd2': d2,
-        'yo': yo,
-        'xo': xo,
-        'log_yo': log_yo
-    }
-
-    return fmd_data
\ No newline at end of file
+    with stage('fmd_bvalue', len(mag)):
+        # the magnitudes between Mc and maxmag are counted without selecting them into a new array
+        x = np.arange(mc, maxmag, mbin)
+        FMD_bvalue = (x, *fmd_counts(mag, x, mc, maxmag))
+
+    fmd_data = FMDResult(
+        m           = m,
+        noncum      = noncum,
+        cum         = cum,
+        mc_mean     = mc_mean,
+        mc_sdl      = mc_sdl,
+        mc_sdr      = mc_sdr,
+        mc          = mc,
+        maxmag      = maxmag,
+        mag_bvalue  = mag_in_range(mag, mc, maxmag) if keep_mag else None,
+        cum_bvalue  = FMD_bvalue[1],
+        x           = FMD_bvalue[0],
+        y           = FMD_bvalue[2],
+        mc_bs       = mc_bs if cv_method is not None else None,
+        b_bs        = b_bs,
+        cv_method   = cv_method
+    )
+
+    return fmd_data
+
+
+def merge_hist(mval, mcount, mag, decimals=None):
+    """
+    a function to add a chunk of earthquake magnitudes to a histogram of distinct magnitudes.
+
+    :param mval (array): distinct magnitudes in ascending order
+    :param mcount (array): number of times each distinct magnitude occurs
+    :param mag (series): a chunk of earthquake magnitudes
+    :param decimals (int): if given, magnitudes are rounded to this many decimals first, which bounds the size of
+    the histogram for catalogs with continuous magnitudes
+    :return:
+    mval (array): distinct magnitudes in ascending order
+    mcount (array): number of times each distinct magnitude occurs
+    """
+
+    cval, ccount = chunk_hist(mag, decimals)
+    return combine_hist([mval, cval], [mcount, ccount])
+
+
+def chunk_hist(mag, decimals=None):
+    """
+    a function to get the histogram of distinct magnitudes of one chunk, without NaN.
+
+    :param mag (series): a chunk of earthquake magnitudes
+    :param decimals (int): if given, magnitudes are rounded to this many decimals first
+    :return:
+    mval (array): distinct magnitudes in ascending order
+    mcount (array): number of times each distinct magnitude occurs
+    """
+
+    mag = np.asarray(mag, dtype=float)
+    if decimals is not None:
+        mag = np.round(mag, decimals)
+    return np.unique(mag[~np.isnan(mag)], return_counts=True)
+
+
+def combine_hist(mvals, mcounts):
+    """
+    a function to merge several histograms of distinct magnitudes into one.
+
+    :param mvals (list): distinct magnitudes of each histogram
+    :param mcounts (list): counts of each histogram
+    :return:
+    mval (array): distinct magnitudes in ascending order
+    mcount (array): number of times each distinct magnitude occurs
+    """
+
+    mval, ind = np.unique(np.concatenate(mvals), return_inverse=True)
+    mcount = np.bincount(ind, weights=np.concatenate(mcounts), minlength=len(mval)).astype(np.int64)
+    return mval, mcount
+
+
+def accumulate_hist(chunks, decimals=None):
+    """
+    a function to build the histogram of distinct magnitudes of a catalog that is read chunk by chunk, e.g. from
+    pd.read_csv(..., chunksize=...) or slices of a memory-mapped array. only the histogram is kept in memory,
+    and it holds everything needed for Mc, maximum magnitude, the b-value FMD and the bootstrap
+    (see fmd_details_hist()). the histograms of the chunks are merged once they hold as many values as the
+    merged histogram, so catalogs with continuous magnitudes are merged O(log n) times instead of once per chunk.
+
+    :param chunks (iterable): chunks of earthquake magnitudes
+    :param decimals (int): if given, magnitudes are rounded to this many decimals first
+    :return:
+    mval (array): distinct magnitudes in ascending order
+    mcount (array): number of times each distinct magnitude occurs
+    """
+
+    mvals, mcounts = [np.zeros(0)], [np.zeros(0, dtype=np.int64)]
+    pending = 0
+    for chunk in chunks:
+        cval, ccount = chunk_hist(chunk, decimals)
+        mvals.append(cval)
+        mcounts.append(ccount)
+        pending += len(cval)
+        if pending > max(len(mvals[0]), MAG_CHUNK):
+            mvals, mcounts = map(list, zip(combine_hist(mvals, mcounts)))
+            pending = 0
+    if len(mvals) == 1:
+        return mvals[0], mcounts[0]
+    return combine_hist(mvals, mcounts)
+
+
+def fmd_hist(mval, mcount, mbin):
+    """
+    a function to create frequency-magnitude distribution from a histogram of distinct magnitudes, the same as
+    fmd() on the magnitudes themselves.
+
+    :param mval (array): distinct magnitudes in ascending order
+    :param mcount (array): number of times each distinct magnitude occurs
+    :param mbin (float): magnitude bin width
+    :return:
+    m (array) : magnitude bins
+    cum (array) : cumulative magnitude frequency
+    noncum (array) : noncumulative magnitude frequency
+    """
+
+    mround = np.round(mval[mcount > 0]/mbin)*mbin
+    m = np.arange(mround.min(), mround.max()+mbin, mbin)
+    ind = np.searchsorted(np.round(m, 1), mval, side='left')
+    noncum = np.bincount(ind, weights=mcount, minlength=len(m)+1)[1:len(m)+1]
+    cum = np.cumsum(noncum[::-1])[::-1]
+    return m, cum, noncum
+
+
+def fmd_bvalue_hist(mval, mcount, mc, maxmag, mbin):
+    """
+    a function to create the frequency-magnitude distribution between mc and maxmag from a histogram of distinct
+    magnitudes, the same as fmd_bvalue() on the magnitudes themselves.
+
+    :param mval (array): distinct magnitudes in ascending order
+    :param mcount (array): number of times each distinct magnitude occurs
+    :param mc (float): magnitude of completeness
+    :param maxmag (float): maximum magnitude
+    :param mbin (float): magnitude bin width
+    :return:
+    x (array) : magnitude bins
+    cum (array) : cumulative magnitude frequency
+    y (array) : noncumulative magnitude frequency
+    """
+
+    x = np.arange(mc, maxmag, mbin)
+    sel = (mval >= mc) & (mval <= maxmag)
+    ind = np.searchsorted(np.round(x, 1), mval[sel], side='left')
+    y = np.bincount(ind, weights=mcount[sel], minlength=len(x)+1)[1:len(x)+1]
+    cum = np.cumsum(y[::-1])[::-1]
+    return x, cum, y
+
+
+@timed('fmd_details_hist')
+def fmd_details_hist(mval, mcount, mc_method, mbin=0.1, nbsample=200, rng=None, cv_method=None):
+    """
+    a function to generate FMD details including Mc and maximum magnitude from a histogram of distinct magnitudes,
+    e.g. one built with accumulate_hist() from a catalog that does not fit in memory. the bootstrap resamples the
+    histogram with mc_bootstrap_hist(), and maximum magnitude comes from its two largest distinct magnitudes.
+
+    :param mval (array): distinct magnitudes in ascending order
+    :param mcount (array): number of times each distinct magnitude occurs
+    :param mc_method (string): method for estimating Mc. options are 'maxc', 'mbs', and 'gft'.
+    :param mbin (float): magnitude bin width
+    :param nbsample (int): number of bootstrap sample
+    :param rng (Generator, int or None): random number generator or seed
+    :param cv_method (string): if given, the b-value of every bootstrap sample is also estimated with this curve
+    fitting method (see fmd_details())
+    :return:
+    fmd_data (FMDResult) : the same informations as fmd_details(), with the histogram of magnitudes between Mc and
+    maxmag (mval_bvalue, mcount_bvalue) in place of mag_bvalue
+    """
+
+    mval = np.asarray(mval, dtype=float)
+    mcount = np.asarray(mcount)
+    with stage('fmd', len(mval)):
+        m, cum, noncum = fmd_hist(mval, mcount, mbin)
+    b_bs = None
+    with stage('bootstrap', nbsample):
+        mc_bs = mc_bootstrap_hist(mval, mcount, mc_method, mbin, nbsample, rng, cv_method=cv_method)
+        if cv_method is not None:
+            mc_bs, b_bs = mc_bs
+    mc_mean, mc_sdl, mc_sdr, mc = select_mc(mc_bs)
+
+    max2, max1 = mval[mcount > 0][-2:]
+    maxmag = round(max1 + (max1 - max2), 1)
+
+    with stage('fmd_bvalue', len(mval)):
+        sel = (mval >= mc) & (mval <= maxmag)
+        x, cum_bvalue, y = fmd_bvalue_hist(mval, mcount, mc, maxmag, mbin)
+    fmd_data = FMDResult(
+        m               = m,
+        noncum          = noncum,
+        cum             = cum,
+        mc_mean         = mc_mean,
+        mc_sdl          = mc_sdl,
+        mc_sdr          = mc_sdr,
+        mc              = mc,
+        maxmag          = maxmag,
+        mval_bvalue     = mval[sel],
+        mcount_bvalue   = mcount[sel],
+        cum_bvalue      = cum_bvalue,
+        x               = x,
+        y               = y,
+        mc_bs           = mc_bs if cv_method is not None else None,
+        b_bs            = b_bs,
+        cv_method       = cv_method
+    )
+    return fmd_data
+
+
+@timed('mc_ensemble')
+def mc_ensemble_hist(mval, mcount, methods=None, mbin=0.1, nbsample=0, rng=None, chunk=2**22, return_bs=False):
+    """
+    a function to estimate Mc of a histogram of distinct magnitudes with several methods side by side, to judge how
+    robust Mc is. the FMD, maxc Mc and cumulative sums of the histogram, and of every block of bootstrap samples,
+    are built once and shared by all methods (see FMDSamples), and every method sees the same bootstrap samples.
+
+    :param mval (array): distinct magnitudes in ascending order
+    :param mcount (array): number of times each distinct magnitude occurs
+    :param methods (list): names of the Mc methods, all registered methods (see MC_METHODS) if None
+    :param mbin (float): magnitude bin width
+    :param nbsample (int): number of bootstrap sample, no bootstrap if 0
+    :param rng (Generator, int or None): random number generator or seed
+    :param chunk (int): maximum number of magnitude counts held in memory per block of bootstrap samples
+    :param return_bs (bool): if True, the Mc of every bootstrap sample is also returned
+    :return:
+    table (dataframe): one row per method, indexed by its name, with Mc of the histogram itself (mc). with the
+    bootstrap also the mean, standard deviation, mean minus and plus standard deviation of Mc bootstrap (mc_mean,
+    mc_sd, mc_sdl, mc_sdr), the Mc chosen from them as in fmd_details() (mc_bootstrap) and the number of samples
+    with an Mc (nbvalid)
+    mc_bs (dict): Mc of every bootstrap sample by method, only returned when return_bs is True
+    """
+
+    methods = list(MC_METHODS) if methods is None else list(methods)
+    funcs = {name: mc_method_batch(name) for name in methods}
+    mval = np.asarray(mval, dtype=float)
+    mcount = np.asarray(mcount)
+
+    samples = FMDSamples(mval, mcount[None, :], mbin)
+    mc = {}
+    for name, func in funcs.items():
+        with stage(name, len(mval)):
+            mc[name] = float(func(samples)[0])
+
+    rng = np.random.default_rng(rng)
+    step = max(1, chunk // len(mval))
+    mc_bs = {name: np.zeros(nbsample) for name in methods}
+    for i in range(0, nbsample, step):
+        with stage('resample', min(step, nbsample-i)):
+            counts = rng.multinomial(mcount.sum(), mcount/mcount.sum(), size=min(step, nbsample-i))
+        samples = FMDSamples(mval, counts, mbin)
+        for name, func in funcs.items():
+            with stage(name, counts.size):
+                mc_bs[name][i:i+step] = func(samples)
+
+    rows = []
+    for name in methods:
+        row = {'method': name, 'mc': mc[name]}
+        if nbsample:
+            mc_mean, mc_sdl, mc_sdr, mc_bootstrap = select_mc(mc_bs[name])
+            row.update(mc_mean=mc_mean, mc_sd=np.nanstd(mc_bs[name]), mc_sdl=mc_sdl, mc_sdr=mc_sdr,
+                       mc_bootstrap=mc_bootstrap, nbvalid=int(np.count_nonzero(~np.isnan(mc_bs[name]))))
+        rows.append(row)
+    table = pd.DataFrame(rows).set_index('method')
+    return (table, mc_bs) if return_bs else table
+
+
+def mc_ensemble(mag, methods=None, mbin=0.1, nbsample=0, rng=None, chunk=2**22, return_bs=False):
+    """
+    a function to estimate Mc of a series of earthquake magnitudes with several methods side by side. the
+    magnitudes are sorted into distinct magnitudes once and all methods share one precomputation
+    (see mc_ensemble_hist()), so running every method costs about as much as running one.
+
+    example:
+        table = mc_ensemble(catalog['M'], nbsample=200, rng=0)
+
+    :param mag (series): a series of earthquake magnitudes
+    :param methods (list): names of the Mc methods, all registered methods (see MC_METHODS) if None
+    :param mbin (float): magnitude bin width
+    :param nbsample (int): number of bootstrap sample, no bootstrap if 0
+    :param rng (Generator, int or None): random number generator or seed
+    :param chunk (int): maximum number of magnitude counts held in memory per block of bootstrap samples
+    :param return_bs (bool): if True, the Mc of every bootstrap sample is also returned
+    :return:
+    table (dataframe): comparison of the methods (see mc_ensemble_hist())
+    mc_bs (dict): Mc of every bootstrap sample by method, only returned when return_bs is True
+    """
+
+    mval, mcount = magnitude_hist(mag)
+    return mc_ensemble_hist(mval, mcount, methods, mbin, nbsample, rng, chunk, return_bs)
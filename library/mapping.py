@@ -0,0 +1,229 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy.spatial import cKDTree
+from library.mag_of_completeness import fmd_details, mc_method_batch
+from library.curve_fitting_method import (generate_autobvalue, generate_autobvalue_batch, stack_fmd, check_cv_method,
+                                          FMD_ERRORS)
+from library.parallel import share_array, attach_array, release
+
+
+def build_index(catalog, cols=('X', 'Y')):
+    """
+    a function to build a KD-tree over earthquake locations. it is built once and reused for every node.
+
+    :param catalog (dataframe): seismic catalog containing earthquake locations (x,y,z) and magnitudes (m)
+    :param cols (tuple): location columns used for the neighbour search, ('X', 'Y') or ('X', 'Y', 'Z')
+    :return:
+    tree (cKDTree): KD-tree over the event locations
+    """
+
+    return cKDTree(np.column_stack([np.asarray(catalog[col], dtype=float) for col in cols]))
+
+
+def grid_axis(lo, hi, step):
+    """
+    a function to place nodes every step from lo up to hi. hi gets a node when it is a whole number of steps from
+    lo (up to rounding), and no node is placed past hi.
+
+    :param lo (float): first node
+    :param hi (float): largest allowed node
+    :param step (float): node spacing
+    :return:
+    axis (array): node positions
+    """
+
+    return np.minimum(np.arange(lo, hi + step*1e-9, step), hi)
+
+
+def grid_nodes(xlim, ylim, dx, dy=None):
+    """
+    a function to create a regular grid of nodes.
+
+    :param xlim (tuple): minimum and maximum x
+    :param ylim (tuple): minimum and maximum y
+    :param dx (float): node spacing along x
+    :param dy (float): node spacing along y. if None, dx is used
+    :return:
+    nodes (array): node coordinates, one row (x, y) per node, with x running fastest
+    shape (tuple): number of nodes along y and x, to reshape the map outputs
+    """
+
+    dy = dx if dy is None else dy
+    gx = grid_axis(xlim[0], xlim[1], dx)
+    gy = grid_axis(ylim[0], ylim[1], dy)
+    xx, yy = np.meshgrid(gx, gy)
+    return np.column_stack([xx.ravel(), yy.ravel()]), xx.shape
+
+
+def node_neighbours(tree, nodes, nevents=None, radius=None, n_jobs=1):
+    """
+    a function to find the events sampled by each node: either the nevents nearest events or all events within
+    radius. if both are given, the nearest nevents events that are also within radius are taken.
+
+    :param tree (cKDTree): KD-tree over the event locations (see build_index())
+    :param nodes (array): node coordinates, one row per node
+    :param nevents (int): number of nearest events
+    :param radius (float): sampling radius
+    :param n_jobs (int): number of threads used by the KD-tree query. -1 uses all cores
+    :return:
+    neighbours (list): event indices of each node
+    """
+
+    if nevents is not None:
+        nevents = min(nevents, tree.n)
+        dist, ind = tree.query(nodes, k=nevents, distance_upper_bound=np.inf if radius is None else radius,
+                               workers=n_jobs)
+        ind = ind.reshape(len(nodes), nevents)
+        return [elem[elem < tree.n] for elem in ind]
+    elif radius is not None:
+        return [np.asarray(elem, dtype=int) for elem in tree.query_ball_point(nodes, radius, workers=n_jobs)]
+    else:
+        raise ValueError("either nevents or radius has to be given")
+
+
+def bvalue_nodes(mag, neighbours, seeds, mc_method, cv_method, mbin=0.1, nbsample=200, min_events=50,
+                 batched=True, backend='batch'):
+    """
+    a function to calculate Mc and b-value for a list of nodes, each from its own subset of events.
+    nodes with fewer than min_events events, or where Mc or the fit cannot be estimated (see FMD_ERRORS), are given
+    NaN. unknown methods and other errors are raised.
+
+    :param mag (array): earthquake magnitudes of the whole catalog
+    :param neighbours (list): event indices of each node
+    :param seeds (list): bootstrap seed of each node
+    :param mc_method (string): method for estimating Mc. options are 'maxc', 'mbs', and 'gft'.
+    :param cv_method (string): curve fitting method. options are 'b-value pois', 'b-value glin', 'b-value glog',
+    and 'b-value mle'.
+    :param mbin (float): magnitude bin width
+    :param nbsample (int): number of bootstrap sample
+    :param min_events (int): minimum number of events of a node
+    :param batched (bool): if True, the bootstrap of each node is done with mc_bootstrap()
+    :param backend (string): 'batch' to fit all nodes at once with generate_autobvalue_batch, or the backend of
+    generate_autobvalue, 'numpy' or 'statsmodels'
+    :return:
+    result (array): b-value, uncertainty, Mc and number of events, one row per node
+    """
+
+    mc_method_batch(mc_method)
+    check_cv_method(cv_method, None if backend == 'batch' else backend)
+    result = np.full((len(neighbours), 4), np.nan)
+    mle = cv_method == 'b-value mle'
+    fmds = []
+    for i, (ind, seed) in enumerate(zip(neighbours, seeds)):
+        result[i, 3] = len(ind)
+        if len(ind) < min_events:
+            continue
+        try:
+            fmd_data = fmd_details(mag[ind], mc_method, mbin, nbsample, rng=seed, batched=batched, keep_mag=mle)
+            result[i, 2] = fmd_data['mc']
+            if backend == 'batch' and mle:
+                # the batch MLE reads the distinct magnitudes above Mc and their counts
+                fmds.append((i, *np.unique(fmd_data['mag_bvalue'], return_counts=True)))
+                continue
+            if backend == 'batch':
+                fmds.append((i, fmd_data['x'], fmd_data['y']))
+                continue
+            cv_data = generate_autobvalue(cv_method, fmd_data, backend, mbin=mbin)
+        except FMD_ERRORS:
+            # a node with a degenerate FMD (too few bins, a single magnitude, ...) is left empty
+            continue
+        result[i, :2] = cv_data['bvalue'], cv_data['unc']
+
+    if fmds:
+        ind, x, y = zip(*fmds)
+        cv_data = generate_autobvalue_batch(cv_method, *stack_fmd(list(zip(x, y))), mbin=mbin,
+                                            mc=result[np.array(ind), 2] if mle else None)
+        result[np.array(ind), 0] = cv_data['bvalue']
+        result[np.array(ind), 1] = cv_data['unc']
+    return result
+
+
+def bvalue_nodes_shared(spec, neighbours, seeds, *args):
+    """
+    a function to run bvalue_nodes() in a worker process with the catalog magnitudes held in shared memory.
+
+    :param spec (tuple): shared array spec of the catalog magnitudes (see share_array())
+    :param neighbours (list): event indices of each node
+    :param seeds (list): bootstrap seed of each node
+    :param args: mc_method, cv_method, mbin, nbsample, min_events, batched and backend, as in bvalue_nodes()
+    :return:
+    result (array): b-value, uncertainty, Mc and number of events, one row per node
+    """
+
+    shm, mag = attach_array(spec)
+    try:
+        return bvalue_nodes(mag, neighbours, seeds, *args)
+    finally:
+        del mag
+        try:
+            release(shm)
+        except BufferError:
+            # the traceback of an error raised above still holds views of the block, which is closed with them
+            pass
+
+
+def bvalue_map(catalog, nodes, mc_method, cv_method, nevents=None, radius=None, mbin=0.1, nbsample=200,
+               min_events=50, rng=None, tree=None, cols=('X', 'Y'), batched=True, backend='batch', n_jobs=None,
+               executor=None, chunk=256, mask=None):
+    """
+    a function to calculate a b-value map. every node takes the nevents nearest events or all events within
+    radius from a KD-tree over the catalog locations, and runs fmd_details and generate_autobvalue on them.
+    nodes are processed in chunks on a pool of worker processes that read the magnitudes from shared memory.
+
+    :param catalog (dataframe): seismic catalog containing earthquake locations (x,y,z) and magnitudes (m)
+    :param nodes (array): node coordinates, one row per node (see grid_nodes())
+    :param mc_method (string): method for estimating Mc. options are 'maxc', 'mbs', and 'gft'.
+    :param cv_method (string): curve fitting method. options are 'b-value pois', 'b-value glin', 'b-value glog',
+    and 'b-value mle'.
+    :param nevents (int): number of nearest events of each node
+    :param radius (float): sampling radius of each node
+    :param mbin (float): magnitude bin width
+    :param nbsample (int): number of bootstrap sample
+    :param min_events (int): minimum number of events of a node
+    :param rng (SeedSequence, int or None): seed of the bootstrap. every node gets its own spawned stream
+    :param tree (cKDTree): KD-tree over the catalog locations. if None, it is built from cols
+    :param cols (tuple): location columns used for the neighbour search
+    :param batched (bool): if True, the bootstrap of each node is done with mc_bootstrap()
+    :param backend (string): 'batch', 'numpy' or 'statsmodels' (see bvalue_nodes())
+    :param n_jobs (int): number of worker processes. 1 runs in this process, None uses all cores
+    :param executor (Executor): a concurrent.futures executor to run the chunks on. it is not shut down here
+    :param chunk (int): number of nodes per task
+    :param mask (array): if given, only events where mask is True are sampled, e.g. the mainshocks from
+    decluster(). a given tree has to be built over these events
+    :return:
+    map_data (dict): b-value, uncertainty, Mc and number of events of every node
+    """
+
+    if mask is not None:
+        catalog = {col: np.asarray(catalog[col])[mask] for col in list(cols) + ['M']}
+    tree = build_index(catalog, cols) if tree is None else tree
+    mag = np.asarray(catalog['M'])
+    seed = rng if isinstance(rng, np.random.SeedSequence) else np.random.SeedSequence(rng)
+    seeds = seed.spawn(len(nodes))
+    args = (mc_method, cv_method, mbin, nbsample, min_events, batched, backend)
+    blocks = range(0, len(nodes), chunk)
+
+    if n_jobs == 1 and executor is None:
+        result = [bvalue_nodes(mag, node_neighbours(tree, nodes[i:i+chunk], nevents, radius), seeds[i:i+chunk],
+                               *args) for i in blocks]
+    else:
+        shm, spec = share_array(mag)
+        pool = executor if executor is not None else ProcessPoolExecutor(n_jobs)
+        try:
+            futures = [pool.submit(bvalue_nodes_shared, spec, node_neighbours(tree, nodes[i:i+chunk], nevents,
+                                                                              radius), seeds[i:i+chunk], *args)
+                       for i in blocks]
+            result = [elem.result() for elem in futures]
+        finally:
+            if executor is None:
+                pool.shutdown()
+            release(shm, unlink=True)
+
+    result = np.concatenate(result) if result else np.zeros((0, 4))
+    map_data = {
+        'bvalue': result[:, 0],
+        'unc': result[:, 1],
+        'mc': result[:, 2],
+        'nbev': result[:, 3].astype(int)
+    }
+    return map_data
@@ -0,0 +1,49 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+
+def share_array(arr):
+    """
+    a function to copy an array into a shared memory block, so that worker processes can read it
+    without the array being pickled for every task.
+
+    :param arr (array): array to be shared
+    :return:
+    shm (SharedMemory): shared memory block. the caller closes and unlinks it when the work is done
+    spec (tuple): name, shape and dtype of the shared array, to be passed to attach_array()
+    """
+
+    arr = np.ascontiguousarray(arr)
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+    return shm, (shm.name, arr.shape, arr.dtype.str)
+
+
+def attach_array(spec):
+    """
+    a function to read an array from a shared memory block made by share_array().
+
+    :param spec (tuple): name, shape and dtype of the shared array
+    :return:
+    shm (SharedMemory): shared memory block. the caller closes it once the array is no longer used
+    arr (array): array backed by the shared memory block
+    """
+
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def release(*shms, unlink=False):
+    """
+    a function to close shared memory blocks and optionally remove them.
+
+    :param shms (SharedMemory): shared memory blocks
+    :param unlink (bool): if True, the blocks are also removed. only the process that made them should do this
+    :return: none
+    """
+
+    for shm in shms:
+        shm.close()
+        if unlink:
+            shm.unlink()
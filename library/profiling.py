@@ -0,0 +1,178 @@
+import time
+import functools
+from contextlib import contextmanager, nullcontext, ExitStack
+
+
+_profiler = None
+_NULL = nullcontext()
+
+
+class Profiler:
+    """
+    a record of the wall time, number of calls and number of items (e.g. magnitudes or bootstrap samples) of every
+    stage of the pipeline. stages are nested, and each one is recorded under its path, e.g.
+    'fmd_details/bootstrap/resample'. hooks are callables taking the stage name and its size and returning a
+    context manager (or None) that is entered around the stage, to pass stages on to an external tracer. a
+    profiler is meant to be used from one thread.
+    """
+
+    def __init__(self, hooks=()):
+        self.hooks = list(hooks)
+        self.records = {}
+        self._path = []
+
+    @contextmanager
+    def stage(self, name, size=None):
+        self._path.append(name)
+        key = '/'.join(self._path)
+        record = self.records.setdefault(key, {'calls': 0, 'seconds': 0., 'min': float('inf'), 'max': 0.,
+                                               'items': 0})
+        t = time.perf_counter()
+        try:
+            with ExitStack() as hooks:
+                for hook in self.hooks:
+                    ctx = hook(name, size)
+                    if ctx is not None:
+                        hooks.enter_context(ctx)
+                yield
+        finally:
+            dt = time.perf_counter() - t
+            self._path.pop()
+            record['calls'] += 1
+            record['seconds'] += dt
+            record['min'] = min(record['min'], dt)
+            record['max'] = max(record['max'], dt)
+            if size is not None:
+                record['items'] += int(size)
+
+    def report(self):
+        """
+        a function to list the records of all stages, with nested stages right after their parent and stages of
+        the same parent in the order they were first entered.
+
+        :return:
+        report (list): dictionary of stage, depth, calls, seconds, mean, min, max and items of every stage
+        """
+
+        order = {key: i for i, key in enumerate(self.records)}
+        tree = lambda key: [order['/'.join(key.split('/')[:i+1])] for i in range(key.count('/') + 1)]
+        report = []
+        for key in sorted(self.records, key=tree):
+            record = self.records[key]
+            calls = record['calls']
+            report.append({
+                'stage'     : key,
+                'depth'     : key.count('/'),
+                'calls'     : calls,
+                'seconds'   : record['seconds'],
+                'mean'      : record['seconds']/calls if calls else 0.,
+                'min'       : record['min'] if calls else 0.,
+                'max'       : record['max'],
+                'items'     : record['items']
+            })
+        return report
+
+    def table(self):
+        """
+        a function to format the report as a text table, with nested stages indented under their parent.
+
+        :return:
+        table (str): one line per stage
+        """
+
+        lines = ['%-40s %8s %11s %11s %11s %12s' % ('stage', 'calls', 'total s', 'mean s', 'max s', 'items')]
+        for row in self.report():
+            name = '  '*row['depth'] + row['stage'].rsplit('/', 1)[-1]
+            lines.append('%-40s %8d %11.5f %11.6f %11.6f %12d' % (name, row['calls'], row['seconds'], row['mean'],
+                                                                   row['max'], row['items']))
+        return '\n'.join(lines)
+
+
+def stage(name, size=None):
+    """
+    a function to mark a stage of the pipeline. it returns a context manager that records the stage in the active
+    profiler, or a shared no-op context manager when profiling is disabled.
+
+    :param name (str): name of the stage
+    :param size (int): number of items processed in the stage, e.g. magnitudes or bootstrap samples
+    :return:
+    context manager
+    """
+
+    if _profiler is None:
+        return _NULL
+    return _profiler.stage(name, size)
+
+
+def timed(name):
+    """
+    a decorator to record every call of a function as a stage. when profiling is disabled the function is called
+    directly.
+
+    :param name (str): name of the stage
+    :return:
+    decorator
+    """
+
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            with _profiler.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def enable(*hooks):
+    """
+    a function to start recording stages in a new profiler.
+
+    :param hooks (callable): external tracer hooks (see Profiler)
+    :return:
+    profiler (Profiler)
+    """
+
+    global _profiler
+    _profiler = Profiler(hooks)
+    return _profiler
+
+
+def disable():
+    """
+    a function to stop recording stages.
+
+    :return:
+    profiler (Profiler or None): the profiler that was active
+    """
+
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+@contextmanager
+def profile(*hooks):
+    """
+    a context manager to record the stages of the code run inside it. stages run in worker processes (e.g. the
+    parallel bootstrap) are recorded as one stage of the calling process.
+
+    example:
+        with profile() as prof:
+            fmd_data = fmd_details(mag, 'maxc')
+            cv_data = generate_autobvalue('b-value pois', fmd_data)
+        print(prof.table())
+
+    :param hooks (callable): external tracer hooks (see Profiler)
+    :return:
+    profiler (Profiler)
+    """
+
+    global _profiler
+    previous = _profiler
+    _profiler = Profiler(hooks)
+    try:
+        yield _profiler
+    finally:
+        _profiler = previous
@@ -0,0 +1,186 @@
+import numpy as np
+from dataclasses import dataclass
+from library.lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+
+class ResultMapping:
+    """
+    read-only dict-style access to a result object, so code written for the result dictionaries
+    (e.g. fmd_data['mc'] in the visualization functions) keeps working. KEYS maps every key to an attribute.
+    """
+
+    __slots__ = ()
+    KEYS = {}
+
+    def keys(self):
+        return [key for key, attr in self.KEYS.items() if getattr(self, attr) is not None]
+
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        value = getattr(self, self.KEYS[key])
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+
+# keys of the bootstrap b-value spread, shared by all curve fitting methods
+BOOTSTRAP_KEYS = {'unc_bs': 'unc_bs', 'ci2_bs': 'ci2_bs', 'ci4_bs': 'ci4_bs'}
+
+
+def as_array(value):
+    return None if value is None else np.ascontiguousarray(value, dtype=float)
+
+
+@dataclass(slots=True, eq=False)
+class FMDResult(ResultMapping):
+    """
+    frequency-magnitude distribution details from fmd_details(). the nonzero part of the FMD (xo, yo, log_yo) and
+    the dataframes d1 and d2 are not stored but made from x and y when they are asked for. mc_bs and b_bs are the
+    joint Mc and b-value bootstrap distributions when fmd_details() is asked for them with cv_method.
+    """
+
+    x: np.ndarray
+    y: np.ndarray
+    m: np.ndarray = None
+    noncum: np.ndarray = None
+    cum: np.ndarray = None
+    mc_mean: float = None
+    mc_sdl: float = None
+    mc_sdr: float = None
+    mc: float = None
+    maxmag: float = None
+    mag_bvalue: np.ndarray = None
+    cum_bvalue: np.ndarray = None
+    mval_bvalue: np.ndarray = None
+    mcount_bvalue: np.ndarray = None
+    mc_bs: np.ndarray = None
+    b_bs: np.ndarray = None
+    cv_method: str = None
+
+    KEYS = {
+        'm': 'm', 'noncum': 'noncum', 'cum': 'cum', 'mc_mean': 'mc_mean', 'mc_sdl': 'mc_sdl', 'mc_sdr': 'mc_sdr',
+        'mc': 'mc', 'maxmag': 'maxmag', 'mag_bvalue': 'mag_bvalue', 'mval_bvalue': 'mval_bvalue',
+        'mcount_bvalue': 'mcount_bvalue', 'cum_bvalue': 'cum_bvalue', 'd1': 'd1', 'x': 'x', 'y': 'y', 'd2': 'd2',
+        'yo': 'yo', 'xo': 'xo', 'log_yo': 'log_yo', 'mc_bs': 'mc_bs', 'b_bs': 'b_bs', 'cv_method': 'cv_method'
+    }
+
+    def __post_init__(self):
+        for name in ('x', 'y', 'm', 'noncum', 'cum', 'mag_bvalue', 'cum_bvalue', 'mval_bvalue', 'mc_bs', 'b_bs'):
+            setattr(self, name, as_array(getattr(self, name)))
+
+    @property
+    def xo(self):
+        return self.x[self.y != 0]
+
+    @property
+    def yo(self):
+        return self.y[self.y != 0]
+
+    @property
+    def log_yo(self):
+        return np.log10(self.yo)
+
+    @property
+    def d1(self):
+        return pd.DataFrame({"x": self.x, "y": self.y})
+
+    @property
+    def d2(self):
+        return pd.DataFrame({"xo": self.xo, "yo": self.yo, "log_yo": self.log_yo})
+
+
+@dataclass(slots=True, eq=False)
+class CVResult(ResultMapping):
+    """
+    b-value fit from generate_autobvalue(). method is 'pois', 'glin', 'glog' or 'mle', and the dictionary keys
+    follow the method, e.g. cipois2 or ciglin2 for ci2 and ppois or pglin for fitted. the parts of the confidence
+    band used for plotting on a log scale (nlpoiso, xonlpois, nlglinp, xop, ...) are made when they are asked for.
+    the fitted model (statsmodels results or the NumPy fit) is only kept on request. unc_bs, ci2_bs and ci4_bs are
+    the standard deviation and 95% percentile interval of the bootstrap b-values, when fmd_data has them.
+    """
+
+    method: str
+    bvalue: float
+    unc: float
+    ci2: float
+    ci4: float
+    params: np.ndarray
+    fitted: np.ndarray
+    nh: np.ndarray
+    nl: np.ndarray
+    x: np.ndarray
+    xo: np.ndarray
+    log_yo: np.ndarray
+    model: object = None
+    unc_bs: float = None
+    ci2_bs: float = None
+    ci4_bs: float = None
+
+    KEYS = {}
+    METHOD_KEYS = {
+        'pois': {'pois': 'model', 'bvalue': 'bvalue', 'cipois2': 'ci2', 'cipois4': 'ci4', 'unc': 'unc',
+                 'ppois': 'fitted', 'nhpois': 'nh', 'nlpois': 'nl', 'nlpoiso': 'nlo', 'xonlpois': 'xonl',
+                 'nhpoiso': 'nho', 'xonhpois': 'xonh', 'x': 'x', 'xo': 'xo', 'log_yo': 'log_yo'} | BOOTSTRAP_KEYS,
+        'glin': {'glin': 'model', 'bvalue': 'bvalue', 'ciglin2': 'ci2', 'ciglin4': 'ci4', 'unc': 'unc',
+                 'pglin': 'fitted', 'nhglin': 'nh', 'nlglin': 'nl', 'nlglinp': 'nlo', 'xop': 'xonl', 'x': 'x',
+                 'xo': 'xo', 'log_yo': 'log_yo'} | BOOTSTRAP_KEYS,
+        'glog': {'glog': 'model', 'bvalue': 'bvalue', 'ciglog2': 'ci2', 'ciglog4': 'ci4', 'unc': 'unc',
+                 'pglog': 'fitted', 'nhglog': 'nh', 'nlglog': 'nl', 'x': 'x', 'xo': 'xo',
+                 'log_yo': 'log_yo'} | BOOTSTRAP_KEYS,
+        'mle': {'bvalue': 'bvalue', 'cimle2': 'ci2', 'cimle4': 'ci4', 'unc': 'unc', 'pmle': 'fitted', 'nhmle': 'nh',
+                'nlmle': 'nl', 'nlmleo': 'nlo', 'xonlmle': 'xonl', 'nhmleo': 'nho', 'xonhmle': 'xonh', 'x': 'x',
+                'xo': 'xo', 'log_yo': 'log_yo'} | BOOTSTRAP_KEYS
+    }
+
+    def __post_init__(self):
+        for name in ('params', 'fitted', 'nh', 'nl', 'x', 'xo', 'log_yo'):
+            setattr(self, name, as_array(getattr(self, name)))
+
+    def keys(self):
+        return [key for key, attr in self.METHOD_KEYS[self.method].items() if getattr(self, attr) is not None]
+
+    def __getitem__(self, key):
+        attr = self.METHOD_KEYS[self.method].get(key)
+        if attr is None or getattr(self, attr) is None:
+            raise KeyError(key)
+        return getattr(self, attr)
+
+    @property
+    def nlo(self):
+        return self.nl[self.nl != 0] if self.method in ('pois', 'mle') else self.nl[self.nl > 0]
+
+    @property
+    def xonl(self):
+        return self.x[self.nl != 0] if self.method in ('pois', 'mle') else self.xo[self.nl > 0]
+
+    @property
+    def nho(self):
+        return self.nh[self.nh != 0]
+
+    @property
+    def xonh(self):
+        return self.x[self.nh != 0]
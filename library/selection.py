@@ -0,0 +1,69 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+
+def points_in_polygon(x, y, poly):
+    """
+    a function to test which points lie inside a polygon, with the even-odd rule vectorized over all points.
+    only points inside the polygon's bounding box are tested against its edges.
+
+    :param x (array): x of the points
+    :param y (array): y of the points
+    :param poly (array): polygon vertices, one row (x, y) per vertex
+    :return:
+    inside (array): True for points inside the polygon
+    """
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    poly = np.asarray(poly, dtype=float)
+    inside = np.zeros(len(x), dtype=bool)
+    cand = np.flatnonzero((x >= poly[:, 0].min()) & (x <= poly[:, 0].max()) &
+                          (y >= poly[:, 1].min()) & (y <= poly[:, 1].max()))
+    xc, yc = x[cand], y[cand]
+    res = np.zeros(len(cand), dtype=bool)
+    xj, yj = poly[-1]
+    for xi, yi in poly:
+        cross = (yi > yc) != (yj > yc)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xint = (xj - xi)*(yc - yi)/(yj - yi) + xi
+        res ^= cross & (xc < xint)
+        xj, yj = xi, yi
+    inside[cand] = res
+    return inside
+
+
+def select_region(catalog, poly, mask=None):
+    """
+    a function to find the events of a catalog that lie inside a polygon.
+
+    :param catalog (dict or dataframe): seismic catalog containing earthquake locations (x,y,z) and magnitudes (m)
+    :param poly (array): polygon vertices, one row (x, y) per vertex
+    :param mask (array): if given, only events where mask is True are selected
+    :return:
+    ind (array): indices of the selected events
+    """
+
+    inside = points_in_polygon(catalog['X'], catalog['Y'], poly)
+    if mask is not None:
+        inside &= mask
+    return np.flatnonzero(inside)
+
+
+def read_regions(file_name):
+    """
+    a function to read region polygons, either from a JSON file mapping each region name to its vertices or from
+    a CSV file with one vertex per row and columns region, X and Y.
+
+    :param file_name (str): region file
+    :return:
+    regions (dict): vertices of each region, in file order
+    """
+
+    if os.path.splitext(file_name)[1].lower() == '.json':
+        with open(file_name) as fp:
+            return {str(name): np.asarray(poly, dtype=float) for name, poly in json.load(fp).items()}
+    table = pd.read_csv(file_name)
+    return {str(name): group[['X', 'Y']].to_numpy(dtype=float) for name, group in table.groupby('region', sort=False)}
@@ -0,0 +1,316 @@
+import asyncio
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from library.mag_of_completeness import magnitude_values
+from library.mapping import build_index, bvalue_nodes
+from library.selection import points_in_polygon
+
+
+class EventStore:
+    """
+    an in-memory catalog that new events can be appended to. the columns are kept in arrays with spare capacity,
+    so appending does not copy the catalog every time, and event indices stay valid. the KD-tree over the event
+    locations covers the first nindexed events. events appended after it was built are searched by brute force,
+    and the tree is rebuilt once they grow beyond reindex times the indexed events.
+    """
+
+    def __init__(self, catalog, cols=('X', 'Y'), time_col=None, reindex=0.1):
+        self.cols = list(cols)
+        self.time_col = time_col
+        self.names = self.cols + ['M'] + ([time_col] if time_col is not None else [])
+        self.reindex = reindex
+        self.n = len(catalog['M'])
+        self._data = {name: np.array(self._column(catalog, name)) for name in self.names}
+        self.tree = None
+        self.nindexed = 0
+
+    def _column(self, events, name):
+        # magnitudes are held as float64 values whatever dtype they are given in (see magnitude_values())
+        if name == 'M':
+            return magnitude_values(events[name])
+        return np.asarray(events[name], dtype=None if name == self.time_col else float)
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, name):
+        return self._data[name][:self.n]
+
+    def append(self, events):
+        """
+        a function to append new events.
+
+        :param events (dict or dataframe): the location columns, M and the time column of the new events
+        :return:
+        n (int): number of events in the store
+        """
+
+        size = len(events['M'])
+        if self.n + size > len(self._data['M']):
+            capacity = max(2*len(self._data['M']), self.n + size)
+            for name, arr in self._data.items():
+                grown = np.empty(capacity, dtype=arr.dtype)
+                grown[:self.n] = arr[:self.n]
+                self._data[name] = grown
+        for name in self.names:
+            self._data[name][self.n:self.n+size] = self._column(events, name)
+        self.n += size
+        return self.n
+
+    def index(self):
+        """
+        a function to get the KD-tree, rebuilding it if too many events were appended since it was built.
+
+        :return:
+        tree (cKDTree): KD-tree over the first nindexed events
+        """
+
+        if self.tree is None or self.n - self.nindexed > self.reindex*self.nindexed:
+            self.tree = build_index(self, self.cols)
+            self.nindexed = self.n
+        return self.tree
+
+    def near(self, center, nevents=None, radius=None):
+        """
+        a function to find the nevents nearest events or all events within radius of a point (see
+        node_neighbours()).
+
+        :param center (array): point coordinates
+        :param nevents (int): number of nearest events
+        :param radius (float): sampling radius
+        :return:
+        ind (array): indices of the events, nearest first for nevents
+        """
+
+        tree = self.index()
+        center = np.asarray(center, dtype=float)
+        tail = np.arange(self.nindexed, self.n)
+        dtail = np.sqrt(((np.column_stack([self[col][tail] for col in self.cols]) - center)**2).sum(axis=1))
+        if nevents is not None:
+            k = min(nevents, tree.n)
+            dist, ind = tree.query(center, k=k, distance_upper_bound=np.inf if radius is None else radius)
+            dist, ind = np.atleast_1d(dist), np.atleast_1d(ind)
+            dist = np.concatenate([dist[ind < tree.n], dtail])
+            ind = np.concatenate([ind[ind < tree.n], tail])
+            order = np.argsort(dist, kind='stable')[:nevents]
+            ind = ind[order[dist[order] <= (np.inf if radius is None else radius)]]
+            return ind
+        elif radius is not None:
+            ind = np.asarray(tree.query_ball_point(center, radius), dtype=int)
+            return np.concatenate([np.sort(ind), tail[dtail <= radius]])
+        else:
+            raise ValueError("either nevents or radius has to be given")
+
+    def select(self, poly=None, center=None, nevents=None, radius=None, tmin=None, tmax=None):
+        """
+        a function to find the events of a region and time range.
+
+        :param poly (array): polygon vertices, one row (x, y) per vertex
+        :param center (array): point coordinates, for nevents or radius
+        :param nevents (int): number of nearest events
+        :param radius (float): sampling radius
+        :param tmin: start of the time range (inclusive), in the units of the time column
+        :param tmax: end of the time range (exclusive)
+        :return:
+        ind (array): indices of the selected events
+        """
+
+        if poly is not None:
+            ind = np.flatnonzero(points_in_polygon(self[self.cols[0]], self[self.cols[1]], poly))
+        elif center is not None:
+            ind = self.near(center, nevents, radius)
+        else:
+            ind = np.arange(self.n)
+        if tmin is not None or tmax is not None:
+            time = self[self.time_col][ind]
+            keep = np.ones(len(ind), dtype=bool)
+            if tmin is not None:
+                keep &= time >= np.asarray(tmin, dtype=time.dtype)
+            if tmax is not None:
+                keep &= time < np.asarray(tmax, dtype=time.dtype)
+            ind = ind[keep]
+        return ind
+
+
+class BvalueService:
+    """
+    a long-running b-value service. the catalog and its spatial index are held in memory, and concurrent b-value
+    requests arriving within max_delay seconds of each other are coalesced: requests with the same methods are run
+    as one bvalue_nodes() call on a process pool, with the magnitudes of each request as one node. new events can
+    be appended while the service runs.
+
+    example:
+        async with BvalueService(catalog, time_col='T') as service:
+            result = await service.bvalue(center=(128, -3), nevents=500, mc_method='mbs')
+    """
+
+    def __init__(self, catalog, cols=('X', 'Y'), time_col=None, mbin=0.1, nbsample=200, min_events=50,
+                 backend='batch', n_jobs=None, executor=None, max_batch=256, max_delay=0.005):
+        self.store = EventStore(catalog, cols, time_col)
+        self.mbin = mbin
+        self.nbsample = nbsample
+        self.min_events = min_events
+        self.backend = backend
+        self.n_jobs = n_jobs
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.stats = {'requests': 0, 'batches': 0, 'appended': 0}
+        self._pool = None
+        self._queue = None
+        self._batcher = None
+        self._batch = []
+        self._tasks = set()
+        self._closed = False
+
+    async def start(self):
+        self._pool = self.executor if self.executor is not None else ProcessPoolExecutor(self.n_jobs)
+        self._queue = asyncio.Queue()
+        self._batcher = asyncio.create_task(self._run_batcher())
+        return self
+
+    async def close(self):
+        self._closed = True
+        self._batcher.cancel()
+        try:
+            await self._batcher
+        except asyncio.CancelledError:
+            pass
+        # requests still queued, or taken by the batcher while it waited for more, are run before the pool closes
+        batch, self._batch = self._batch, []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        for i in range(0, len(batch), self.max_batch):
+            self._dispatch(batch[i:i+self.max_batch])
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.executor is None:
+            self._pool.shutdown()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def append(self, events):
+        """
+        a function to append newly located events. requests made afterwards see them.
+
+        :param events (dict or dataframe): the location columns, M and the time column of the new events
+        :return:
+        n (int): number of events in the catalog
+        """
+
+        self.stats['appended'] += len(events['M'])
+        return self.store.append(events)
+
+    async def bvalue(self, poly=None, center=None, nevents=None, radius=None, tmin=None, tmax=None,
+                     mc_method='maxc', cv_method='b-value pois', seed=None):
+        """
+        a function to calculate Mc and b-value of the events of a region and time range (see EventStore.select()).
+
+        :param mc_method (string): method for estimating Mc. options are 'maxc', 'mbs', and 'gft'.
+        :param cv_method (string): curve fitting method. options are 'b-value pois', 'b-value glin', 'b-value glog',
+        and 'b-value mle'.
+        :param seed (int or None): seed of the bootstrap
+        :return:
+        result (dict): b-value, its uncertainty, Mc and number of events. b-value, uncertainty and Mc are NaN for
+        fewer than min_events events or when they cannot be estimated
+        """
+
+        if self._closed:
+            raise RuntimeError("the service is closed")
+        ind = self.store.select(poly, center, nevents, radius, tmin, tmax)
+        future = asyncio.get_running_loop().create_future()
+        self.stats['requests'] += 1
+        await self._queue.put(((mc_method, cv_method), self.store['M'][ind], np.random.SeedSequence(seed), future))
+        return await future
+
+    async def handle(self, request):
+        """
+        a function to answer a request given as a dictionary, e.g. decoded from JSON:
+        {'op': 'bvalue', 'center': [128, -3], 'nevents': 500, 'mc_method': 'mbs'} or
+        {'op': 'append', 'events': {'X': [...], 'Y': [...], 'M': [...]}}.
+
+        :param request (dict): op and its arguments
+        :return:
+        response (dict): the result with ok True, or ok False and the error message
+        """
+
+        request = dict(request)
+        op = request.pop('op', 'bvalue')
+        try:
+            if op == 'bvalue':
+                result = await self.bvalue(**request)
+            elif op == 'append':
+                result = {'n': self.append(request['events'])}
+            elif op == 'stats':
+                result = dict(self.stats, n=len(self.store))
+            else:
+                raise ValueError("unknown op %r" % op)
+        except Exception as err:
+            return {'ok': False, 'error': '%s: %s' % (type(err).__name__, err)}
+        return dict(result, ok=True)
+
+    async def _run_batcher(self):
+        while True:
+            self._batch = [await self._queue.get()]
+            await asyncio.sleep(self.max_delay)
+            while len(self._batch) < self.max_batch and not self._queue.empty():
+                self._batch.append(self._queue.get_nowait())
+            batch, self._batch = self._batch, []
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        groups = {}
+        for key, *item in batch:
+            groups.setdefault(key, []).append(item)
+        for key, items in groups.items():
+            task = asyncio.create_task(self._run_group(key, items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_group(self, key, items):
+        mags, seeds, futures = zip(*items)
+        ends = np.cumsum([len(elem) for elem in mags])
+        neighbours = [np.arange(end - len(elem), end) for elem, end in zip(mags, ends)]
+        self.stats['batches'] += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                self._pool, bvalue_nodes, np.concatenate(mags), neighbours, list(seeds), key[0], key[1], self.mbin,
+                self.nbsample, self.min_events, True, self.backend)
+        except Exception as err:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(err)
+            return
+        for future, row in zip(futures, result):
+            if not future.done():
+                future.set_result({'bvalue': float(row[0]), 'unc': float(row[1]), 'mc': float(row[2]),
+                                   'nbev': int(row[3])})
+
+
+class LocalClient:
+    """
+    an in-process client of a BvalueService that goes through the same dictionary requests a network front end
+    would, so the service can be tried and tested without any external service.
+    """
+
+    def __init__(self, service):
+        self.service = service
+
+    async def request(self, op, **kwargs):
+        response = await self.service.handle(dict(kwargs, op=op))
+        if not response.pop('ok'):
+            raise RuntimeError(response['error'])
+        return response
+
+    async def bvalue(self, **kwargs):
+        return await self.request('bvalue', **kwargs)
+
+    async def append(self, events):
+        return (await self.request('append', events=events))['n']
+
+    async def stats(self):
+        return await self.request('stats')
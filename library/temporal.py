@@ -0,0 +1,137 @@
+import numpy as np
+from library.mag_of_completeness import FMDSamples, magnitude_values, mc_method_batch, fmd_bvalue_hist, fmd_fit_data
+from library.curve_fitting_method import (generate_autobvalue, generate_autobvalue_batch, stack_fmd, check_cv_method,
+                                          FMD_ERRORS)
+
+
+def window_bounds(n, time=None, nevents=None, duration=None, step=1):
+    """
+    a function to define sliding windows over a time-ordered catalog, either windows of nevents events moved by
+    step events or windows of a fixed duration moved by step time units.
+
+    :param n (int): number of events
+    :param time (array): event times in ascending order. only needed for duration windows
+    :param nevents (int): number of events per window
+    :param duration (float): window length in time units
+    :param step (int or float): window step, in events for nevents windows or in time units for duration windows
+    :return:
+    start (array): index of the first event of each window
+    end (array): index after the last event of each window
+    """
+
+    if nevents is not None:
+        start = np.arange(0, n - nevents + 1, step, dtype=int)
+        end = start + nevents
+    elif duration is not None:
+        t0 = np.arange(time[0], time[-1] - duration + step, step)
+        start = np.searchsorted(time, t0, side='left')
+        end = np.searchsorted(time, t0 + duration, side='left')
+    else:
+        raise ValueError("either nevents or duration has to be given")
+    return start, end
+
+
+def bvalue_time_series(mag, mc_method, cv_method, time=None, nevents=None, duration=None, step=1, mbin=0.1,
+                       min_events=50, block=1024, backend='batch'):
+    """
+    a function to calculate b-value and Mc in sliding windows over a catalog. the histogram of distinct magnitudes
+    is updated incrementally as events enter and leave the window, Mc of a block of windows is estimated at once
+    from these histograms, and the FMDs between Mc and maxmag of the block are fitted together with
+    generate_autobvalue_batch (or one by one with generate_autobvalue, warm-started from the previous window with
+    the numpy backend). 'b-value mle' always reads the histogram between Mc and maxmag with the batch MLE. Mc is
+    taken from each window directly, without bootstrap.
+
+    :param mag (series): a series of earthquake magnitudes, in time order if time is not given
+    :param mc_method (string): method for estimating Mc. options are 'maxc', 'mbs', and 'gft'.
+    :param cv_method (string): curve fitting method. options are 'b-value pois', 'b-value glin', 'b-value glog',
+    and 'b-value mle'.
+    :param time (array): event times. events are sorted by time when given
+    :param nevents (int): number of events per window
+    :param duration (float): window length in time units
+    :param step (int or float): window step, in events for nevents windows or in time units for duration windows
+    :param mbin (float): magnitude bin width
+    :param min_events (int): minimum number of events of a window. smaller windows are given NaN
+    :param block (int): number of windows whose histograms are held in memory at once
+    :param backend (string): 'batch' for generate_autobvalue_batch, or the backend of generate_autobvalue,
+    'numpy' or 'statsmodels'
+    :return:
+    ts_data (dict): time of the last event, b-value, uncertainty, Mc, maxmag and number of events of every window
+    """
+
+    mag = magnitude_values(mag)
+    if time is not None:
+        order = np.argsort(time, kind='stable')
+        mag = mag[order]
+        time = np.asarray(time)[order]
+    else:
+        time = np.arange(len(mag))
+
+    mc_batch = mc_method_batch(mc_method)
+    check_cv_method(cv_method, None if backend == 'batch' else backend)
+
+    start_params = None
+    mle = cv_method == 'b-value mle'
+
+    start, end = window_bounds(len(mag), time, nevents, duration, step)
+    mval, vind = np.unique(mag, return_inverse=True)
+    result = np.full((len(start), 5), np.nan)
+    hist = np.zeros(len(mval), dtype=int)
+    lo = hi = 0
+    for b in range(0, len(start), block):
+        counts = np.zeros((min(block, len(start)-b), len(mval)), dtype=int)
+        for j in range(len(counts)):
+            # events entering and leaving the window
+            np.add.at(hist, vind[hi:end[b+j]], 1)
+            np.subtract.at(hist, vind[lo:start[b+j]], 1)
+            lo, hi = start[b+j], end[b+j]
+            counts[j] = hist
+
+        nbev = counts.sum(axis=1)
+        result[b:b+len(counts), 4] = nbev
+        ok = nbev >= min_events
+        if not ok.any():
+            continue
+        mc = np.full(len(counts), np.nan)
+        mc[ok] = np.round(mc_batch(FMDSamples(mval, counts[ok], mbin)), 1)
+        fmds = []
+        for j in np.flatnonzero(ok & ~np.isnan(mc)):
+            nonzero = np.flatnonzero(counts[j])
+            if len(nonzero) < 2:
+                continue
+            max1, max2 = mval[nonzero[-1]], mval[nonzero[-2]]
+            maxmag = round(max1 + (max1 - max2), 1)
+            x, cum, y = fmd_bvalue_hist(mval, counts[j], mc[j], maxmag, mbin)
+            result[b+j, 2:4] = mc[j], maxmag
+            if mle:
+                # the MLE reads the histogram above Mc directly with every backend
+                sel = (mval >= mc[j]) & (mval <= maxmag)
+                fmds.append((j, mval[sel], counts[j, sel]))
+                continue
+            if backend == 'batch':
+                fmds.append((j, x, y))
+                continue
+            try:
+                cv_data = generate_autobvalue(cv_method, fmd_fit_data(x, y), backend, start_params, mbin=mbin)
+            except FMD_ERRORS:
+                # a window with a degenerate FMD (too few bins to fit) is left empty
+                continue
+            if backend == 'numpy':
+                start_params = cv_data.params
+            result[b+j, :2] = cv_data['bvalue'], cv_data['unc']
+
+        if fmds:
+            ind, x, y = zip(*fmds)
+            cv_data = generate_autobvalue_batch(cv_method, *stack_fmd(list(zip(x, y))), mbin=mbin,
+                                                mc=mc[np.array(ind)] if mle else None)
+            result[b+np.array(ind), 0] = cv_data['bvalue']
+            result[b+np.array(ind), 1] = cv_data['unc']
+
+    ts_data = {
+        'time': time[np.maximum(end - 1, 0)],
+        'bvalue': result[:, 0],
+        'unc': result[:, 1],
+        'mc': result[:, 2],
+        'maxmag': result[:, 3],
+        'nbev': result[:, 4].astype(int)
+    }
+    return ts_data
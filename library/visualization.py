@@ -1,30 +1,123 @@
 import matplotlib.pyplot as plt
-import math
+import numpy as np
 from matplotlib import cm
+from matplotlib.colors import LogNorm
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from library.mag_of_completeness import magnitude_values
 
 
-def plot_eq_distribution(catalog, coor='utm'):
+# keys of the fitted line and its 95% confidence interval, and the line colour and label of every curve fitting
+# method: (x fit, fit, x upper, upper, x lower, lower, log, colour, label). log tells whether the values are
+# frequencies that are plotted as log10(frequency); glog is fitted in log space already.
+BVALUE_CURVES = {
+    'b-value pois': ('x', 'ppois', 'xonhpois', 'nhpoiso', 'xonlpois', 'nlpoiso', True, 'blue', 'Pois'),
+    'b-value glin': ('xo', 'pglin', 'xo', 'nhglin', 'xop', 'nlglinp', True, 'green', 'glin'),
+    'b-value glog': ('xo', 'pglog', 'xo', 'nhglog', 'xo', 'nlglog', False, 'red', 'glog'),
+    'b-value mle': ('x', 'pmle', 'xonhmle', 'nhmleo', 'xonlmle', 'nlmleo', True, 'purple', 'MLE')
+}
+
+
+def bvalue_plot_data(data, cv_method):
+    """
+    a function to compute the arrays plotted by plot_bvalue(): the data and the fitted line and its 95% confidence
+    interval in log10(frequency), converted with vectorized numpy.
+
+    :param data (dict): output of generate_autobvalue()
+    :param cv_method (str): curve fitting method. options are 'b-value pois', 'b-value glin', 'b-value glog', or
+    'b-value mle'
+    :return:
+    plot_data (dict): x and y of the data, fit, upper and lower curves, the line colour and the legend label
+    """
+
+    xfit, fit, xhigh, high, xlow, low, log, color, name = BVALUE_CURVES[cv_method]
+    curve = lambda key: np.log10(np.asarray(data[key], dtype=float)) if log else np.asarray(data[key], dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'x'         : np.asarray(data['xo'], dtype=float),
+            'y'         : np.asarray(data['log_yo'], dtype=float),
+            'x_fit'     : np.asarray(data[xfit], dtype=float),
+            'y_fit'     : curve(fit),
+            'x_high'    : np.asarray(data[xhigh], dtype=float),
+            'y_high'    : curve(high),
+            'x_low'     : np.asarray(data[xlow], dtype=float),
+            'y_low'     : curve(low),
+            'color'     : color,
+            'label'     : f"{name} b = {data['bvalue']} \u00B1 {data['unc']}"
+        }
+
+
+def screen_bins(ax):
+    """
+    a function to get the number of pixels of an axes, to aggregate events at screen resolution.
+
+    :param ax (Axes): axes that will be drawn
+    :return:
+    bins (tuple): number of pixels along x and y
+    """
+
+    bbox = ax.get_window_extent()
+    return max(int(bbox.width), 1), max(int(bbox.height), 1)
+
+
+def scatter_events(ax, catalog, index=None, cmap='Oranges', max_points=None):
+    """
+    a function to scatter epicenters coloured by depth and sized by magnitude. with max_points, only the
+    max_points largest events are drawn, as the small ones are hidden under them anyway.
+
+    :param ax (Axes): axes to draw on
+    :param catalog (dataframe): seismic catalog containing earthquake locations (x,y,z) and magnitudes (m)
+    :param index (array): indices or boolean mask of the events to draw, all events if None
+    :param cmap (str or Colormap): colour map of depth
+    :param max_points (int): maximum number of events to draw, all events if None
+    :return:
+    collection (PathCollection)
+    """
+
+    x, y, z, m = (np.asarray(catalog[col]) for col in ('X', 'Y', 'Z', 'M'))
+    if index is not None:
+        x, y, z, m = x[index], y[index], z[index], m[index]
+    m = magnitude_values(m)
+    if max_points is not None and len(m) > max_points:
+        keep = np.sort(np.argpartition(m, len(m) - max_points)[len(m) - max_points:])
+        x, y, z, m = x[keep], y[keep], z[keep], m[keep]
+    return ax.scatter(x, y, c=z, cmap=cmap, edgecolors='k', s=np.power(m, 3.5), alpha=0.8)
+
+
+def plot_eq_distribution(catalog, coor='utm', max_points=None, density=False, ax=None, show=True):
     """
     plotting earthquake distributions (epicenters)
 
     :param catalog (dataframe): seismic catalog containing earthquake locations (x,y,z) and magnitudes (m)
     :param coor (str): coordinate system, it is only used for labelling x and y axes.
     options are 'lon/lat' or 'utm'.
-    :return: none
+    :param max_points (int): maximum number of events to scatter (see scatter_events()), all events if None
+    :param density (bool): if True, the number of events per pixel is drawn instead of the events, which is
+    independent of the catalog size
+    :param ax (Axes): axes to draw on, a new figure if None
+    :param show (bool): if True, the figure is shown
+    :return: figure and axes
     """
 
-    x = catalog['X']
-    y = catalog['Y']
-    z = catalog['Z']
-    m = catalog['M']
-
-    fig = plt.figure()
-    ax = fig.add_subplot(111)
-    norm = cm.colors.Normalize(vmin=min(z), vmax=max(z))
-    cmap = cm.Oranges
-
-    ax.scatter(x, y, c = z, cmap= cmap, edgecolors = 'k', s=m**3.5, alpha=0.8)
-    fig.colorbar(cm.ScalarMappable(cmap = cmap, norm = norm), ax = ax, label = 'Depth')
+    if ax is None:
+        fig = plt.figure()
+        ax = fig.add_subplot(111)
+    fig = ax.figure
+
+    if density:
+        x = np.asarray(catalog['X'])
+        y = np.asarray(catalog['Y'])
+        counts, xedges, yedges = np.histogram2d(x, y, bins=screen_bins(ax))
+        counts[counts == 0] = np.nan
+        image = ax.imshow(counts.T, origin='lower', extent=(xedges[0], xedges[-1], yedges[0], yedges[-1]),
+                          aspect='auto', cmap=cm.Oranges, norm=LogNorm(), interpolation='nearest')
+        fig.colorbar(image, ax=ax, label='Events per pixel')
+    else:
+        z = np.asarray(catalog['Z'])
+        norm = cm.colors.Normalize(vmin=z.min(), vmax=z.max())
+        cmap = cm.Oranges
+        scatter_events(ax, catalog, cmap=cmap, max_points=max_points)
+        fig.colorbar(cm.ScalarMappable(cmap = cmap, norm = norm), ax = ax, label = 'Depth')
     ax.set_title('Earthquake Distributions')
     if coor == 'lon/lat':
         ax.set_xlabel('Longitude')
@@ -32,79 +125,112 @@ def plot_eq_distribution(catalog, coor='utm'):
     elif coor == 'utm':
         ax.set_xlabel('Easting')
         ax.set_ylabel('Northing')
-    fig.show()
-    
+    if show:
+        fig.show()
+
     return fig, ax
 
 
-def plot_bvalue(data, cv_method):
+def plot_bvalue(data, cv_method, ax=None, show=True):
     """
     plotting log(10)frequency-magnitude distribution with the fitted line and its 95% confidence interval.
     it also tells us the b-value and its uncertainty based on what curve fitting method that we use.
 
     :param data (dict): a dictionary containing log(10)frequency, magnitudes, fitted line and its 95% confidence interval,
      b-value and its uncertainty.
-    :param cv_method (str): curve fitting method. options are 'b-value pois', 'b-value glin', or 'b-value glog'
-    :return: none
+    :param cv_method (str): curve fitting method. options are 'b-value pois', 'b-value glin', 'b-value glog', or
+    'b-value mle'
+    :param ax (Axes): axes to draw on, a new figure if None
+    :param show (bool): if True, the figure is shown
+    :return: axes
     """
 
-    if cv_method == 'b-value pois':
-        plt.figure()
-        plt.scatter(data['xo'],data['log_yo'],color='black', marker = ".",label='data')
-        plt.plot(data['x'],[math.log10(elem) for elem in data['ppois']], color='blue', label=f"Pois b = {data['bvalue']} \u00B1 {data['unc']}", linewidth = 0.7)
-        plt.plot(data['xonhpois'],[math.log10(elem) for elem in data['nhpoiso']], linestyle='--', color='blue', label='95% CI', linewidth = 0.7)
-        plt.plot(data['xonlpois'],[math.log10(elem) for elem in data['nlpoiso']],linestyle='--', color='blue', linewidth = 0.7)
-        plt.xlabel("Magnitude (Mw)")
-        plt.ylabel("log10(Frequency)")
-        plt.legend()
-        plt.grid(axis='x')
-        plt.ylim(-0.1)
-
-    elif cv_method == 'b-value glin':
-        plt.figure()
-        plt.scatter(data['xo'],data['log_yo'],color='black',marker='.', label='data')
-        plt.plot(data['xo'],[math.log10(elem) for elem in data['pglin']],color='green',lw = 0.7,label=f"glin b = {data['bvalue']} \u00B1 {data['unc']}")
-        plt.plot(data['xo'],[math.log10(elem) for elem in data['nhglin']],linestyle='--',lw = 0.7, color='green', label='95% CI')
-        plt.plot(data['xop'],[math.log10(elem) for elem in data['nlglinp']],linestyle='--', color='green',lw = 0.7)
-        plt.xlabel("Magnitude (Mw)")
-        plt.ylabel("log10(Frequency)")
-        plt.legend()
-        plt.grid(axis='x')
-        plt.ylim(-0.1)
-
-    elif cv_method == 'b-value glog':
+    if cv_method not in BVALUE_CURVES:
+        if show:
+            plt.show()
+        return ax
+
+    plot_data = bvalue_plot_data(data, cv_method)
+    color = plot_data['color']
+    if ax is None:
         plt.figure()
-        plt.scatter(data['xo'],data['log_yo'],color='black',label='data', marker='.')
-        plt.plot(data['xo'],data['pglog'],color='red',label=f"glog b = {data['bvalue']} \u00B1 {data['unc']}",lw = 0.7)
-        plt.plot(data['xo'],data['nhglog'],linestyle='--', color='red', label='95% CI',lw = 0.7)
-        plt.plot(data['xo'],data['nlglog'],linestyle='--', color='red',lw = 0.7)
-        plt.xlabel("Magnitude (Mw)")
-        plt.ylabel("log10(Frequency)")
-        plt.legend()
-        plt.grid(axis='x')
-        plt.ylim(-0.1)
-
-    plt.show()
-
-def plot_noncum_fmd(data):
+        ax = plt.gca()
+    ax.scatter(plot_data['x'], plot_data['y'], color='black', marker = ".", label='data')
+    ax.plot(plot_data['x_fit'], plot_data['y_fit'], color=color, label=plot_data['label'], linewidth = 0.7)
+    ax.plot(plot_data['x_high'], plot_data['y_high'], linestyle='--', color=color, label='95% CI', linewidth = 0.7)
+    ax.plot(plot_data['x_low'], plot_data['y_low'], linestyle='--', color=color, linewidth = 0.7)
+    ax.set_xlabel("Magnitude (Mw)")
+    ax.set_ylabel("log10(Frequency)")
+    ax.legend()
+    ax.grid(axis='x')
+    ax.set_ylim(-0.1)
+
+    if show:
+        plt.show()
+    return ax
+
+def plot_noncum_fmd(data, ax=None, show=True):
     """
     plotting noncumulative frequency-magnitude distribution, mean of Mc bootstrap, std of Mc bootstrap, fixed Mc,
     and maximum magnitude that is used for estimating b-value
 
     :param data (dict): a dictionary containing mean of Mc bootstrap, std of Mc bootstrap, fixed Mc, and maximum magnitude
-    :return: none
+    :param ax (Axes): axes to draw on, a new figure if None
+    :param show (bool): if True, the figure is shown
+    :return: axes
+    """
+
+    if ax is None:
+        plt.figure()
+        ax = plt.gca()
+    ax.scatter(data['m'], data['noncum'], marker = ".", color = "k", label = "noncumulative FMD")
+    ax.axvline(data['mc_mean'], linestyle = "solid", color = "green", linewidth = 0.7, label = "Mc mean")
+    ax.axvline(data['mc_sdl'], linestyle = "dashed", color = "green", linewidth = 0.7, label = "sd Mc")
+    ax.axvline(data['mc_sdr'], linestyle = "dashed", color = "green", linewidth = 0.7)
+    ax.axvline(data['mc'], linestyle = "solid", color = "blue", linewidth = 0.7, label = "Mc ")
+    ax.axvline(data['maxmag'], linestyle = "solid", color = "red", linewidth = 0.7, label = "Max magnitude")
+    ax.set_title("Frequency-Magnitude Distribution")
+    ax.set_xlabel("Magnitude (Mw)")
+    ax.set_ylabel("Frequency")
+    ax.legend()
+    ax.grid()
+    if show:
+        plt.show()
+    return ax
+
+
+def export_figure(file_name, fmd_data=None, cv_data=None, cv_method=None, catalog=None, coor='utm',
+                  max_points=None, dpi=100, panel_size=(6.4, 4.8)):
+    """
+    a function to render the epicenters, noncumulative FMD and b-value panels of a region off-screen and save them
+    as one image. the figure is drawn with the Agg canvas directly, without pyplot, so it is neither shown nor kept
+    alive by pyplot, and figures of thousands of regions can be exported in a loop on any backend. the epicenters
+    are drawn as the number of events per pixel unless max_points is given (see plot_eq_distribution()).
+
+    :param file_name (str): output file, its extension sets the format (e.g. png, pdf, svg)
+    :param fmd_data (dict): output of fmd_details(), no FMD panel if None
+    :param cv_data (dict): output of generate_autobvalue(), no b-value panel if None
+    :param cv_method (str): curve fitting method of cv_data
+    :param catalog (dataframe): events of the region, no epicenter panel if None
+    :param coor (str): coordinate system of the catalog, 'lon/lat' or 'utm'
+    :param max_points (int): maximum number of events to scatter instead of drawing the event density
+    :param dpi (int): resolution of the image
+    :param panel_size (tuple): width and height of one panel in inches
+    :return:
+    file_name (str)
     """
 
-    plt.figure()
-    plt.scatter(data['m'], data['noncum'], marker = ".", color = "k", label = "noncumulative FMD")
-    plt.axvline(data['mc_mean'], linestyle = "solid", color = "green", linewidth = 0.7, label = "Mc mean")
-    plt.axvline(data['mc_sdl'], linestyle = "dashed", color = "green", linewidth = 0.7, label = "sd Mc")
-    plt.axvline(data['mc_sdr'], linestyle = "dashed", color = "green", linewidth = 0.7)
-    plt.axvline(data['mc'], linestyle = "solid", color = "blue", linewidth = 0.7, label = "Mc ")
-    plt.axvline(data['maxmag'], linestyle = "solid", color = "red", linewidth = 0.7, label = "Max magnitude")
-    plt.title("Frequency-Magnitude Distribution")
-    plt.xlabel("Magnitude (Mw)")
-    plt.ylabel("Frequency")
-    plt.legend()
-    plt.grid()
-    plt.show()
+    panels = [panel for panel, data in (('catalog', catalog), ('fmd', fmd_data), ('bvalue', cv_data))
+              if data is not None]
+    fig = Figure(figsize=(panel_size[0]*len(panels), panel_size[1]), dpi=dpi, layout='tight')
+    FigureCanvasAgg(fig)
+    axes = np.atleast_1d(fig.subplots(1, len(panels)))
+    for ax, panel in zip(axes, panels):
+        if panel == 'catalog':
+            plot_eq_distribution(catalog, coor, max_points=max_points, density=max_points is None, ax=ax, show=False)
+        elif panel == 'fmd':
+            plot_noncum_fmd(fmd_data, ax=ax, show=False)
+        else:
+            plot_bvalue(cv_data, cv_method, ax=ax, show=False)
+    fig.savefig(file_name, dpi=dpi)
+    return file_name
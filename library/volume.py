@@ -0,0 +1,297 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from library.mapping import grid_axis, build_index, node_neighbours, bvalue_nodes, bvalue_nodes_shared
+from library.cache import result_key
+from library.parallel import share_array, release
+
+
+def grid_nodes_3d(xlim, ylim, zlim, dx, dy=None, dz=None):
+    """
+    a function to create a regular 3-D grid of nodes.
+
+    :param xlim (tuple): minimum and maximum x
+    :param ylim (tuple): minimum and maximum y
+    :param zlim (tuple): minimum and maximum depth
+    :param dx (float): node spacing along x
+    :param dy (float): node spacing along y. if None, dx is used
+    :param dz (float): node spacing along depth. if None, dx is used
+    :return:
+    nodes (array): node coordinates, one row (x, y, z) per node, with x running fastest and z slowest
+    shape (tuple): number of nodes along z, y and x, to reshape the volume outputs
+    """
+
+    dy = dx if dy is None else dy
+    dz = dx if dz is None else dz
+    gx = grid_axis(xlim[0], xlim[1], dx)
+    gy = grid_axis(ylim[0], ylim[1], dy)
+    gz = grid_axis(zlim[0], zlim[1], dz)
+    zz, yy, xx = np.meshgrid(gz, gy, gx, indexing='ij')
+    return np.column_stack([xx.ravel(), yy.ravel(), zz.ravel()]), xx.shape
+
+
+def profile_nodes(start, end, zlim, ds, dz=None):
+    """
+    a function to create the nodes of a vertical cross-section below a straight profile.
+
+    :param start (tuple): x and y of the start of the profile
+    :param end (tuple): x and y of the end of the profile
+    :param zlim (tuple): minimum and maximum depth
+    :param ds (float): node spacing along the profile
+    :param dz (float): node spacing along depth. if None, ds is used
+    :return:
+    nodes (array): node coordinates, one row (x, y, z) per node, with the distance along the profile running
+    fastest
+    shape (tuple): number of nodes along depth and along the profile, to reshape the section outputs
+    dist (array): distance of every node along the profile from its start
+    normal (array): horizontal unit vector perpendicular to the profile
+    """
+
+    dz = ds if dz is None else dz
+    start = np.asarray(start, dtype=float)
+    direction = np.asarray(end, dtype=float) - start
+    length = np.hypot(*direction)
+    direction = direction/length
+    gs = grid_axis(0, length, ds)
+    gz = grid_axis(zlim[0], zlim[1], dz)
+    zz, ss = np.meshgrid(gz, gs, indexing='ij')
+    xy = start + ss.ravel()[:, None]*direction
+    nodes = np.column_stack([xy, zz.ravel()])
+    return nodes, ss.shape, ss.ravel(), np.array([-direction[1], direction[0], 0.])
+
+
+def volume_neighbours(tree, nodes, nevents=None, radius=None, length=None, axis=(0, 0, 1), n_jobs=1):
+    """
+    a function to find the events sampled by each node of a volume, in a sphere or a cylinder around the node.
+    with length None the sampling volume is a sphere, as in node_neighbours(). otherwise it is a cylinder of the
+    given radius and length centred on the node, with its axis along axis: vertical by default, or perpendicular
+    to a cross-section so that the cylinder spans the width of the section. the candidates of a cylinder are the
+    events in the sphere around it, and with nevents the nearest nevents of them to the axis are kept.
+
+    :param tree (cKDTree): KD-tree over the event locations (x, y, z) (see build_index())
+    :param nodes (array): node coordinates, one row (x, y, z) per node
+    :param nevents (int): number of nearest events
+    :param radius (float): sampling radius
+    :param length (float): length of the cylinder, None for a sphere
+    :param axis (array): direction of the axis of the cylinder
+    :param n_jobs (int): number of threads used by the KD-tree query. -1 uses all cores
+    :return:
+    neighbours (list): event indices of each node, nearest first for nevents
+    """
+
+    if length is None:
+        return node_neighbours(tree, nodes, nevents, radius, n_jobs)
+    if radius is None:
+        raise ValueError("a cylinder needs a radius")
+    axis = np.asarray(axis, dtype=float)
+    axis = axis/np.linalg.norm(axis)
+    neighbours = []
+    for node, cand in zip(nodes, tree.query_ball_point(nodes, np.hypot(radius, length/2), workers=n_jobs)):
+        cand = np.sort(np.asarray(cand, dtype=int))
+        d = tree.data[cand] - node
+        along = d @ axis
+        across = np.sqrt(np.maximum((d**2).sum(axis=1) - along**2, 0))
+        inside = (np.abs(along) <= length/2) & (across <= radius)
+        ind = cand[inside]
+        if nevents is not None:
+            ind = ind[np.argsort(across[inside], kind='stable')[:nevents]]
+        neighbours.append(ind)
+    return neighbours
+
+
+def to_csr(neighbours):
+    """
+    a function to pack neighbour lists into compressed sparse row form.
+
+    :param neighbours (list): event indices of each node
+    :return:
+    indptr (array): start of the events of every node in indices, and the end of the last one
+    indices (array): event indices of all nodes, one after the other
+    """
+
+    indptr = np.zeros(len(neighbours) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(elem) for elem in neighbours])
+    indices = np.concatenate(neighbours).astype(np.int64) if neighbours else np.zeros(0, dtype=np.int64)
+    return indptr, indices
+
+
+def from_csr(indptr, indices):
+    """
+    a function to unpack neighbour lists from compressed sparse row form (see to_csr()).
+
+    :param indptr (array): start of the events of every node in indices, and the end of the last one
+    :param indices (array): event indices of all nodes
+    :return:
+    neighbours (list): event indices of each node, as views of indices
+    """
+
+    return [indices[indptr[i]:indptr[i+1]] for i in range(len(indptr) - 1)]
+
+
+def cached_neighbours(tree, nodes, cache, key, **sampling):
+    """
+    a function to get the neighbour lists of a chunk of nodes through a ResultCache. the lists are stored in
+    compressed sparse row form, so runs with other Mc or curve fitting methods, seeds or bootstrap sizes on the
+    same nodes skip the KD-tree queries.
+
+    :param tree (cKDTree): KD-tree over the event locations
+    :param nodes (array): node coordinates of the chunk
+    :param cache (ResultCache or None): neighbour cache, no caching if None
+    :param key (str): digest of the event locations
+    :param sampling: nevents, radius, length and axis (see volume_neighbours())
+    :return:
+    neighbours (list): event indices of each node
+    """
+
+    if cache is None:
+        return volume_neighbours(tree, nodes, **sampling)
+    name = result_key(nodes, locations=key, **sampling)
+    csr = cache.get(name)
+    if csr is None:
+        csr = to_csr(volume_neighbours(tree, nodes, **sampling))
+        cache.put(name, csr)
+    return from_csr(*csr)
+
+
+def node_seeds(seed, start, stop):
+    """
+    a function to get the bootstrap seeds of nodes start to stop, the same as seed.spawn(n)[start:stop] without
+    making the seeds of all nodes at once.
+
+    :param seed (SeedSequence): seed of the volume
+    :param start (int): first node
+    :param stop (int): last node (exclusive)
+    :return:
+    seeds (list): SeedSequence of every node
+    """
+
+    return [np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (i,), pool_size=seed.pool_size)
+            for i in range(start, stop)]
+
+
+def bvalue_volume(catalog, nodes, mc_method, cv_method, nevents=None, radius=None, length=None, axis=(0, 0, 1),
+                  mbin=0.1, nbsample=200, min_events=50, rng=None, tree=None, cols=('X', 'Y', 'Z'), batched=True,
+                  backend='batch', n_jobs=None, executor=None, chunk=256, out=None, cache=None, mask=None):
+    """
+    a function to calculate b-value on the nodes of a volume (see grid_nodes_3d() and profile_nodes()). every node
+    samples a sphere or cylinder around it (see volume_neighbours()) from one KD-tree over the event locations, and
+    runs fmd_details and generate_autobvalue on the sampled events as in bvalue_map(). the location columns have to
+    be in the same unit, e.g. UTM km and depth in km. nodes are processed in chunks on a pool of worker processes,
+    with at most two chunks per worker in flight, and the result of every chunk is written to out as soon as it
+    is done, so a memory-mapped out keeps millions of nodes off the heap.
+
+    :param catalog (dataframe): seismic catalog containing earthquake locations (x,y,z) and magnitudes (m)
+    :param nodes (array): node coordinates, one row (x, y, z) per node
+    :param mc_method (string): method for estimating Mc. options are 'maxc', 'mbs', and 'gft'.
+    :param cv_method (string): curve fitting method. options are 'b-value pois', 'b-value glin', 'b-value glog',
+    and 'b-value mle'.
+    :param nevents (int): number of nearest events of each node
+    :param radius (float): sampling radius of each node
+    :param length (float): length of the sampling cylinder, None for spheres
+    :param axis (array): direction of the axis of the sampling cylinder
+    :param mbin (float): magnitude bin width
+    :param nbsample (int): number of bootstrap sample
+    :param min_events (int): minimum number of events of a node
+    :param rng (SeedSequence, int or None): seed of the bootstrap. every node gets its own spawned stream, the same
+    as in bvalue_map()
+    :param tree (cKDTree): KD-tree over the event locations. if None, it is built from cols
+    :param cols (tuple): location columns used for the neighbour search
+    :param batched (bool): if True, the bootstrap of each node is done with mc_bootstrap()
+    :param backend (string): 'batch', 'numpy' or 'statsmodels' (see bvalue_nodes())
+    :param n_jobs (int): number of worker processes. 1 runs in this process, None uses all cores
+    :param executor (Executor): a concurrent.futures executor to run the chunks on. it is not shut down here
+    :param chunk (int): number of nodes per task
+    :param out (str or array): .npy file to write the results to as a memory-mapped array, or an array of shape
+    (len(nodes), 4). if None, an array is made in memory
+    :param cache (ResultCache): cache of the neighbour lists of every chunk (see cached_neighbours())
+    :param mask (array): if given, only events where mask is True are sampled (see bvalue_map())
+    :return:
+    volume_data (dict): b-value, uncertainty, Mc and number of events of every node, as columns of out
+    """
+
+    if mask is not None:
+        catalog = {col: np.asarray(catalog[col])[mask] for col in list(cols) + ['M']}
+    tree = build_index(catalog, cols) if tree is None else tree
+    mag = np.asarray(catalog['M'])
+    seed = rng if isinstance(rng, np.random.SeedSequence) else np.random.SeedSequence(rng)
+    args = (mc_method, cv_method, mbin, nbsample, min_events, batched, backend)
+    sampling = {'nevents': nevents, 'radius': radius, 'length': length,
+                'axis': None if length is None else tuple(float(elem) for elem in axis)}
+    key = result_key(tree.data, n=tree.n) if cache is not None else None
+    neighbours = lambda i: cached_neighbours(tree, nodes[i:i+chunk], cache, key, **sampling)
+
+    if isinstance(out, str):
+        out = np.lib.format.open_memmap(out, mode='w+', dtype=float, shape=(len(nodes), 4))
+    elif out is None:
+        out = np.empty((len(nodes), 4))
+    blocks = iter(range(0, len(nodes), chunk))
+
+    if n_jobs == 1 and executor is None:
+        for i in blocks:
+            out[i:i+chunk] = bvalue_nodes(mag, neighbours(i), node_seeds(seed, i, min(i+chunk, len(nodes))), *args)
+    else:
+        shm, spec = share_array(mag)
+        pool = executor if executor is not None else ProcessPoolExecutor(n_jobs)
+        try:
+            pending = {}
+            nmax = 2*getattr(pool, '_max_workers', os.cpu_count() or 1)
+            for i in blocks:
+                seeds = node_seeds(seed, i, min(i+chunk, len(nodes)))
+                pending[pool.submit(bvalue_nodes_shared, spec, neighbours(i), seeds, *args)] = i
+                while len(pending) >= nmax or (i + chunk >= len(nodes) and pending):
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        j = pending.pop(future)
+                        out[j:j+chunk] = future.result()
+        finally:
+            if executor is None:
+                pool.shutdown()
+            release(shm, unlink=True)
+
+    if isinstance(out, np.memmap):
+        out.flush()
+    volume_data = {
+        'bvalue': out[:, 0],
+        'unc': out[:, 1],
+        'mc': out[:, 2],
+        'nbev': out[:, 3].astype(int)
+    }
+    return volume_data
+
+
+def bvalue_profile(catalog, start, end, zlim, ds, mc_method, cv_method, width, dz=None, nevents=None, radius=None,
+                   sampling='cylinder', **kwargs):
+    """
+    a function to calculate b-value on a vertical cross-section below a straight profile. with sampling
+    'cylinder', every node samples a cylinder of the given radius perpendicular to the section and spanning its
+    width, i.e. the events within width/2 of the section seen as a circle in the section plane. with 'sphere' it
+    samples a sphere of radius or the nevents nearest events.
+
+    :param catalog (dataframe): seismic catalog containing earthquake locations (x,y,z) and magnitudes (m)
+    :param start (tuple): x and y of the start of the profile
+    :param end (tuple): x and y of the end of the profile
+    :param zlim (tuple): minimum and maximum depth
+    :param ds (float): node spacing along the profile
+    :param mc_method (string): method for estimating Mc. options are 'maxc', 'mbs', and 'gft'.
+    :param cv_method (string): curve fitting method. options are 'b-value pois', 'b-value glin', 'b-value glog',
+    and 'b-value mle'.
+    :param width (float): width of the section, for cylinder sampling
+    :param dz (float): node spacing along depth. if None, ds is used
+    :param nevents (int): number of nearest events of each node
+    :param radius (float): sampling radius of each node
+    :param sampling (str): 'cylinder' or 'sphere'
+    :param kwargs: other options of bvalue_volume()
+    :return:
+    section_data (dict): b-value, uncertainty, Mc and number of events of every node (see bvalue_volume()), with
+    the distance along the profile (dist) and depth (depth) of the nodes and the shape of the section
+    """
+
+    nodes, shape, dist, normal = profile_nodes(start, end, zlim, ds, dz)
+    if sampling == 'cylinder':
+        section_data = bvalue_volume(catalog, nodes, mc_method, cv_method, nevents, radius, width, normal, **kwargs)
+    elif sampling == 'sphere':
+        section_data = bvalue_volume(catalog, nodes, mc_method, cv_method, nevents, radius, **kwargs)
+    else:
+        raise ValueError("unknown sampling %r, options are 'cylinder' and 'sphere'" % sampling)
+    section_data.update(dist=dist, depth=nodes[:, 2], shape=shape)
+    return section_data
@@ -1,11 +1,14 @@
-from library.curve_fitting_method import *
-from library.visualization import *
-from library.mag_of_completeness import *
-from matplotlib import path
+import numpy as np
+import matplotlib.pyplot as plt
+from library.curve_fitting_method import generate_autobvalue
+from library.visualization import plot_eq_distribution, plot_noncum_fmd, plot_bvalue, scatter_events
+from library.mag_of_completeness import fmd_details
+from library.catalog import load_catalog
+from library.selection import select_region
 
 # reading catalog file
 file_name = 'catalogs/earthquakes.csv'
-catalog = pd.read_csv(file_name)
+catalog = load_catalog(file_name)
 
 # b-value parameters
 mc_method    = 'maxc'
@@ -19,18 +22,14 @@ poly = plt.ginput(8)
 poly = np.array(poly)
 
 # searching events that are included in the polygon
-p = path.Path(poly)
-p_index = list(np.where(p.contains_points(np.transpose(np.array([catalog['X'], catalog['Y']]))) == 1)[0])
+p_index = select_region(catalog, poly)
 
-# extracting event coordinates and magnitudes that are included in polygon
+# extracting magnitudes that are included in polygon
 mag         = catalog['M'][p_index]
-x_poly      = catalog['X'][p_index]
-y_poly      = catalog['Y'][p_index]
-z_poly      = catalog['Z'][p_index]
 
 # plotting events that are included in polygon
-ax = plt.subplot(111)
-ax.scatter(x_poly, y_poly, c=z_poly, cmap='Greens', edgecolors='k', s=mag**3.5, alpha=0.8)
+ax = plt.gca()
+scatter_events(ax, catalog, p_index, cmap='Greens')
 
 # calculating Mc & maxmag
 fmd_data        = fmd_details(mag, mc_method)